@@ -29,7 +29,10 @@ locals {
     local.lambda_alb_host # lambda mode uses ALB
   )
 
-  ext_authz_port = local.use_in_cluster ? 9191 : 80
+  ext_authz_port = local.use_in_cluster ? (local.use_grpc ? 9192 : 9191) : 80
+
+  # gRPC ext_authz only for the in-cluster pod
+  use_grpc = local.use_in_cluster && var.authorizer_protocol == "grpc"
 }
 
 resource "kubernetes_config_map_v1_data" "istio_mesh_config" {
@@ -39,7 +42,18 @@ resource "kubernetes_config_map_v1_data" "istio_mesh_config" {
   }
 
   data = {
-    mesh = local.use_in_cluster ? (
+    mesh = local.use_grpc ? (
+      # in-cluster mode config, gRPC ext_authz v3 - attributes travel in the
+      # CheckRequest, so no x-original-* headers are needed
+      <<-EOF
+      extensionProviders:
+      - name: avp-ext-authz
+        envoyExtAuthzGrpc:
+          service: avp-ext-authz.${var.kubernetes_namespace}.svc.cluster.local
+          port: 9192
+          timeout: ${var.ext_authz_timeout_ms}ms
+      EOF
+      ) : local.use_in_cluster ? (
       # in-cluster mode config - direct pod service
       <<-EOF
       extensionProviders:
@@ -47,6 +61,7 @@ resource "kubernetes_config_map_v1_data" "istio_mesh_config" {
         envoyExtAuthzHttp:
           service: avp-ext-authz.${var.kubernetes_namespace}.svc.cluster.local
           port: 9191
+          timeout: ${var.ext_authz_timeout_ms}ms
           includeRequestHeadersInCheck:
           - authorization
           - x-forwarded-for
@@ -38,6 +38,52 @@ resource "kubernetes_service_account_v1" "avp_ext_authz" {
   }
 }
 
+# ============================================================================
+# ConfigMap - Cedar policies for the local policy engine
+# ============================================================================
+# Mounted into the pod; the authorizer hot-reloads it when POLICY_ENGINE is
+# "local" or "shadow" (kubelet propagates ConfigMap updates to the volume).
+# routes.json (var.route_table_file) is read for the route table when the
+# authorizer starts; the permit index (var.permit_index) also hot-reloads it.
+
+resource "kubernetes_config_map_v1" "avp_ext_authz_policies" {
+  count = var.authorizer_mode == "in-cluster" ? 1 : 0
+
+  metadata {
+    name      = "avp-ext-authz-policies"
+    namespace = var.kubernetes_namespace
+    labels = {
+      app = "avp-ext-authz"
+    }
+  }
+
+  data = merge(
+    { for f in fileset("${path.module}/policies", "*.cedar") : f => file("${path.module}/policies/${f}") },
+    { "schema.json" = file("${path.module}/schema.json") },
+    var.route_table_file != "" ? { "routes.json" = file(var.route_table_file) } : {}
+  )
+}
+
+# ============================================================================
+# Secret - HS256 signing secret for JWT verification
+# ============================================================================
+
+resource "kubernetes_secret_v1" "avp_ext_authz_jwt" {
+  count = var.authorizer_mode == "in-cluster" ? 1 : 0
+
+  metadata {
+    name      = "avp-ext-authz-jwt"
+    namespace = var.kubernetes_namespace
+    labels = {
+      app = "avp-ext-authz"
+    }
+  }
+
+  data = {
+    hmac-secret = var.jwt_hmac_secret
+  }
+}
+
 # ============================================================================
 # Deployment - AVP Authorizer Pod
 # ============================================================================
@@ -71,6 +117,9 @@ resource "kubernetes_deployment_v1" "avp_ext_authz" {
         }
         annotations = {
           "sidecar.istio.io/inject" = "false"
+          "prometheus.io/scrape"    = "true"
+          "prometheus.io/port"      = "9191"
+          "prometheus.io/path"      = "/metrics"
         }
       }
 
@@ -88,6 +137,12 @@ resource "kubernetes_deployment_v1" "avp_ext_authz" {
             protocol       = "TCP"
           }
 
+          port {
+            name           = "grpc"
+            container_port = 9192
+            protocol       = "TCP"
+          }
+
           env {
             name  = "POLICY_STORE_ID"
             value = aws_verifiedpermissions_policy_store.main.id
@@ -103,19 +158,146 @@ resource "kubernetes_deployment_v1" "avp_ext_authz" {
             value = "9191"
           }
 
+          env {
+            name  = "GRPC_PORT"
+            value = var.authorizer_protocol == "grpc" ? "9192" : "0"
+          }
+
+          env {
+            name  = "SERVER_PROCESSES"
+            value = tostring(var.authorizer_processes)
+          }
+
+          env {
+            name  = "SERVER_WORKERS"
+            value = tostring(var.authorizer_workers)
+          }
+
+          env {
+            name  = "AVP_BATCH_WINDOW_MS"
+            value = tostring(var.avp_batch_window_ms)
+          }
+
+          env {
+            name  = "AVP_DEADLINE_MS"
+            value = tostring(var.ext_authz_timeout_ms)
+          }
+
+          env {
+            name  = "AVP_HEDGE"
+            value = tostring(var.avp_hedge)
+          }
+
           env {
             name  = "LOG_LEVEL"
             value = var.log_level
           }
 
+          env {
+            name  = "LOG_FORMAT"
+            value = var.log_format
+          }
+
+          env {
+            name  = "LOG_ALLOW_SAMPLE_RATE"
+            value = tostring(var.log_allow_sample_rate)
+          }
+
+          env {
+            name  = "POLICY_ENGINE"
+            value = var.policy_engine
+          }
+
+          env {
+            name  = "LOCAL_POLICY_DIRS"
+            value = "/etc/avp/policies"
+          }
+
+          env {
+            name  = "LOCAL_SCHEMA_FILE"
+            value = "/etc/avp/policies/schema.json"
+          }
+
+          env {
+            name  = "ROUTE_TABLE_FILE"
+            value = var.route_table_file != "" ? "/etc/avp/policies/routes.json" : ""
+          }
+
+          env {
+            name  = "PERMIT_INDEX_FILE"
+            value = var.route_table_file != "" && var.permit_index ? "/etc/avp/policies/routes.json" : ""
+          }
+
+          env {
+            name  = "JWT_VERIFY"
+            value = tostring(var.jwt_verify)
+          }
+
+          env {
+            name = "JWT_HMAC_SECRET"
+            value_from {
+              secret_key_ref {
+                name = kubernetes_secret_v1.avp_ext_authz_jwt[0].metadata[0].name
+                key  = "hmac-secret"
+              }
+            }
+          }
+
+          env {
+            name  = "JWT_JWKS_URL"
+            value = var.jwt_jwks_url
+          }
+
+          env {
+            name  = "JWT_ALLOWED_ISSUERS"
+            value = join(",", var.jwt_allowed_issuers)
+          }
+
+          env {
+            name  = "JWT_ALLOWED_AUDIENCES"
+            value = join(",", var.jwt_allowed_audiences)
+          }
+
+          env {
+            name  = "DECISION_CACHE_SIZE"
+            value = tostring(var.decision_cache_size)
+          }
+
+          env {
+            name  = "DECISION_CACHE_TTL"
+            value = tostring(var.decision_cache_ttl)
+          }
+
+          env {
+            name  = "DECISION_CACHE_MAX_STALE"
+            value = tostring(var.decision_cache_max_stale)
+          }
+
+          env {
+            name  = "CIRCUIT_FAILURE_THRESHOLD"
+            value = tostring(var.circuit_failure_threshold)
+          }
+
+          env {
+            name  = "CIRCUIT_RESET_SECONDS"
+            value = tostring(var.circuit_reset_seconds)
+          }
+
+          volume_mount {
+            name       = "policies"
+            mount_path = "/etc/avp/policies"
+            read_only  = true
+          }
+
           resources {
             requests = {
               cpu    = "100m"
               memory = "128Mi"
             }
+            # One core and 256Mi per pre-fork process (shared pages are counted once)
             limits = {
-              cpu    = "500m"
-              memory = "256Mi"
+              cpu    = var.authorizer_processes > 1 ? tostring(var.authorizer_processes) : "500m"
+              memory = "${256 * var.authorizer_processes}Mi"
             }
           }
 
@@ -147,6 +329,13 @@ resource "kubernetes_deployment_v1" "avp_ext_authz" {
           }
         }
 
+        volume {
+          name = "policies"
+          config_map {
+            name = kubernetes_config_map_v1.avp_ext_authz_policies[0].metadata[0].name
+          }
+        }
+
         affinity {
           pod_anti_affinity {
             preferred_during_scheduling_ignored_during_execution {
@@ -192,6 +381,14 @@ resource "kubernetes_service_v1" "avp_ext_authz" {
       protocol    = "TCP"
     }
 
+    port {
+      name         = "grpc"
+      port         = 9192
+      target_port  = 9192
+      protocol     = "TCP"
+      app_protocol = "grpc"
+    }
+
     selector = {
       app = "avp-ext-authz"
     }
@@ -0,0 +1,308 @@
+"""
+The ext-authz check shared by server.py (HTTP and gRPC) and lambda_handler.py.
+
+Checker.check() runs one check from the Authorization header to the
+decision: token cache and JWT verification, route table, permit index,
+decision cache, the single-flight policy engine call and the stale fallback
+when the engine fails. Each entry point builds one Checker from its own
+configuration and components and keeps only its transport around it
+(request parsing, decision log, responses).
+
+Decisions of the local engine (POLICY_ENGINE=local) are cached under its
+policy key as well (LocalPolicyEngine.cache_key()): the snapshot version and
+whatever its policies read besides groups, method and route, such as the
+`custom:groups` claim.
+"""
+
+import base64
+import json
+import logging
+import time
+
+from decision_cache import decision_key
+from decision_log import CHECK_LOGGER
+from entity_builder import CheckRequest
+from token_cache import parse_token
+
+logger = logging.getLogger(__name__)
+check_logger = logging.getLogger(CHECK_LOGGER)
+
+
+def decode_jwt_payload(token: str) -> dict:
+    """Decode JWT payload without verification (for extracting claims)."""
+    try:
+        parts = token.split(".")
+        if len(parts) != 3:
+            return {}
+
+        payload = parts[1]
+        # Add padding if needed
+        padding = 4 - len(payload) % 4
+        if padding != 4:
+            payload += "=" * padding
+
+        decoded = base64.urlsafe_b64decode(payload)
+        return json.loads(decoded)
+    except Exception as e:
+        logger.error(f"Failed to decode JWT: {e}")
+        return {}
+
+
+def engine_context(claims: dict) -> dict:
+    """Context given to the local engine: the token claims (`context.token[...]`)."""
+    return {"token": claims}
+
+
+class Checker:
+    """
+    One configured check path; check() is thread-safe.
+
+    authorize(request, context, deadline) answers an IsAuthorized request
+    with (response, engine name). in_flight (a SingleFlight) coalesces
+    identical concurrent engine calls; Lambda, one invocation at a time per
+    instance, has none. local_engine is given only when it decides
+    the checks (its policy key joins the decision key); validation_error()
+    returns the AVP ValidationException class, or () while there is no
+    client. With reload_inline the permit index is reloaded from the check
+    (Lambda, where no background thread runs between invocations).
+    record_claims names token claims copied into the check record ("claims"),
+    e.g. the groups claim the policies read, for the traffic capture. leeway
+    is the clock skew (seconds) tolerated past a token's exp.
+    """
+
+    def __init__(self, authorize, policy_store_id: str, token_cache, entity_builder, decision_cache,
+                 metrics, in_flight=None, jwt_verifier=None, route_index=None, route_reject_unmatched: bool = True,
+                 permit_index=None, local_engine=None, validation_error=lambda: (),
+                 failure_status: int = 500, reload_inline: bool = False, record_claims=(), leeway: int = 0):
+        self.authorize = authorize
+        self.policy_store_id = policy_store_id
+        self.token_cache = token_cache
+        self.entity_builder = entity_builder
+        self.decision_cache = decision_cache
+        self.in_flight = in_flight
+        self.metrics = metrics
+        self.jwt_verifier = jwt_verifier
+        self.route_index = route_index
+        self.route_reject_unmatched = route_reject_unmatched
+        self.permit_index = permit_index
+        self.local_engine = local_engine
+        self.validation_error = validation_error
+        self.failure_status = failure_status
+        self.reload_inline = reload_inline
+        self.record_claims = tuple(record_claims)
+        self.leeway = leeway
+        self._jwt_error = ()
+        if jwt_verifier is not None:
+            from jwt_verify import JwtError
+            self._jwt_error = JwtError
+
+    def cache_key(self, groups: tuple, method: str, resource_path: str, context: dict, subject: str,
+                  issuer: str, host: str) -> tuple:
+        """Decision cache key of a check, with the local engine's policy key when it decides."""
+        policy_key = None
+        if self.local_engine is not None:
+            policy_key = self.local_engine.cache_key(context, subject, issuer, host)
+        return decision_key(groups, method, resource_path, self.policy_store_id, policy_key)
+
+    def check(self, method: str, path: str, host: str, auth_header: str, timer, record: dict, start_time: float,
+              deadline=None) -> tuple:
+        """
+        Run one auth check: (status code, deny message, subject), where 200 is
+        ALLOW. Fills record with the fields of the decision log record.
+        """
+        # Clean path (remove query string)
+        if "?" in path:
+            path = path.split("?")[0]
+
+        record.update(method=method, path=path, host=host)
+        check_logger.info("Auth check: %s %s (host: %s)", method, path, host)
+
+        if not auth_header:
+            check_logger.warning("Missing Authorization header")
+            return 401, "Authorization header required", None
+
+        # Extract Bearer token
+        if not auth_header.lower().startswith("bearer "):
+            check_logger.warning("Invalid Authorization header format")
+            return 401, "Bearer token required", None
+
+        token = auth_header[7:]  # Remove "Bearer " prefix
+        timer.lap("parse")
+
+        # Reuse claims parsed for this exact token (skips verify/decode)
+        token_key = self.token_cache.key(token)
+        record["token"] = token_key.hex()
+        parsed_token = self.token_cache.get(token_key)
+        if parsed_token is None:
+            # Verify signature and issuer (JWT_VERIFY=true) or only decode the claims
+            if self.jwt_verifier is not None:
+                try:
+                    token_payload = self.jwt_verifier.verify(token)
+                except self._jwt_error as e:
+                    record["error"] = str(e)
+                    check_logger.warning("JWT verification failed: %s", e)
+                    return 401, "Invalid token", None
+            else:
+                token_payload = decode_jwt_payload(token)
+            if not token_payload:
+                check_logger.warning("Failed to decode JWT payload")
+                return 401, "Invalid token format", None
+
+            parsed_token = parse_token(token_payload)
+            self.token_cache.put(token_key, parsed_token)
+
+        # Check expiration locally (defense in depth), with the JWT clock-skew leeway
+        exp = parsed_token.exp
+        if exp and exp + self.leeway < int(time.time()):
+            check_logger.warning("Token expired at %s", exp)
+            return 401, "Token expired", None
+
+        subject = parsed_token.subject
+        check_logger.info("Token subject: %s", subject)
+
+        # Groups from token (normalized to a tuple)
+        groups = parsed_token.groups
+        record.update(subject=subject, groups=groups)
+        if self.record_claims:
+            claims = parsed_token.claims
+            record["claims"] = {name: claims[name] for name in self.record_claims if name in claims}
+        timer.lap("token")
+
+        # Map the path to its route template; unknown routes never reach the engine
+        route = None
+        resource_path = path
+        if self.route_index is not None:
+            route = self.route_index.match(method, path)
+            if route is not None:
+                resource_path = route.template
+                record["route"] = route.template
+            elif self.route_reject_unmatched:
+                self.metrics.inc("decisions_total", "DENY", "route")
+                record["source"] = "route"
+                check_logger.info("No route for %s %s", method, path)
+                return 403, "No matching route", None
+
+        # Deny locally when no generated permit policy lists any of the token's groups
+        if self.permit_index is not None and self.reload_inline:
+            self.permit_index.maybe_reload()
+        if self.permit_index is not None and route is not None and not self.permit_index.could_permit(
+            route.action, route.resource_type, route.template, parsed_token.claims
+        ):
+            self.metrics.inc("decisions_total", "DENY", "permit_index")
+            record["source"] = "permit_index"
+            check_logger.info("No permit policy for %s %s", method, path)
+            return 403, "Access denied by policy", None
+
+        # Serve from the decision cache when the same question was answered
+        context = engine_context(parsed_token.claims)
+        cache_key = self.cache_key(groups, method, resource_path, context, subject, parsed_token.issuer, host)
+        cached_decision = self.decision_cache.get(cache_key)
+        timer.lap("cache")
+        if cached_decision is not None:
+            self.metrics.inc("decisions_total", cached_decision, "cache")
+            record["source"] = "cache"
+            duration_ms = (time.time() - start_time) * 1000
+            check_logger.info("Cached decision: %s (%.1fms)", cached_decision, duration_ms)
+            if check_logger.isEnabledFor(logging.DEBUG):
+                check_logger.debug(f"Decision cache stats: {self.decision_cache.stats()}")
+            if cached_decision == "ALLOW":
+                return 200, "", subject
+            return 403, "Access denied by policy", None
+
+        # Build the IsAuthorized request from cached entity fragments
+        check = CheckRequest(method, path, host, subject, parsed_token.issuer, groups, route)
+        authz_request = self.entity_builder.build(check)
+        timer.lap("entities")
+
+        # Query the policy engine (Amazon Verified Permissions or local Cedar)
+        try:
+            # Identical questions already in flight share one engine call (waiting
+            # for it at most until this check's deadline, then failing like AVP)
+            if self.in_flight is not None:
+                avp_response, engine = self.in_flight.do(
+                    (subject,) + cache_key,
+                    lambda: self.authorize(authz_request, context, deadline),
+                    timeout=deadline.remaining() if deadline is not None else None
+                )
+            else:
+                avp_response, engine = self.authorize(authz_request, context, deadline)
+            timer.lap("avp")
+
+            decision = avp_response.get("decision", "DENY")
+            self.metrics.inc("decisions_total", decision, engine)
+            record["source"] = engine
+            duration_ms = (time.time() - start_time) * 1000
+            check_logger.info("%s decision: %s (%.1fms)", engine, decision, duration_ms)
+
+            determining_policies = avp_response.get("determiningPolicies", [])
+            errors = avp_response.get("errors", [])
+            if determining_policies:
+                record["policies"] = [p.get("policyId") for p in determining_policies]
+            if errors:
+                record["errors"] = errors
+
+            # Evaluation errors may turn into DENY; don't cache those
+            if not errors:
+                self.decision_cache.put(cache_key, decision, exp)
+
+            if decision == "ALLOW":
+                return 200, "", subject
+            else:
+                if determining_policies:
+                    check_logger.info("Determining policies: %s", determining_policies)
+                if errors:
+                    check_logger.warning("AVP errors: %s", errors)
+
+                return 403, "Access denied by policy", None
+
+        except self.validation_error() as e:
+            timer.lap("avp")
+            self.metrics.record_error(e)
+            record.update(source="AVP", error=str(e))
+            check_logger.error(f"AVP validation error: {e}")
+            return 401, "Token validation failed", None
+        except Exception as e:
+            timer.lap("avp")
+            self.metrics.record_error(e)
+            record["error"] = str(e)
+
+            # AVP failing or breaker open: last known decision, else fail closed
+            stale_decision = self.decision_cache.get_stale(cache_key)
+            if stale_decision is not None:
+                self.metrics.inc("decisions_total", stale_decision, "stale")
+                record["source"] = "stale"
+                check_logger.warning(f"AVP error, serving stale decision {stale_decision}: {e}")
+                if stale_decision == "ALLOW":
+                    return 200, "", subject
+                return 403, "Access denied by policy", None
+
+            check_logger.error(f"AVP error: {e}")
+            return self.failure_status, "Authorization service error", None
+
+    def prefetch(self, claims: dict, method: str, path: str, host: str = "") -> bool:
+        """
+        Answer a check for a token with these claims into the decision cache.
+
+        The claims go through parse_token() like a real token's, so the entry
+        has the key a real check with the same claims looks up. Returns True
+        when a decision was cached, False when already cached, unrouted or
+        not cacheable; engine errors propagate.
+        """
+        parsed_token = parse_token(claims)
+        method = method.upper()
+        route = self.route_index.match(method, path) if self.route_index is not None else None
+        if route is None and self.route_index is not None and self.route_reject_unmatched:
+            return False
+        context = engine_context(parsed_token.claims)
+        cache_key = self.cache_key(
+            parsed_token.groups, method, route.template if route else path, context,
+            parsed_token.subject, parsed_token.issuer, host
+        )
+        if self.decision_cache.get(cache_key) is not None:
+            return False
+        check = CheckRequest(method, path, host, parsed_token.subject, parsed_token.issuer, parsed_token.groups, route)
+        response, _ = self.authorize(self.entity_builder.build(check), context)
+        if response.get("errors"):
+            return False
+        self.decision_cache.put(cache_key, response.get("decision", "DENY"), parsed_token.exp)
+        return True
@@ -0,0 +1,247 @@
+"""
+Micro-batching of IsAuthorized calls through BatchIsAuthorized.
+
+Concurrent checks arriving within a short window (or until max_batch_size
+is reached) are grouped and sent as one `batch_is_authorized` call, then the
+per-item results are fanned back out to the waiting callers.
+
+BatchIsAuthorized requires either the principal or the resource to be the
+same across all requests of a batch (max 30 requests), so pending checks
+are first grouped by principal (one user loading a page) and what remains
+by resource (many users hitting the same path). Entities are merged per
+batch; checks whose entities conflict go to a separate batch.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+logger = logging.getLogger(__name__)
+
+# Hard limit of the BatchIsAuthorized API
+MAX_BATCH_SIZE = 30
+
+
+def _entity_key(entity: dict) -> tuple:
+    identifier = entity["identifier"]
+    return (identifier["entityType"], identifier["entityId"])
+
+
+def _uid_key(uid: dict) -> tuple:
+    return tuple(sorted(uid.items()))
+
+
+class _Pending:
+    __slots__ = ("request", "future", "enqueued_at")
+
+    def __init__(self, request: dict):
+        self.request = request
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class AuthzBatcher:
+    """Drop-in wrapper around avp_client.is_authorized that batches calls."""
+
+    def __init__(self, client, window_seconds: float = 0.002,
+                 max_batch_size: int = MAX_BATCH_SIZE, max_workers: int = 8):
+        self.client = client
+        self.window_seconds = window_seconds
+        self.max_batch_size = max(1, min(max_batch_size, MAX_BATCH_SIZE))
+        self.max_workers = max_workers
+        self._recent = deque(maxlen=1024)
+        self.batches = 0
+        self.batched_requests = 0
+        self.single_calls = 0
+        self.fallbacks = 0
+        self._start()
+        # A forked worker (server.py pre-fork mode) gets no dispatcher thread
+        os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        self._cond = threading.Condition()
+        self._pending = []
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="avp-batch")
+        self._stats_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="avp-batcher", daemon=True)
+        self._thread.start()
+
+    @property
+    def exceptions(self):
+        return self.client.exceptions
+
+    def is_authorized(self, timeout: float = None, **request) -> dict:
+        """
+        Queue a check and block until its batch has been answered.
+
+        timeout bounds the wait (seconds, the caller's deadline); past it the
+        check is dropped if not yet sent and TimeoutError is raised.
+        """
+        item = _Pending(request)
+        with self._cond:
+            self._pending.append(item)
+            if len(self._pending) == 1 or len(self._pending) >= self.max_batch_size:
+                self._cond.notify()
+        try:
+            return item.future.result(timeout=max(timeout, 0) if timeout is not None else None)
+        except FutureTimeoutError:
+            item.future.cancel()
+            raise TimeoutError(f"No batched AVP answer within {timeout:.3f}s")
+
+    # -- dispatcher ------------------------------------------------------------
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                deadline = self._pending[0].enqueued_at + self.window_seconds
+                while len(self._pending) < self.max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                # Checks whose caller stopped waiting are not sent
+                items = [item for item in self._pending if item.future.set_running_or_notify_cancel()]
+                self._pending = []
+            if not items:
+                continue
+
+            try:
+                batches = self._partition(items)
+            except Exception as e:
+                for item in items:
+                    item.future.set_exception(e)
+                continue
+            for batch_items, entity_list in batches:
+                self._pool.submit(self._dispatch, batch_items, entity_list)
+
+    def _partition(self, items: list) -> list:
+        """Split pending checks into valid batches of (items, merged entities)."""
+        by_principal = {}
+        for item in items:
+            key = (item.request.get("policyStoreId"), _uid_key(item.request["principal"]))
+            by_principal.setdefault(key, []).append(item)
+
+        batches = []
+        leftovers = []
+        for group in by_principal.values():
+            if len(group) > 1:
+                batches.extend(self._chunk(group))
+            else:
+                leftovers.extend(group)
+
+        by_resource = {}
+        for item in leftovers:
+            key = (item.request.get("policyStoreId"), _uid_key(item.request["resource"]))
+            by_resource.setdefault(key, []).append(item)
+        for group in by_resource.values():
+            batches.extend(self._chunk(group))
+        return batches
+
+    def _chunk(self, group: list) -> list:
+        batches = []
+        current = []
+        entities = {}
+        for item in group:
+            item_entities = {
+                _entity_key(e): e
+                for e in item.request.get("entities", {}).get("entityList", [])
+            }
+            conflict = any(
+                key in entities and entities[key] != entity
+                for key, entity in item_entities.items()
+            )
+            if current and (conflict or len(current) >= self.max_batch_size):
+                batches.append((current, list(entities.values())))
+                current = []
+                entities = {}
+            current.append(item)
+            entities.update(item_entities)
+        if current:
+            batches.append((current, list(entities.values())))
+        return batches
+
+    def _dispatch(self, items: list, entity_list: list):
+        start = time.monotonic()
+        try:
+            if len(items) == 1:
+                results = [self.client.is_authorized(**items[0].request)]
+            else:
+                results = self._batch_call(items, entity_list)
+        except self.client.exceptions.ValidationException as e:
+            if len(items) == 1:
+                items[0].future.set_exception(e)
+                return
+            # One invalid check must not fail its neighbours: retry individually
+            logger.warning(f"Batch of {len(items)} rejected, retrying individually: {e}")
+            with self._stats_lock:
+                self.fallbacks += 1
+            for item in items:
+                self._pool.submit(self._dispatch, [item], item.request.get("entities", {}).get("entityList", []))
+            return
+        except Exception as e:
+            for item in items:
+                item.future.set_exception(e)
+            return
+
+        latency_ms = (time.monotonic() - start) * 1000
+        wait_ms = (start - min(item.enqueued_at for item in items)) * 1000
+        with self._stats_lock:
+            if len(items) == 1:
+                self.single_calls += 1
+            else:
+                self.batches += 1
+                self.batched_requests += len(items)
+            self._recent.append((len(items), latency_ms, wait_ms))
+        logger.debug(f"AVP batch: {len(items)} checks in {latency_ms:.1f}ms (waited {wait_ms:.1f}ms)")
+
+        for item, result in zip(items, results):
+            item.future.set_result(result)
+
+    def _batch_call(self, items: list, entity_list: list) -> list:
+        requests = []
+        for item in items:
+            entry = {
+                "principal": item.request["principal"],
+                "action": item.request["action"],
+                "resource": item.request["resource"],
+            }
+            if "context" in item.request:
+                entry["context"] = item.request["context"]
+            requests.append(entry)
+
+        response = self.client.batch_is_authorized(
+            policyStoreId=items[0].request.get("policyStoreId"),
+            entities={"entityList": entity_list},
+            requests=requests
+        )
+        results = response.get("results", [])
+        if len(results) != len(items):
+            raise RuntimeError(f"BatchIsAuthorized returned {len(results)} results for {len(items)} requests")
+        return results
+
+    # -- metrics -----------------------------------------------------------------
+
+    def stats(self) -> dict:
+        """Return call counters and size/latency/wait percentiles of recent batches."""
+        with self._stats_lock:
+            recent = list(self._recent)
+            stats = {
+                "batches": self.batches,
+                "batched_requests": self.batched_requests,
+                "single_calls": self.single_calls,
+                "fallbacks": self.fallbacks,
+                "avp_calls": self.batches + self.single_calls,
+            }
+
+        for index, name in ((0, "size"), (1, "latency_ms"), (2, "wait_ms")):
+            values = sorted(entry[index] for entry in recent)
+            if values:
+                stats[f"{name}_p50"] = values[len(values) // 2]
+                stats[f"{name}_p99"] = values[min(len(values) - 1, int(len(values) * 0.99))]
+                stats[f"{name}_max"] = values[-1]
+        return stats
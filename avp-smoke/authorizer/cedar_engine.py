@@ -0,0 +1,898 @@
+"""
+In-process Cedar evaluation for the AVP authorizer.
+
+Implements the subset of Cedar our policies use, so checks can be decided
+locally instead of calling Amazon Verified Permissions:
+
+- permit / forbid with when / unless conditions
+- principal / resource scopes with `==` and `in`
+- action scopes with `==`, `in Entity` and `in [...]`
+- `principal in Group::"x"`, `==`, `!=`, `<`, `<=`, `>`, `>=`, `in [...]`, `has`
+- `&&`, `||`, `!`, attribute and `["key"]` access on entities, records and context
+- `.contains()`, `.containsAll()`, `.containsAny()`
+- `@id("...")` annotations
+
+Policies are loaded from `.cedar`/`.cedars` files (one or more policies per
+file) and optionally validated against an AVP `schema.json`. Each load
+produces an immutable PolicySnapshot; LocalPolicyEngine swaps snapshots
+atomically when the files change, so in-flight checks keep evaluating the
+snapshot they started with.
+
+Evaluation follows Cedar semantics: a policy whose condition raises an error
+is skipped and reported in `errors`, any satisfied forbid denies, otherwise
+any satisfied permit allows, otherwise the request is denied.
+
+The parser also records what each policy reads besides groups, action and
+resource (context attributes, principal identity/attributes, resource
+attributes), so PolicySnapshot.cache_key() can tell the decision cache which
+parts of a check its decisions depend on.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+POLICY_FILE_SUFFIXES = (".cedar", ".cedars")
+
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+|//[^\n]*)
+  | (?P<string>"(?:[^"\\]|\\.)*")
+  | (?P<number>\d+)
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<op>::|==|!=|<=|>=|&&|\|\||[()\[\]{},;.!<>@:-])
+""", re.VERBOSE)
+
+_VARIABLES = ("principal", "action", "resource", "context")
+
+
+class CedarError(Exception):
+    """Raised when policies or a schema cannot be loaded."""
+
+
+class _EvalError(Exception):
+    """Raised while evaluating a condition; the policy is then skipped."""
+
+
+# ============================================================================
+# Tokenizer / parser
+# ============================================================================
+
+def _unquote(literal: str) -> str:
+    body = literal[1:-1]
+    if "\\" not in body:
+        return body
+    body = re.sub(r"\\u\{([0-9a-fA-F]+)\}", lambda m: chr(int(m.group(1), 16)), body)
+    return body.encode("latin-1", "backslashreplace").decode("unicode_escape")
+
+
+def _tokenize(text: str, source: str) -> list:
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        match = _TOKEN_RE.match(text, pos)
+        if not match:
+            line = text.count("\n", 0, pos) + 1
+            raise CedarError(f"{source}:{line}: unexpected character {text[pos]!r}")
+        kind = match.lastgroup
+        if kind != "ws":
+            tokens.append((kind, match.group(), text.count("\n", 0, pos) + 1))
+        pos = match.end()
+    tokens.append(("eof", "", text.count("\n") + 1))
+    return tokens
+
+
+class Policy:
+    """A parsed policy with its scopes and compiled conditions."""
+
+    __slots__ = ("policy_id", "effect", "principal", "action", "resource", "conditions", "reads")
+
+    def __init__(self, policy_id, effect, principal, action, resource, conditions, reads=frozenset()):
+        self.policy_id = policy_id
+        self.effect = effect
+        self.principal = principal
+        self.action = action
+        self.resource = resource
+        self.conditions = conditions
+        # (variable, attribute path) read by the policy; path () is the value itself
+        self.reads = reads
+
+    def __repr__(self):
+        return f"Policy({self.policy_id!r}, {self.effect})"
+
+
+class _Parser:
+    """Recursive-descent parser producing Policy objects with compiled conditions."""
+
+    def __init__(self, text: str, source: str):
+        self.source = source
+        self.tokens = _tokenize(text, source)
+        self.pos = 0
+        self._reads = []
+
+    # -- token helpers -------------------------------------------------------
+
+    def _peek(self, offset: int = 0):
+        return self.tokens[min(self.pos + offset, len(self.tokens) - 1)]
+
+    def _error(self, message: str):
+        kind, value, line = self._peek()
+        found = value or "end of file"
+        return CedarError(f"{self.source}:{line}: {message} (found {found!r})")
+
+    def _accept(self, value: str) -> bool:
+        kind, tok, _ = self._peek()
+        if tok == value and kind in ("op", "ident"):
+            self.pos += 1
+            return True
+        return False
+
+    def _expect(self, value: str):
+        if not self._accept(value):
+            raise self._error(f"expected {value!r}")
+
+    def _expect_kind(self, kind: str) -> str:
+        tok_kind, tok, _ = self._peek()
+        if tok_kind != kind:
+            raise self._error(f"expected {kind}")
+        self.pos += 1
+        return tok
+
+    # -- policies --------------------------------------------------------------
+
+    def parse_policies(self) -> list:
+        policies = []
+        while self._peek()[0] != "eof":
+            policies.append(self._parse_policy(len(policies)))
+        return policies
+
+    def _parse_policy(self, index: int) -> Policy:
+        self._reads = []
+        annotations = {}
+        while self._accept("@"):
+            name = self._expect_kind("ident")
+            self._expect("(")
+            annotations[name] = _unquote(self._expect_kind("string"))
+            self._expect(")")
+
+        effect = self._expect_kind("ident")
+        if effect not in ("permit", "forbid"):
+            raise self._error("expected 'permit' or 'forbid'")
+
+        self._expect("(")
+        self._expect("principal")
+        principal = self._parse_scope(allow_list=False)
+        if principal is not None and principal[0] == "==":
+            self._reads.append(("principal", ()))
+        self._expect(",")
+        self._expect("action")
+        action = self._parse_scope(allow_list=True)
+        self._expect(",")
+        self._expect("resource")
+        resource = self._parse_scope(allow_list=False)
+        self._expect(")")
+
+        conditions = []
+        while self._peek()[1] in ("when", "unless"):
+            negate = self._expect_kind("ident") == "unless"
+            self._expect("{")
+            expr = self._parse_expr()
+            self._expect("}")
+            conditions.append((negate, expr))
+        self._expect(";")
+
+        policy_id = annotations.get("id") or f"{self.source}#{index}"
+        return Policy(policy_id, effect, principal, action, resource, tuple(conditions), frozenset(self._reads))
+
+    def _parse_scope(self, allow_list: bool):
+        if self._accept("=="):
+            return ("==", self._parse_entity())
+        if self._accept("in"):
+            if allow_list and self._accept("["):
+                uids = [self._parse_entity()]
+                while self._accept(","):
+                    uids.append(self._parse_entity())
+                self._expect("]")
+                return ("in", frozenset(uids))
+            return ("in", self._parse_entity())
+        if self._peek()[1] == "is":
+            raise self._error("'is' scopes are not supported")
+        return None
+
+    def _parse_entity(self) -> tuple:
+        path = [self._expect_kind("ident")]
+        while True:
+            self._expect("::")
+            if self._peek()[0] == "string":
+                return ("::".join(path), _unquote(self._expect_kind("string")))
+            path.append(self._expect_kind("ident"))
+
+    # -- expressions (compiled into closures over a _Request) ------------------
+
+    def _parse_expr(self):
+        left = self._parse_and()
+        while self._accept("||"):
+            right = self._parse_and()
+            left = _compile_or(left, right)
+        return left
+
+    def _parse_and(self):
+        left = self._parse_relation()
+        while self._accept("&&"):
+            right = self._parse_relation()
+            left = _compile_and(left, right)
+        return left
+
+    def _parse_relation(self):
+        reads = len(self._reads)
+        left = self._parse_unary()
+        kind, tok, _ = self._peek()
+        if kind == "op" and tok in ("==", "!=", "<", "<=", ">", ">="):
+            self.pos += 1
+            return _compile_compare(tok, left, self._parse_unary())
+        if kind == "ident" and tok == "in":
+            self.pos += 1
+            if self._reads[reads:] == [("principal", ())]:
+                # `principal in Group` only depends on the groups (parents)
+                del self._reads[reads:]
+            return _compile_in(left, self._parse_unary())
+        if kind == "ident" and tok == "has":
+            self.pos += 1
+            if self._peek()[0] == "string":
+                attr = _unquote(self._expect_kind("string"))
+            else:
+                attr = self._expect_kind("ident")
+            return _compile_has(left, attr)
+        return left
+
+    def _parse_unary(self):
+        if self._accept("!"):
+            operand = self._parse_unary()
+            return lambda req: not _as_bool(operand(req))
+        if self._peek()[1] == "-" and self._peek(1)[0] == "number":
+            self.pos += 1
+            value = -int(self._expect_kind("number"))
+            return lambda req: value
+        return self._parse_member()
+
+    def _parse_member(self):
+        kind, tok, _ = self._peek()
+        variable = tok if kind == "ident" and tok in _VARIABLES and self._peek(1)[1] != "::" else None
+        path = []
+        expr = self._parse_primary()
+        while True:
+            if self._accept("."):
+                name = self._expect_kind("ident")
+                if self._accept("("):
+                    self._read(variable, path)
+                    variable = None
+                    arg = self._parse_expr()
+                    self._expect(")")
+                    expr = _compile_method(name, expr, arg, self)
+                else:
+                    expr = _compile_attr(expr, name)
+                    path.append(name)
+            elif self._peek()[1] == "[" and self._peek()[0] == "op":
+                self.pos += 1
+                key = _unquote(self._expect_kind("string"))
+                self._expect("]")
+                expr = _compile_attr(expr, key)
+                path.append(key)
+            else:
+                self._read(variable, path)
+                return expr
+
+    def _read(self, variable: Optional[str], path: list):
+        if variable is not None:
+            self._reads.append((variable, tuple(path)))
+
+    def _parse_primary(self):
+        kind, tok, _ = self._peek()
+        if kind == "string":
+            self.pos += 1
+            value = _unquote(tok)
+            return lambda req: value
+        if kind == "number":
+            self.pos += 1
+            value = int(tok)
+            return lambda req: value
+        if kind == "op" and tok == "(":
+            self.pos += 1
+            expr = self._parse_expr()
+            self._expect(")")
+            return expr
+        if kind == "op" and tok == "[":
+            self.pos += 1
+            items = []
+            if not self._accept("]"):
+                items.append(self._parse_expr())
+                while self._accept(","):
+                    items.append(self._parse_expr())
+                self._expect("]")
+            return _compile_set(items)
+        if kind == "ident":
+            if tok in ("true", "false"):
+                self.pos += 1
+                value = tok == "true"
+                return lambda req: value
+            if tok in _VARIABLES and self._peek(1)[1] != "::":
+                self.pos += 1
+                return _compile_variable(tok)
+            uid = self._parse_entity()
+            return lambda req: uid
+        raise self._error("expected expression")
+
+
+# ============================================================================
+# Expression compilation
+# ============================================================================
+
+def _as_bool(value) -> bool:
+    if not isinstance(value, bool):
+        raise _EvalError(f"expected boolean, got {type(value).__name__}")
+    return value
+
+
+def _as_set(value) -> frozenset:
+    if not isinstance(value, frozenset):
+        raise _EvalError(f"expected set, got {type(value).__name__}")
+    return value
+
+
+def _from_python(value):
+    """Convert plain Python context values (e.g. JWT claims) to Cedar values."""
+    if isinstance(value, (list, set)):
+        try:
+            return frozenset(_from_python(v) for v in value)
+        except TypeError:
+            raise _EvalError("set elements must be hashable")
+    return value
+
+
+def _compile_variable(name: str):
+    if name == "principal":
+        return lambda req: req.principal
+    if name == "action":
+        return lambda req: req.action
+    if name == "resource":
+        return lambda req: req.resource
+    return lambda req: req.context
+
+
+def _compile_or(left, right):
+    return lambda req: _as_bool(left(req)) or _as_bool(right(req))
+
+
+def _compile_and(left, right):
+    return lambda req: _as_bool(left(req)) and _as_bool(right(req))
+
+
+def _equal(a, b) -> bool:
+    """Cedar equality: values of different types are never equal (true != 1)."""
+    if isinstance(a, bool) or isinstance(b, bool):
+        return type(a) is type(b) and a == b
+    if isinstance(a, frozenset) and isinstance(b, frozenset):
+        return len(a) == len(b) and all(_contains(b, value) for value in a)
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(_equal(a[k], b[k]) for k in a)
+    return a == b
+
+
+def _contains(values: frozenset, value) -> bool:
+    # The hash lookup also finds 1 for true; _equal rules those out
+    return value in values and any(_equal(value, item) for item in values)
+
+
+def _compile_compare(op: str, left, right):
+    if op == "==":
+        return lambda req: _equal(left(req), right(req))
+    if op == "!=":
+        return lambda req: not _equal(left(req), right(req))
+
+    def compare(req):
+        a, b = left(req), right(req)
+        if not (isinstance(a, int) and isinstance(b, int)) or isinstance(a, bool) or isinstance(b, bool):
+            raise _EvalError(f"'{op}' requires Long operands")
+        if op == "<":
+            return a < b
+        if op == "<=":
+            return a <= b
+        if op == ">":
+            return a > b
+        return a >= b
+    return compare
+
+
+def _compile_in(left, right):
+    def evaluate(req):
+        uid = left(req)
+        target = right(req)
+        if not isinstance(uid, tuple):
+            raise _EvalError("left side of 'in' must be an entity")
+        if isinstance(target, frozenset):
+            return any(req.is_in(uid, t) for t in target)
+        if not isinstance(target, tuple):
+            raise _EvalError("right side of 'in' must be an entity or set of entities")
+        return req.is_in(uid, target)
+    return evaluate
+
+
+def _compile_has(expr, attr: str):
+    def evaluate(req):
+        value = expr(req)
+        if isinstance(value, tuple):
+            return attr in req.attributes(value)
+        if isinstance(value, dict):
+            return attr in value
+        raise _EvalError("'has' requires an entity or record")
+    return evaluate
+
+
+def _compile_attr(expr, attr: str):
+    def evaluate(req):
+        value = expr(req)
+        if isinstance(value, tuple):
+            record = req.attributes(value)
+        elif isinstance(value, dict):
+            record = value
+        else:
+            raise _EvalError(f"cannot access attribute {attr!r} of {type(value).__name__}")
+        if attr not in record:
+            raise _EvalError(f"attribute {attr!r} not found")
+        return _from_python(record[attr])
+    return evaluate
+
+
+def _compile_set(items):
+    def evaluate(req):
+        try:
+            return frozenset(item(req) for item in items)
+        except TypeError:
+            raise _EvalError("set elements must be hashable")
+    return evaluate
+
+
+def _compile_method(name: str, target, arg, parser: _Parser):
+    if name == "contains":
+        return lambda req: _contains(_as_set(target(req)), arg(req))
+
+    def contains_all(req):
+        values, items = _as_set(target(req)), _as_set(arg(req))
+        return items <= values and all(_contains(values, item) for item in items)
+
+    def contains_any(req):
+        values, items = _as_set(target(req)), _as_set(arg(req))
+        return not values.isdisjoint(items) and any(_contains(values, item) for item in items)
+
+    if name == "containsAll":
+        return contains_all
+    if name == "containsAny":
+        return contains_any
+    raise parser._error(f"unsupported method '{name}'")
+
+
+# ============================================================================
+# Requests and entities
+# ============================================================================
+
+def _decode_avp_value(value: dict):
+    """Decode an AVP AttributeValue ({"string": ...}, {"set": [...]}, ...)."""
+    if "string" in value:
+        return value["string"]
+    if "long" in value:
+        return int(value["long"])
+    if "boolean" in value:
+        return bool(value["boolean"])
+    if "entityIdentifier" in value:
+        ident = value["entityIdentifier"]
+        return (ident["entityType"], ident["entityId"])
+    if "set" in value:
+        return frozenset(_decode_avp_value(v) for v in value["set"])
+    if "record" in value:
+        return {k: _decode_avp_value(v) for k, v in value["record"].items()}
+    raise _EvalError(f"unsupported attribute value: {list(value)}")
+
+
+def _uid(identifier: dict, type_key: str = "entityType", id_key: str = "entityId") -> tuple:
+    return (identifier[type_key], identifier[id_key])
+
+
+class _Request:
+    """Per-check evaluation state: request UIDs, context and entity store."""
+
+    __slots__ = ("principal", "action", "resource", "context", "_entities", "_decoded", "_ancestors")
+
+    def __init__(self, principal: tuple, action: tuple, resource: tuple, context: dict, entity_list: list):
+        self.principal = principal
+        self.action = action
+        self.resource = resource
+        self.context = context or {}
+        self._entities = {}
+        for entity in entity_list:
+            self._entities[_uid(entity["identifier"])] = entity
+        self._decoded = {}
+        self._ancestors = {}
+
+    def attributes(self, uid: tuple) -> dict:
+        decoded = self._decoded.get(uid)
+        if decoded is None:
+            entity = self._entities.get(uid)
+            if entity is None:
+                raise _EvalError(f"entity {uid[0]}::\"{uid[1]}\" not found")
+            decoded = {k: _decode_avp_value(v) for k, v in entity.get("attributes", {}).items()}
+            self._decoded[uid] = decoded
+        return decoded
+
+    def ancestors(self, uid: tuple) -> frozenset:
+        cached = self._ancestors.get(uid)
+        if cached is not None:
+            return cached
+        seen = set()
+        stack = [uid]
+        while stack:
+            entity = self._entities.get(stack.pop())
+            if entity is None:
+                continue
+            for parent in entity.get("parents", ()):
+                parent_uid = _uid(parent)
+                if parent_uid not in seen:
+                    seen.add(parent_uid)
+                    stack.append(parent_uid)
+        result = frozenset(seen)
+        self._ancestors[uid] = result
+        return result
+
+    def is_in(self, uid: tuple, target: tuple) -> bool:
+        return uid == target or target in self.ancestors(uid)
+
+
+def _scope_matches(scope, req: _Request, uid: tuple) -> bool:
+    if scope is None:
+        return True
+    op, value = scope
+    if op == "==":
+        return uid == value
+    if isinstance(value, frozenset):
+        return any(req.is_in(uid, v) for v in value)
+    return req.is_in(uid, value)
+
+
+# ============================================================================
+# Schema
+# ============================================================================
+
+def _load_schema(path: str) -> dict:
+    """Return {namespace: (entity types, action ids)} from an AVP JSON schema."""
+    try:
+        with open(path) as f:
+            document = json.load(f)
+    except (OSError, ValueError) as e:
+        raise CedarError(f"Cannot load schema {path}: {e}")
+
+    schema = {}
+    for namespace, definition in document.items():
+        entity_types = frozenset(definition.get("entityTypes", {}))
+        actions = frozenset(definition.get("actions", {}))
+        schema[namespace] = (entity_types, actions)
+    return schema
+
+
+def _validate_uid(schema: dict, uid: tuple, policy: Policy, is_action: bool = False):
+    namespace, _, type_name = uid[0].rpartition("::")
+    if namespace not in schema:
+        # Only namespaces present in the schema are validated
+        return
+    entity_types, actions = schema[namespace]
+    if is_action:
+        if type_name != "Action" or uid[1] not in actions:
+            raise CedarError(f"{policy.policy_id}: unknown action {uid[0]}::\"{uid[1]}\"")
+    elif type_name not in entity_types:
+        raise CedarError(f"{policy.policy_id}: unknown entity type {uid[0]}")
+
+
+def _validate_policy(schema: dict, policy: Policy):
+    for scope, is_action in ((policy.principal, False), (policy.action, True), (policy.resource, False)):
+        if scope is None:
+            continue
+        values = scope[1] if isinstance(scope[1], frozenset) else (scope[1],)
+        for uid in values:
+            _validate_uid(schema, uid, policy, is_action)
+
+
+# ============================================================================
+# Snapshots and engine
+# ============================================================================
+
+class PolicySnapshot:
+    """Immutable set of parsed policies, indexed by action."""
+
+    def __init__(self, policies: list, version: str, sources: tuple = ()):
+        self.policies = tuple(policies)
+        self.version = version
+        self.sources = sources
+        self.loaded_at = time.time()
+
+        by_action = {}
+        any_action = []
+        for policy in self.policies:
+            scope = policy.action
+            if scope is not None and scope[0] == "==":
+                by_action.setdefault(scope[1], []).append(policy)
+            elif scope is not None and isinstance(scope[1], frozenset):
+                for uid in scope[1]:
+                    by_action.setdefault(uid, []).append(policy)
+            else:
+                any_action.append(policy)
+        self._by_action = {uid: tuple(p) for uid, p in by_action.items()}
+        self._any_action = tuple(any_action)
+
+        reads = set()
+        for policy in self.policies:
+            reads.update(policy.reads)
+        # Decisions depend on the subject (user entity id/attributes), the host
+        # (resource attribute) and these context paths; () is the whole context
+        self.reads_subject = any(variable == "principal" for variable, _ in reads)
+        self.reads_host = any(variable == "resource" and path for variable, path in reads)
+        context_paths = {path for variable, path in reads if variable == "context"}
+        self.context_paths = ((),) if () in context_paths else tuple(sorted(context_paths))
+
+    @classmethod
+    def from_sources(cls, sources: list, schema_file: Optional[str] = None) -> "PolicySnapshot":
+        """Parse [(name, text), ...] into a snapshot; raises CedarError."""
+        schema = _load_schema(schema_file) if schema_file else {}
+        digest = hashlib.sha256()
+        policies = []
+        for name, text in sources:
+            digest.update(name.encode() + b"\0" + text.encode() + b"\0")
+            parsed = _Parser(text, name).parse_policies()
+            for policy in parsed:
+                _validate_policy(schema, policy)
+            policies.extend(parsed)
+
+        seen = set()
+        for policy in policies:
+            if policy.policy_id in seen:
+                raise CedarError(f"Duplicate policy id: {policy.policy_id}")
+            seen.add(policy.policy_id)
+
+        return cls(policies, digest.hexdigest()[:12], tuple(name for name, _ in sources))
+
+    def cache_key(self, context: Optional[dict], subject: str, issuer: str, host: str) -> tuple:
+        """
+        What a decision of this snapshot depends on besides groups, action and resource.
+
+        Two checks with the same groups, action, resource and cache_key get
+        the same decision from this snapshot; the version makes a reload
+        start from fresh keys.
+        """
+        key = [self.version]
+        if self.reads_subject:
+            key += [subject, issuer]
+        if self.reads_host:
+            key.append(host)
+        for path in self.context_paths:
+            key.append(_key_value(context or {}, path))
+        return tuple(key)
+
+    def evaluate(self, principal: tuple, action: tuple, resource: tuple,
+                 entity_list: list, context: Optional[dict] = None) -> dict:
+        """Evaluate a request and return an AVP-shaped IsAuthorized response."""
+        req = _Request(principal, action, resource, context, entity_list)
+        permits = []
+        forbids = []
+        errors = []
+
+        for policies in (self._by_action.get(action, ()), self._any_action):
+            for policy in policies:
+                if policy.effect == "permit" and forbids:
+                    continue
+                if not (_scope_matches(policy.principal, req, principal)
+                        and _scope_matches(policy.action, req, action)
+                        and _scope_matches(policy.resource, req, resource)):
+                    continue
+                try:
+                    satisfied = all(
+                        _as_bool(expr(req)) != negate for negate, expr in policy.conditions
+                    )
+                except _EvalError as e:
+                    errors.append({"errorDescription": f"{policy.policy_id}: {e}"})
+                    continue
+                if satisfied:
+                    (forbids if policy.effect == "forbid" else permits).append(policy)
+
+        determining = forbids or permits
+        return {
+            "decision": "ALLOW" if permits and not forbids else "DENY",
+            "determiningPolicies": [{"policyId": p.policy_id} for p in determining],
+            "errors": errors,
+        }
+
+
+def _key_value(context: dict, path: tuple) -> str:
+    """Canonical JSON of the context value at path; lists are sets in Cedar."""
+    value = context
+    for attr in path:
+        if not isinstance(value, dict) or attr not in value:
+            return "<missing>"
+        value = value[attr]
+    if isinstance(value, (list, tuple, set, frozenset)):
+        value = sorted({json.dumps(v, sort_keys=True, default=str) for v in value})
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+def _policy_files(policy_dirs: list) -> list:
+    """
+    Return [(path, source name), ...] of the policy files under policy_dirs.
+
+    The source name (the id prefix of policies without @id) is the path
+    relative to its policy dir, or the file name for a policy file given
+    directly. A name already taken by an earlier dir falls back to the full
+    path, so equally named files in two dirs don't collide.
+    """
+    files = []
+    names_seen = set()
+    for directory in policy_dirs:
+        if os.path.isfile(directory):
+            found = [(directory, os.path.basename(directory))]
+        else:
+            found = []
+            for root, dirs, names in os.walk(directory):
+                # Skip hidden entries such as the ..data symlinks of ConfigMap mounts
+                dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+                for name in sorted(names):
+                    if name.endswith(POLICY_FILE_SUFFIXES) and not name.startswith("."):
+                        path = os.path.join(root, name)
+                        found.append((path, os.path.relpath(path, directory).replace(os.sep, "/")))
+        for path, source in found:
+            if source in names_seen:
+                source = path
+            names_seen.add(source)
+            files.append((path, source))
+    return files
+
+
+class LocalPolicyEngine:
+    """
+    Evaluates checks against the latest PolicySnapshot loaded from disk.
+
+    Reloads are triggered by start_reloader() (background thread) or
+    maybe_reload() (called inline, e.g. from Lambda where threads are frozen
+    between invocations). A reload that fails keeps the previous snapshot.
+    """
+
+    def __init__(self, policy_dirs: list, schema_file: Optional[str] = None,
+                 reload_interval: float = 5.0):
+        self.policy_dirs = [d for d in policy_dirs if d]
+        self.schema_file = schema_file or None
+        self.reload_interval = reload_interval
+        self.snapshot = None
+        self.reloads = 0
+        self.reload_errors = 0
+        self.shadow_matches = 0
+        self.shadow_mismatches = 0
+        self._fingerprint = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.snapshot is not None
+
+    def _current_fingerprint(self, files: list) -> tuple:
+        entries = []
+        for path in [path for path, _ in files] + ([self.schema_file] if self.schema_file else []):
+            try:
+                st = os.stat(path)
+                entries.append((path, st.st_mtime_ns, st.st_size))
+            except OSError:
+                entries.append((path, None, None))
+        return tuple(entries)
+
+    def load(self, force: bool = False) -> bool:
+        """Reload policies if files changed. Returns True if a new snapshot was installed."""
+        with self._lock:
+            self._last_check = time.time()
+            files = _policy_files(self.policy_dirs)
+            fingerprint = self._current_fingerprint(files)
+            if not force and fingerprint == self._fingerprint:
+                return False
+
+            try:
+                sources = []
+                for path, source in files:
+                    with open(path) as f:
+                        sources.append((source, f.read()))
+                snapshot = PolicySnapshot.from_sources(sources, self.schema_file)
+            except (CedarError, OSError) as e:
+                self.reload_errors += 1
+                self._fingerprint = fingerprint
+                logger.error(f"Policy reload failed, keeping previous snapshot: {e}")
+                return False
+
+            self._fingerprint = fingerprint
+            if self.snapshot is not None and snapshot.version == self.snapshot.version:
+                return False
+            self.snapshot = snapshot
+            self.reloads += 1
+            logger.info(f"Loaded policy snapshot {snapshot.version}: "
+                        f"{len(snapshot.policies)} policies from {len(files)} files")
+            return True
+
+    def maybe_reload(self):
+        """Check for changes at most once per reload_interval."""
+        if time.time() - self._last_check >= self.reload_interval and not self._lock.locked():
+            self.load()
+
+    def start_reloader(self):
+        """Poll the policy directories in a daemon thread."""
+        def run():
+            while True:
+                time.sleep(self.reload_interval)
+                try:
+                    self.load()
+                except Exception as e:
+                    logger.error(f"Policy reloader error: {e}")
+
+        thread = threading.Thread(target=run, name="policy-reloader", daemon=True)
+        thread.start()
+        return thread
+
+    def cache_key(self, context: Optional[dict], subject: str, issuer: str, host: str) -> Optional[tuple]:
+        """PolicySnapshot.cache_key() of the current snapshot, None while none is loaded."""
+        snapshot = self.snapshot
+        return snapshot.cache_key(context, subject, issuer, host) if snapshot is not None else None
+
+    def is_authorized(self, principal: dict, action: dict, resource: dict,
+                      entities: Optional[dict] = None, context: Optional[dict] = None,
+                      policyStoreId: Optional[str] = None) -> dict:
+        """Drop-in for avp_client.is_authorized (context is a plain dict)."""
+        snapshot = self.snapshot
+        if snapshot is None:
+            raise CedarError("No policy snapshot loaded")
+        return snapshot.evaluate(
+            _uid(principal),
+            _uid(action, "actionType", "actionId"),
+            _uid(resource),
+            (entities or {}).get("entityList", []),
+            context,
+        )
+
+    def stats(self) -> dict:
+        snapshot = self.snapshot
+        return {
+            "ready": snapshot is not None,
+            "policies": len(snapshot.policies) if snapshot is not None else 0,
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+            "shadow_matches": self.shadow_matches,
+            "shadow_mismatches": self.shadow_mismatches,
+        }
+
+    def shadow_compare(self, request: dict, context: Optional[dict], remote_response: dict) -> bool:
+        """Evaluate locally and log when the decision differs from AVP's."""
+        try:
+            local_response = self.is_authorized(**request, context=context)
+        except CedarError as e:
+            logger.warning(f"Shadow evaluation failed: {e}")
+            return False
+
+        remote_decision = remote_response.get("decision", "DENY")
+        if local_response["decision"] == remote_decision:
+            self.shadow_matches += 1
+            return True
+
+        self.shadow_mismatches += 1
+        logger.warning(
+            f"Shadow mismatch for {request['action']['actionId']} "
+            f"{request['resource']['entityId']}: AVP={remote_decision} "
+            f"local={local_response['decision']} (snapshot {self.snapshot.version}, "
+            f"local policies {local_response['determiningPolicies']}, "
+            f"errors {local_response['errors']})"
+        )
+        return False
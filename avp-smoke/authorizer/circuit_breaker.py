@@ -0,0 +1,115 @@
+"""
+Circuit breaker around the remote policy engine.
+
+When Verified Permissions is throttling or down, every check would otherwise
+wait for botocore's retries before failing. After `failure_threshold`
+consecutive failed calls the breaker opens and calls fail immediately with
+CircuitOpenError, so the authorizer can answer from stale cached decisions
+(or fail closed) without waiting. After `reset_seconds` the breaker lets
+`half_open_max_calls` probe calls through: a success closes it, a failure
+opens it again for another `reset_seconds`.
+
+Only errors for which `is_failure(error)` is true count; client errors such
+as a ValidationException say nothing about AVP's health.
+"""
+
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the engine while the breaker is open."""
+
+
+class CircuitBreaker:
+    """Thread-safe consecutive-failure circuit breaker (failure_threshold <= 0 disables)."""
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 10.0,
+                 half_open_max_calls: int = 1, is_failure=None):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.half_open_max_calls = max(1, half_open_max_calls)
+        self.is_failure = is_failure or (lambda error: True)
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self.consecutive_failures = 0
+        self.trips = 0
+        self.rejected = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.failure_threshold > 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def _before_call(self):
+        with self._lock:
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self.reset_seconds:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"Circuit open after {self.consecutive_failures} consecutive failures")
+                self._state = HALF_OPEN
+                self._half_open_calls = 0
+            if self._state == HALF_OPEN:
+                if self._half_open_calls >= self.half_open_max_calls:
+                    self.rejected += 1
+                    raise CircuitOpenError("Circuit half-open, probe call in progress")
+                self._half_open_calls += 1
+
+    def _on_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self.consecutive_failures = 0
+
+    def _on_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self._state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self.trips += 1
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def _on_ignored(self):
+        with self._lock:
+            if self._state == HALF_OPEN:
+                # The probe got an answer, just not a usable one: let the next one through
+                self._half_open_calls -= 1
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn through the breaker; raises CircuitOpenError while open."""
+        if not self.enabled:
+            return fn(*args, **kwargs)
+        self._before_call()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if self.is_failure(e):
+                self._on_failure()
+            else:
+                self._on_ignored()
+            raise
+        self._on_success()
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self._state,
+                "state_code": _STATE_CODES[self._state],
+                "open": self._state == OPEN,
+                "consecutive_failures": self.consecutive_failures,
+                "trips": self.trips,
+                "rejected": self.rejected,
+            }
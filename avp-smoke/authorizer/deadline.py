@@ -0,0 +1,271 @@
+"""
+Per-check deadlines and hedged IsAuthorized calls.
+
+Envoy stops waiting for a check after its ext_authz timeout, but botocore
+knows nothing about it: with AVP_READ_TIMEOUT=5 and AVP_MAX_ATTEMPTS=3 one
+IsAuthorized can take well over 10s, and its answer is written to a
+connection nobody reads anymore. So every check gets a Deadline, the
+earliest of
+
+- the configured budget (AVP_DEADLINE_MS) from the start of the check
+- the time the caller says it still waits: the x-envoy-expected-rq-timeout-ms
+  header over HTTP, the gRPC deadline (grpc-timeout) over gRPC; in Lambda the
+  remaining invocation time caps either of them but sets no deadline alone
+
+minus a margin to write the answer. AvpCaller runs the engine call on its
+own thread pool and waits for it until the deadline; past it the call fails
+with DeadlineExceeded, which the check handles like any other AVP failure
+(stale decision, else AVP_FAILURE_STATUS) while Envoy still listens.
+
+A botocore before-send hook (install()) keeps late attempts from costing
+AVP calls: once the check has its answer or its deadline has passed no
+further attempt is sent, and a retry is skipped when less time is left than
+a typical call takes (median of recent calls), since its answer would come
+too late anyway.
+
+With hedging, when the first call has not answered after the hedge delay
+(the `hedge_quantile` latency of recent calls, at least min_hedge_delay) an
+identical second call is sent and the first answer wins. At the default
+p95 that is about 5% more calls for the checks stuck on a slow connection
+or AVP host; at most MAX_HEDGE_RATIO of recent calls are hedged, so a
+slowdown of AVP as a whole doesn't double its load. Hedging only applies to
+direct IsAuthorized calls: a micro-batched check (avp_batcher.py) waits for
+its batch.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Calls whose latencies set the hedge delay and the late-retry threshold
+LATENCY_WINDOW = 512
+# Latencies needed before hedging starts (the p95 of fewer is noise)
+MIN_SAMPLES = 20
+# The hedge delay and median are recomputed every this many calls
+REFRESH_EVERY = 32
+# Most of the recent calls that may be hedged
+MAX_HEDGE_RATIO = 0.1
+
+_local = threading.local()
+
+
+class DeadlineExceeded(Exception):
+    """The check's deadline passed before the policy engine answered."""
+
+
+class _Abandoned(Exception):
+    """An attempt of a call that no longer needs an answer (not sent)."""
+
+
+class Deadline:
+    """Point in time.monotonic() by which a check must have its answer."""
+
+    __slots__ = ("expires_at",)
+
+    def __init__(self, expires_at: float):
+        self.expires_at = expires_at
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+def check_deadline(started_at: float, budget_ms: float = 0, remaining_ms: float = None, margin_ms: float = 0):
+    """
+    Deadline of a check started at started_at (time.monotonic()).
+
+    The earliest of started_at + budget_ms (0 disables) and now +
+    remaining_ms (what the caller still waits, None when unknown), minus
+    margin_ms. None when neither applies.
+    """
+    limits = []
+    if budget_ms > 0:
+        limits.append(started_at + budget_ms / 1000)
+    if remaining_ms is not None:
+        limits.append(time.monotonic() + remaining_ms / 1000)
+    if not limits:
+        return None
+    return Deadline(min(limits) - margin_ms / 1000)
+
+
+def parse_timeout_ms(value) -> float:
+    """Milliseconds of a timeout header such as x-envoy-expected-rq-timeout-ms, None if absent/invalid."""
+    if not value:
+        return None
+    try:
+        timeout_ms = float(value)
+    except ValueError:
+        return None
+    return timeout_ms if timeout_ms > 0 else None
+
+
+class _Call:
+    """State of one check's engine call, shared by its attempts (read by the botocore hook)."""
+
+    __slots__ = ("deadline", "done")
+
+    def __init__(self, deadline: Deadline):
+        self.deadline = deadline
+        self.done = False
+
+
+class AvpCaller:
+    """Runs IsAuthorized calls within their check's deadline, optionally hedged."""
+
+    def __init__(self, max_workers: int = 16, hedge: bool = False, hedge_quantile: float = 0.95,
+                 min_hedge_delay: float = 0.005):
+        self.max_workers = max_workers
+        self.hedge = hedge
+        self.hedge_quantile = min(max(hedge_quantile, 0.5), 0.999)
+        self.min_hedge_delay = min_hedge_delay
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._hedge_flags = deque(maxlen=LATENCY_WINDOW)
+        self._hedge_delay = None
+        self._median = None
+        self._observed = 0
+        self._stats_lock = threading.Lock()
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.hedges_capped = 0
+        self.deadline_exceeded = 0
+        self.attempts_abandoned = 0
+        self.late_retries_skipped = 0
+        self._start()
+        # A forked worker (server.py pre-fork mode) inherits no pool threads
+        os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        self._pool = ThreadPoolExecutor(max_workers=max(self.max_workers, 1), thread_name_prefix="avp-call")
+
+    def install(self, client):
+        """Register the before-send hook on a botocore Verified Permissions client."""
+        client.meta.events.register("before-send.verifiedpermissions", self._before_send)
+
+    def _before_send(self, request, **kwargs):
+        call = getattr(_local, "call", None)
+        if call is None:
+            return None
+        if call.done:
+            with self._stats_lock:
+                self.attempts_abandoned += 1
+            raise _Abandoned("Check already answered")
+        if call.deadline is None:
+            return None
+        remaining = call.deadline.remaining()
+        if remaining <= 0:
+            with self._stats_lock:
+                self.attempts_abandoned += 1
+            raise DeadlineExceeded("Deadline passed before sending the AVP request")
+        # botocore numbers the attempts of a call: "amz-sdk-request: attempt=2; max=3"
+        header = request.headers.get("amz-sdk-request") or ""
+        if isinstance(header, bytes):
+            header = header.decode()
+        retry = bool(header) and "attempt=1;" not in f"{header};"
+        if retry and self._median is not None and remaining < self._median:
+            with self._stats_lock:
+                self.late_retries_skipped += 1
+            raise DeadlineExceeded(f"Retry skipped, {remaining * 1000:.0f}ms left")
+        return None
+
+    def _attempt(self, fn, request: dict, call: _Call):
+        _local.call = call
+        start = time.monotonic()
+        try:
+            result = fn(**request)
+        finally:
+            _local.call = None
+        self._observe(time.monotonic() - start)
+        return result
+
+    def _observe(self, seconds: float):
+        with self._stats_lock:
+            self._latencies.append(seconds)
+            self._observed += 1
+            if len(self._latencies) < MIN_SAMPLES:
+                return
+            if self._hedge_delay is None or self._observed % REFRESH_EVERY == 0:
+                values = sorted(self._latencies)
+                self._median = values[len(values) // 2]
+                self._hedge_delay = max(
+                    values[min(len(values) - 1, int(len(values) * self.hedge_quantile))], self.min_hedge_delay
+                )
+
+    def _may_hedge(self) -> bool:
+        # _hedge_flags holds a 0 per recent call and a 1 per recent hedge
+        with self._stats_lock:
+            if sum(self._hedge_flags) >= MAX_HEDGE_RATIO * len(self._hedge_flags):
+                self.hedges_capped += 1
+                return False
+            self.hedged += 1
+            self._hedge_flags.append(1)
+            return True
+
+    def call(self, fn, request: dict, deadline: Deadline = None) -> dict:
+        """
+        Return fn(**request) within deadline (DeadlineExceeded past it).
+
+        Without a deadline and hedging fn runs on the calling thread as before.
+        """
+        if deadline is None and not self.hedge:
+            return fn(**request)
+        if deadline is not None and deadline.expired:
+            with self._stats_lock:
+                self.deadline_exceeded += 1
+            raise DeadlineExceeded("Deadline passed before calling AVP")
+
+        with self._stats_lock:
+            self.calls += 1
+            self._hedge_flags.append(0)
+            hedge_delay = self._hedge_delay if self.hedge else None
+        call = _Call(deadline)
+        first = self._pool.submit(self._attempt, fn, request, call)
+        pending = {first}
+        hedge_at = time.monotonic() + hedge_delay if hedge_delay is not None else None
+        error = None
+        try:
+            while pending:
+                wait_until = [t for t in (hedge_at, deadline and deadline.expires_at) if t is not None]
+                timeout = max(min(wait_until) - time.monotonic(), 0) if wait_until else None
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if future is not first:
+                            with self._stats_lock:
+                                self.hedge_wins += 1
+                        return future.result()
+                    error = future.exception()
+                if not pending:
+                    break
+                if deadline is not None and deadline.expired:
+                    with self._stats_lock:
+                        self.deadline_exceeded += 1
+                    raise DeadlineExceeded(f"No AVP answer within the deadline ({len(pending)} call(s) pending)")
+                if hedge_at is not None and time.monotonic() >= hedge_at:
+                    hedge_at = None
+                    if error is None and self._may_hedge():
+                        pending.add(self._pool.submit(self._attempt, fn, request, call))
+            raise error
+        finally:
+            call.done = True
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = {
+                "calls": self.calls,
+                "hedged": self.hedged,
+                "hedge_wins": self.hedge_wins,
+                "hedges_capped": self.hedges_capped,
+                "deadline_exceeded": self.deadline_exceeded,
+                "attempts_abandoned": self.attempts_abandoned,
+                "late_retries_skipped": self.late_retries_skipped,
+            }
+            if self._hedge_delay is not None:
+                stats["hedge_delay_ms"] = round(self._hedge_delay * 1000, 3)
+                stats["latency_p50_ms"] = round(self._median * 1000, 3)
+        return stats
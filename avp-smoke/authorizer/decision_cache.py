@@ -0,0 +1,305 @@
+"""
+Policy-aware decision cache for the AVP authorizer.
+
+Our Cedar policies only look at the principal's groups, the action and the
+resource, so decisions are cached by (sorted group set, method, path,
+policy store) instead of by subject: every user holding the same roles
+shares the same entries. Entries are evicted LRU-first, expire after a TTL
+and never outlive the `exp` of the token that produced them.
+
+Decisions of the local Cedar engine add its policy key to the cache key:
+the snapshot version and whatever else the loaded policies read (token
+claims in the context such as `custom:groups`, the subject, the host), see
+PolicySnapshot.cache_key(). A token then never gets a decision made for
+different claims, and a policy reload starts from fresh entries.
+
+With max_stale_seconds, expired entries are kept that much longer for
+get_stale(): when the policy engine fails (or its circuit breaker is open)
+the last known decision is served instead of an error.
+
+SharedDecisionCache has the same interface but lives in shared memory, so
+the pre-fork worker processes of one pod (server.py, SERVER_PROCESSES)
+share their hits.
+"""
+
+import hashlib
+import mmap
+import multiprocessing
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+def decision_key(groups, method: str, path: str, policy_store_id: str, policy_key: tuple = None) -> tuple:
+    """Build the normalized cache key for an authorization question (policy_key: local engine's)."""
+    return (tuple(sorted(set(groups))), method.upper(), path, policy_store_id, policy_key)
+
+
+class DecisionCache:
+    """Thread-safe LRU + TTL cache of AVP decisions."""
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 60.0, max_stale_seconds: float = 0.0):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.max_stale_seconds = max(0.0, max_stale_seconds)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale_hits = 0
+        self.stale_misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl_seconds > 0
+
+    def get(self, key: tuple) -> Optional[str]:
+        """Return the cached decision for key, or None on miss/expiry."""
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            decision, expires_at = entry
+            if expires_at <= now:
+                if expires_at + self.max_stale_seconds <= now:
+                    del self._entries[key]
+                    self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return decision
+
+    def get_stale(self, key: tuple) -> Optional[str]:
+        """Return the decision for key even if expired, up to max_stale_seconds past expiry."""
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] + self.max_stale_seconds <= now:
+                self.stale_misses += 1
+                return None
+            self.stale_hits += 1
+            return entry[0]
+
+    def put(self, key: tuple, decision: str, token_exp=None):
+        """Store a decision, capped at the token expiration if given."""
+        if not self.enabled:
+            return
+
+        expires_at = time.time() + self.ttl_seconds
+        if token_exp:
+            expires_at = min(expires_at, float(token_exp))
+
+        with self._lock:
+            self._entries[key] = (decision, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Return hit/miss/eviction counters and current size."""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "stale_hits": self.stale_hits,
+                "stale_misses": self.stale_misses,
+            }
+
+
+# Shared-memory slot: key fingerprint, decision code, expiry (epoch seconds)
+_SLOT = struct.Struct("<16sB7xd")
+_DECISION_CODES = {"ALLOW": 1, "DENY": 2}
+_DECISIONS = {code: decision for decision, code in _DECISION_CODES.items()}
+_EMPTY_FINGERPRINT = bytes(16)
+
+# Per-stripe counters, in stats() order
+_COUNTERS = ("hits", "misses", "evictions", "expirations", "stale_hits", "stale_misses", "lock_timeouts")
+_HITS, _MISSES, _EVICTIONS, _EXPIRATIONS, _STALE_HITS, _STALE_MISSES, _LOCK_TIMEOUTS = range(len(_COUNTERS))
+
+
+def _fingerprint(key: tuple) -> bytes:
+    return hashlib.blake2b(repr(key).encode(), digest_size=16).digest()
+
+
+class SharedDecisionCache:
+    """
+    DecisionCache over an anonymous shared mapping, for forked workers.
+
+    A fixed-size, set-associative hash table: each key hashes to a bucket of
+    `ways` slots, and a full bucket replaces its entry closest to (or
+    furthest past) expiry instead of the least recently used one. Buckets
+    are guarded by `stripes` process-shared locks, which also hold the
+    counters of their buckets. The mapping and the locks must be created
+    before the workers are forked. A worker killed while holding a lock
+    leaves that stripe locked; lookups there give up after
+    LOCK_TIMEOUT_SECONDS and count as misses (lock_timeouts).
+    """
+
+    LOCK_TIMEOUT_SECONDS = 0.05
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 60.0, max_stale_seconds: float = 0.0,
+                 ways: int = 8, stripes: int = 64):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.max_stale_seconds = max(0.0, max_stale_seconds)
+        self.ways = ways
+        self.buckets = max(1, -(-max_size // ways))
+        self.stripes = min(stripes, self.buckets)
+        self._counters_size = self.stripes * len(_COUNTERS) * 8
+        self._memory = mmap.mmap(-1, self._counters_size + self.buckets * ways * _SLOT.size)
+        self._counters = memoryview(self._memory)[:self._counters_size].cast("q")
+        self._locks = [multiprocessing.Lock() for _ in range(self.stripes)]
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl_seconds > 0
+
+    def _locate(self, key: tuple) -> tuple:
+        fingerprint = _fingerprint(key)
+        bucket = int.from_bytes(fingerprint[:8], "little") % self.buckets
+        offset = self._counters_size + bucket * self.ways * _SLOT.size
+        return fingerprint, offset, bucket % self.stripes
+
+    def _count(self, stripe: int, counter: int):
+        self._counters[stripe * len(_COUNTERS) + counter] += 1
+
+    def _acquire(self, stripe: int) -> bool:
+        if self._locks[stripe].acquire(timeout=self.LOCK_TIMEOUT_SECONDS):
+            return True
+        self._count(stripe, _LOCK_TIMEOUTS)  # unlocked, but only a diagnostic
+        return False
+
+    def _find(self, fingerprint: bytes, offset: int):
+        end = offset + self.ways * _SLOT.size
+        slot = self._memory.find(fingerprint, offset, end)
+        while slot >= 0 and (slot - offset) % _SLOT.size:
+            # Matched across field boundaries, not a slot's fingerprint
+            slot = self._memory.find(fingerprint, slot + 1, end)
+        return slot if slot >= 0 else None
+
+    def get(self, key: tuple) -> Optional[str]:
+        """Return the cached decision for key, or None on miss/expiry."""
+        if not self.enabled:
+            return None
+
+        fingerprint, offset, stripe = self._locate(key)
+        now = time.time()
+        if not self._acquire(stripe):
+            return None
+        try:
+            slot = self._find(fingerprint, offset)
+            if slot is None:
+                self._count(stripe, _MISSES)
+                return None
+
+            _, code, expires_at = _SLOT.unpack_from(self._memory, slot)
+            if expires_at <= now:
+                if expires_at + self.max_stale_seconds <= now:
+                    _SLOT.pack_into(self._memory, slot, _EMPTY_FINGERPRINT, 0, 0.0)
+                    self._count(stripe, _EXPIRATIONS)
+                self._count(stripe, _MISSES)
+                return None
+
+            self._count(stripe, _HITS)
+            return _DECISIONS.get(code)
+        finally:
+            self._locks[stripe].release()
+
+    def get_stale(self, key: tuple) -> Optional[str]:
+        """Return the decision for key even if expired, up to max_stale_seconds past expiry."""
+        if not self.enabled:
+            return None
+
+        fingerprint, offset, stripe = self._locate(key)
+        now = time.time()
+        if not self._acquire(stripe):
+            return None
+        try:
+            slot = self._find(fingerprint, offset)
+            if slot is not None:
+                _, code, expires_at = _SLOT.unpack_from(self._memory, slot)
+                if expires_at + self.max_stale_seconds > now:
+                    self._count(stripe, _STALE_HITS)
+                    return _DECISIONS.get(code)
+            self._count(stripe, _STALE_MISSES)
+            return None
+        finally:
+            self._locks[stripe].release()
+
+    def put(self, key: tuple, decision: str, token_exp=None):
+        """Store a decision, capped at the token expiration if given."""
+        code = _DECISION_CODES.get(decision)
+        if not self.enabled or code is None:
+            return
+
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        if token_exp:
+            expires_at = min(expires_at, float(token_exp))
+
+        fingerprint, offset, stripe = self._locate(key)
+        if not self._acquire(stripe):
+            return
+        try:
+            slot = self._find(fingerprint, offset)
+            if slot is None:
+                # Free slot, else the one closest to (or furthest past) expiry
+                victim, victim_expires = None, None
+                for candidate in range(offset, offset + self.ways * _SLOT.size, _SLOT.size):
+                    _, candidate_code, candidate_expires = _SLOT.unpack_from(self._memory, candidate)
+                    if not candidate_code:
+                        victim, victim_expires = candidate, None
+                        break
+                    if victim is None or candidate_expires < victim_expires:
+                        victim, victim_expires = candidate, candidate_expires
+                if victim_expires is not None and victim_expires + self.max_stale_seconds > now:
+                    self._count(stripe, _EVICTIONS)
+                slot = victim
+            _SLOT.pack_into(self._memory, slot, fingerprint, code, expires_at)
+        finally:
+            self._locks[stripe].release()
+
+    def clear(self):
+        for lock in self._locks:
+            lock.acquire()
+        try:
+            self._memory[self._counters_size:] = bytes(len(self._memory) - self._counters_size)
+        finally:
+            for lock in self._locks:
+                lock.release()
+
+    def stats(self) -> dict:
+        """Return hit/miss/eviction counters of all processes and current size."""
+        counters = self._counters.tolist()
+        stats = {"size": 0, "max_size": self.buckets * self.ways}
+        for index, name in enumerate(_COUNTERS):
+            stats[name] = sum(counters[index::len(_COUNTERS)])
+        # Unlocked scan: approximate under concurrent puts, fine for a gauge
+        for _, code, _ in _SLOT.iter_unpack(self._memory[self._counters_size:]):
+            if code:
+                stats["size"] += 1
+        return stats
@@ -0,0 +1,165 @@
+"""
+Structured, sampled decision logging for the AVP authorizer.
+
+The text log format writes several INFO lines per check (Auth check, token
+subject, decision, determining policies) from the request thread. With
+LOG_FORMAT=json each check instead produces one decision record, and every
+other log line is a JSON object too:
+
+    {"ts": "2024-05-01T12:00:00.123+00:00", "level": "INFO", "event": "decision",
+     "decision": "DENY", "status": 403, "method": "GET", "path": "/orders/123",
+     "host": "api.example.com", "token": "9f2c0b...", "subject": "user-1",
+     "groups": ["admin"], "route": "/orders/{id}", "source": "AVP",
+     "policies": ["policy-..."], "reason": "Access denied by policy", "duration_ms": 12.3}
+
+ALLOW records are kept with probability `allow_sample_rate` and then carry
+"sample_rate" so counts can be scaled back; denials, 401s and errors are
+always logged.
+
+AsyncLogHandler takes formatting and writing off the request path: the
+request thread only appends the LogRecord to a bounded queue, a background
+thread formats and writes it, and when the queue is full the record is
+dropped and counted instead of blocking the check.
+"""
+
+import json
+import logging
+import os
+import queue
+import random
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Logger of the per-check lines; silenced below ERROR when decision records replace them
+CHECK_LOGGER = "authz.check"
+# Logger of the decision records
+DECISION_LOGGER = "authz.decision"
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; decision records are written as their fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+        }
+        fields = getattr(record, "decision_record", None)
+        if fields is not None:
+            data.update(fields)
+        else:
+            data["logger"] = record.name
+            data["message"] = record.getMessage()
+            if record.exc_info:
+                data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str, separators=(",", ":"))
+
+
+class AsyncLogHandler(QueueHandler):
+    """QueueHandler in front of the `targets` handlers; drops (and counts) records when its queue is full."""
+
+    def __init__(self, targets: list, queue_size: int = 10000):
+        super().__init__(None)
+        self.targets = targets
+        self.queue_size = queue_size
+        self._stats_lock = threading.Lock()
+        self.dropped = 0
+        self._start()
+        # Pre-fork workers (server.py) inherit the queue but not the writer thread
+        os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        self.queue = queue.Queue(self.queue_size)
+        self.listener = QueueListener(self.queue, *self.targets, respect_handler_level=True)
+        self.listener.start()
+        self._running = True
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Same process: no need to pre-format or strip the record for pickling,
+        # the writer thread formats it
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped += 1
+
+    def close(self):
+        """Write out the queued records and stop the writer thread (logging.shutdown() calls this)."""
+        if self._running:
+            self._running = False
+            try:
+                self.listener.stop()
+            except queue.Full:
+                pass
+        super().close()
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {"queued": self.queue.qsize(), "queue_size": self.queue_size, "dropped": self.dropped}
+
+
+def configure(log_format: str = "text", queue_size: int = 0):
+    """
+    Apply LOG_FORMAT to the root logger's handlers.
+
+    With log_format "json" the handlers get a JsonFormatter and the per-check
+    lines of CHECK_LOGGER are limited to errors. With queue_size > 0 the
+    handlers move behind an AsyncLogHandler, which is returned (else None).
+    """
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    if log_format == "json":
+        formatter = JsonFormatter()
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        logging.getLogger(CHECK_LOGGER).setLevel(logging.ERROR)
+    if queue_size <= 0 or not handlers:
+        return None
+
+    async_handler = AsyncLogHandler(handlers, queue_size)
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(async_handler)
+    return async_handler
+
+
+class DecisionLog:
+    """Writes one sampled decision record per check (no-op unless enabled)."""
+
+    def __init__(self, enabled: bool, allow_sample_rate: float = 1.0):
+        self.logger = logging.getLogger(DECISION_LOGGER)
+        self.enabled = enabled
+        self.allow_sample_rate = min(max(allow_sample_rate, 0.0), 1.0)
+        self._stats_lock = threading.Lock()
+        self.records = 0
+        self.sampled_out = 0
+
+    def log(self, status_code: int, reason: str, fields: dict, duration_ms: float):
+        """Log the decision of one check; fields are method, path, subject, source, ..."""
+        if not self.enabled:
+            return
+        if status_code == 200 and self.allow_sample_rate < 1.0:
+            if random.random() >= self.allow_sample_rate:
+                with self._stats_lock:
+                    self.sampled_out += 1
+                return
+        with self._stats_lock:
+            self.records += 1
+        record = {"event": "decision", "decision": "ALLOW" if status_code == 200 else "DENY", "status": status_code}
+        # Copied, not annotated: the caller hands the same fields to the traffic capture
+        record.update(fields)
+        if status_code == 200 and self.allow_sample_rate < 1.0:
+            record["sample_rate"] = self.allow_sample_rate
+        if reason:
+            record["reason"] = reason
+        record["duration_ms"] = round(duration_ms, 3)
+        level = logging.ERROR if status_code >= 500 else logging.INFO
+        self.logger.log(level, "decision", extra={"decision_record": record})
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {"records": self.records, "sampled_out": self.sampled_out}
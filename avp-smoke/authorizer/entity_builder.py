@@ -0,0 +1,176 @@
+"""
+Allocation-light construction of IsAuthorized requests.
+
+The entity list sent to AVP is made of fragments that repeat across
+requests: one entity per group, the user's `parents` list, the user entity
+(for a given token) and the resource entity (for a given method/path/host,
+or per route template when the check carries a RouteIndex route).
+EntityBuilder builds each fragment once and reuses it, so a request for a
+user with many groups costs a handful of dict lookups and one list
+concatenation instead of rebuilding the whole nested dict tree.
+
+Fragments are shared between requests and threads: they must be treated as
+read-only (botocore, the batcher and the local Cedar engine only read them).
+"""
+
+import sys
+
+
+class CheckRequest:
+    """Compact representation of one ext-authz check."""
+
+    __slots__ = ("method", "path", "host", "subject", "issuer", "groups", "route")
+
+    def __init__(self, method: str, path: str, host: str, subject: str, issuer: str, groups: tuple,
+                 route=None):
+        self.method = method
+        self.path = path
+        self.host = host
+        self.subject = subject
+        self.issuer = issuer
+        self.groups = groups
+        self.route = route
+
+
+class _BoundedCache(dict):
+    """Dict that is cleared when it grows past max_size (cheap, no LRU bookkeeping)."""
+
+    __slots__ = ("max_size",)
+
+    def __init__(self, max_size: int):
+        super().__init__()
+        self.max_size = max_size
+
+    def store(self, key, value):
+        if len(self) >= self.max_size:
+            self.clear()
+        self[key] = value
+        return value
+
+
+class EntityBuilder:
+    """Builds is_authorized kwargs from CheckRequests, reusing entity fragments."""
+
+    def __init__(self, policy_store_id: str, namespace: str = "ApiAccess", max_cached: int = 4096):
+        self.policy_store_id = policy_store_id
+        self.user_type = sys.intern(f"{namespace}::User")
+        self.group_type = sys.intern(f"{namespace}::Group")
+        self.resource_type = sys.intern(f"{namespace}::Resource")
+        self.action_type = sys.intern(f"{namespace}::Action")
+        self._group_entities = _BoundedCache(max_cached)
+        self._group_sets = _BoundedCache(max_cached)
+        self._users = _BoundedCache(max_cached)
+        self._resources = _BoundedCache(max_cached)
+        self._actions = _BoundedCache(64)
+
+    def _group_entity(self, group: str) -> dict:
+        entity = self._group_entities.get(group)
+        if entity is None:
+            group = sys.intern(group)
+            entity = self._group_entities.store(group, {
+                "identifier": {"entityType": self.group_type, "entityId": group},
+                "attributes": {"name": {"string": group}},
+            })
+        return entity
+
+    def _group_set(self, groups: tuple) -> tuple:
+        """Return (parents, group entities) for a groups tuple."""
+        fragment = self._group_sets.get(groups)
+        if fragment is None:
+            entities = [self._group_entity(g) for g in groups]
+            parents = [e["identifier"] for e in entities]
+            fragment = self._group_sets.store(groups, (parents, entities))
+        return fragment
+
+    def _user(self, subject: str, issuer: str, groups: tuple) -> tuple:
+        """Return (principal, user entity, group entities)."""
+        key = (subject, issuer, groups)
+        fragment = self._users.get(key)
+        if fragment is None:
+            parents, group_entities = self._group_set(groups)
+            principal = {"entityType": self.user_type, "entityId": subject}
+            entity = {
+                "identifier": principal,
+                "attributes": {
+                    "sub": {"string": subject},
+                    "iss": {"string": issuer},
+                },
+                "parents": parents,
+            }
+            fragment = self._users.store(key, (principal, entity, group_entities))
+        return fragment
+
+    def _resource(self, method: str, path: str, host: str) -> tuple:
+        """Return (resource identifier, resource entity)."""
+        key = (method, path, host)
+        fragment = self._resources.get(key)
+        if fragment is None:
+            identifier = {"entityType": self.resource_type, "entityId": f"resource:{path}"}
+            entity = {
+                "identifier": identifier,
+                "attributes": {
+                    "path": {"string": path},
+                    "method": {"string": method},
+                    "host": {"string": host},
+                },
+            }
+            fragment = self._resources.store(key, (identifier, entity))
+        return fragment
+
+    def _route_resource(self, route, method: str, host: str) -> tuple:
+        """Return (resource identifier, resource entity) for a route template."""
+        key = (route, method, host)
+        fragment = self._resources.get(key)
+        if fragment is None:
+            identifier = {"entityType": route.resource_type, "entityId": route.template}
+            entity = {
+                "identifier": identifier,
+                "attributes": {
+                    "path": {"string": route.template},
+                    "method": {"string": method},
+                    "host": {"string": host},
+                },
+            }
+            fragment = self._resources.store(key, (identifier, entity))
+        return fragment
+
+    def _route_action(self, route) -> dict:
+        key = (route.action_type, route.action)
+        action = self._actions.get(key)
+        if action is None:
+            action = self._actions.store(key, {"actionType": route.action_type, "actionId": route.action})
+        return action
+
+    def _action(self, method: str) -> dict:
+        action = self._actions.get(method)
+        if action is None:
+            action = self._actions.store(
+                method, {"actionType": self.action_type, "actionId": sys.intern(method)}
+            )
+        return action
+
+    def build(self, check: CheckRequest) -> dict:
+        """Return the kwargs for avp_client.is_authorized (read-only)."""
+        principal, user_entity, group_entities = self._user(check.subject, check.issuer, check.groups)
+        route = check.route
+        if route is None:
+            resource, resource_entity = self._resource(check.method, check.path, check.host)
+            action = self._action(check.method)
+        else:
+            resource, resource_entity = self._route_resource(route, check.method, check.host)
+            action = self._route_action(route)
+        return {
+            "policyStoreId": self.policy_store_id,
+            "principal": principal,
+            "action": action,
+            "resource": resource,
+            "entities": {"entityList": [user_entity, *group_entities, resource_entity]},
+        }
+
+    def stats(self) -> dict:
+        return {
+            "group_entities": len(self._group_entities),
+            "group_sets": len(self._group_sets),
+            "users": len(self._users),
+            "resources": len(self._resources),
+        }
@@ -0,0 +1,171 @@
+"""
+Envoy ext_authz v3 gRPC server for the AVP authorizer.
+
+Implements envoy.service.auth.v3.Authorization/Check on top of the same
+check logic as the HTTP server (server.check_request), so both protocols
+answer with the same decisions and headers. Envoy keeps one long-lived
+HTTP/2 connection per authorizer endpoint and multiplexes checks on it,
+and the request attributes arrive as fields instead of forwarded
+x-original-* headers.
+
+The messages come from the vendored protos in protos/. The Docker image
+compiles them at build time into generated/; when that directory is
+missing (local runs) they are compiled on first use with grpcio-tools.
+"""
+
+import importlib
+import logging
+import os
+import sys
+import tempfile
+import time
+from concurrent import futures
+
+import grpc
+
+logger = logging.getLogger(__name__)
+
+PROTO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "protos")
+GENERATED_DIR = os.environ.get(
+    "GRPC_GENERATED_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "generated")
+)
+
+# HTTP status of a check -> google.rpc.Code of the CheckResponse
+_RPC_CODES = {
+    200: 0,   # OK
+    401: 16,  # UNAUTHENTICATED
+    403: 7,   # PERMISSION_DENIED
+}
+_RPC_UNAVAILABLE = 14
+
+# time_remaining() of a call without a deadline: practically infinite
+_NO_DEADLINE_SECONDS = 86400
+
+
+def _compile_protos(output_dir: str):
+    """Compile the vendored protos with grpcio-tools into output_dir."""
+    import grpc_tools
+    from grpc_tools import protoc
+
+    protos = []
+    for root, _, files in os.walk(PROTO_DIR):
+        protos.extend(
+            os.path.relpath(os.path.join(root, f), PROTO_DIR) for f in files if f.endswith(".proto")
+        )
+    well_known = os.path.join(os.path.dirname(grpc_tools.__file__), "_proto")
+    result = protoc.main([
+        "grpc_tools.protoc", f"-I{PROTO_DIR}", f"-I{well_known}",
+        f"--python_out={output_dir}", f"--grpc_python_out={output_dir}", *protos
+    ])
+    if result != 0:
+        raise RuntimeError(f"protoc failed compiling {PROTO_DIR} (exit {result})")
+
+
+def _load_protos() -> tuple:
+    """Import the generated ext_authz modules, compiling the protos if needed."""
+    if os.path.isdir(GENERATED_DIR) and GENERATED_DIR not in sys.path:
+        sys.path.insert(0, GENERATED_DIR)
+    try:
+        return _import_protos()
+    except ImportError:
+        pass
+    output_dir = tempfile.mkdtemp(prefix="avp-ext-authz-protos-")
+    logger.info(f"Compiling ext_authz protos from {PROTO_DIR}")
+    _compile_protos(output_dir)
+    sys.path.insert(0, output_dir)
+    importlib.invalidate_caches()
+    return _import_protos()
+
+
+def _import_protos() -> tuple:
+    from envoy.config.core.v3 import base_pb2
+    from envoy.service.auth.v3 import external_auth_pb2, external_auth_pb2_grpc
+    from envoy.type.v3 import http_status_pb2
+    from google.rpc import status_pb2
+    return base_pb2, external_auth_pb2, external_auth_pb2_grpc, http_status_pb2, status_pb2
+
+
+base_pb2, external_auth_pb2, external_auth_pb2_grpc, http_status_pb2, status_pb2 = _load_protos()
+
+_OVERWRITE = base_pb2.HeaderValueOption.OVERWRITE_IF_EXISTS_OR_ADD
+
+
+def _header_options(headers: dict) -> list:
+    return [
+        base_pb2.HeaderValueOption(
+            header=base_pb2.HeaderValue(key=name, value=value),
+            append_action=_OVERWRITE
+        )
+        for name, value in headers.items()
+    ]
+
+
+class AuthorizationServicer(external_auth_pb2_grpc.AuthorizationServicer):
+    """
+    Authorization/Check backed by an HTTP-style check function.
+
+    check(method, path, host, auth_header, timer, timeout_ms) returns
+    (status code, message, subject) and headers(status code, subject) the
+    headers to send, as server.check_request and server.response_headers do.
+    timeout_ms is what is left of the call's gRPC deadline (Envoy sets it
+    from the ext_authz timeout).
+    """
+
+    def __init__(self, check, headers, metrics):
+        self.check = check
+        self.headers = headers
+        self.metrics = metrics
+
+    def Check(self, request, context):
+        with self.metrics.tracking():
+            timer = self.metrics.timer()
+            http = request.attributes.request.http
+            remaining = context.time_remaining()
+            try:
+                status_code, message, subject = self.check(
+                    http.method or "GET", http.path or "/", http.host,
+                    http.headers.get("authorization", ""), timer,
+                    remaining * 1000 if remaining is not None and remaining < _NO_DEADLINE_SECONDS else None
+                )
+            except Exception as e:
+                logger.error(f"Check error: {e}")
+                status_code, message, subject = 500, "Internal authorization error", None
+
+            start = time.perf_counter()
+            response = self._response(status_code, message, subject)
+            self.metrics.record_response(status_code, time.perf_counter() - start)
+            return response
+
+    def _response(self, status_code: int, message: str, subject: str):
+        headers = self.headers(status_code, subject)
+        if status_code == 200:
+            return external_auth_pb2.CheckResponse(
+                status=status_pb2.Status(code=0),
+                ok_response=external_auth_pb2.OkHttpResponse(headers=_header_options(headers))
+            )
+        return external_auth_pb2.CheckResponse(
+            status=status_pb2.Status(code=_RPC_CODES.get(status_code, _RPC_UNAVAILABLE), message=message),
+            denied_response=external_auth_pb2.DeniedHttpResponse(
+                status=http_status_pb2.HttpStatus(code=status_code),
+                headers=_header_options({"content-type": "text/plain", **headers}),
+                body=message
+            )
+        )
+
+
+def start_server(port: int, servicer: AuthorizationServicer, max_workers: int, max_pending: int):
+    """
+    Start the gRPC server on port and return it (call stop() to shut down).
+
+    Checks run on max_workers threads; beyond max_workers + max_pending
+    concurrent checks new RPCs fail fast with RESOURCE_EXHAUSTED instead of
+    queueing without bound.
+    """
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=max(max_workers, 1), thread_name_prefix="authz-grpc"),
+        maximum_concurrent_rpcs=max(max_workers, 1) + max(max_pending, 0)
+    )
+    external_auth_pb2_grpc.add_AuthorizationServicer_to_server(servicer, server)
+    server.add_insecure_port(f"[::]:{port}")
+    server.start()
+    return server
@@ -0,0 +1,329 @@
+"""
+JWT signature verification for the AVP authorizer.
+
+Supports HS256 (shared secret), RS256 and ES256 (keys from a JWKS document).
+Everything expensive happens once, outside the request path:
+
+- the HMAC key is turned into a ready `hmac` object that is copied per token
+- JWKS keys are parsed into verifier objects when the document is fetched
+- parsed JOSE headers are memoized (tokens from one issuer share a header)
+
+JwksCache refreshes the key set in the background (or inline when no thread
+is running, as in Lambda) and refetches on an unknown `kid` at most once per
+min_refetch_interval, so a flood of forged kids cannot turn into a flood of
+JWKS requests.
+
+Signatures are checked with the optional `cryptography` package when it is
+installed. Without it RS256 falls back to plain modular exponentiation
+(slower, ~10x) and ES256 keys are skipped.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import math
+import threading
+import time
+import urllib.request
+from typing import Optional
+
+try:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+    from cryptography.hazmat.primitives.asymmetric.utils import encode_dss_signature
+except ImportError:  # ES256 unavailable, RS256 falls back to pure Python
+    ec = None
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_ALGORITHMS = ("HS256", "RS256", "ES256")
+
+# DER DigestInfo prefix for SHA-256 (RFC 8017, section 9.2)
+_SHA256_DIGEST_INFO = bytes.fromhex("3031300d060960864801650304020105000420")
+
+_HEADER_CACHE_SIZE = 64
+
+
+class JwtError(Exception):
+    """Raised when a token fails verification."""
+
+
+def _b64decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def _b64int(segment: str) -> int:
+    return int.from_bytes(_b64decode(segment), "big")
+
+
+def _numeric_claim(claims: dict, name: str):
+    """A NumericDate claim (exp, nbf) or None; JwtError when it is not a finite number."""
+    value = claims.get(name)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise JwtError(f"Malformed {name} claim")
+    return value
+
+
+# ============================================================================
+# Key objects
+# ============================================================================
+
+class _RsaPublicKey:
+    alg = "RS256"
+
+    def __init__(self, n: int, e: int):
+        self.n = n
+        self.e = e
+        self.size = (n.bit_length() + 7) // 8
+        self._padding = b"\x00\x01" + b"\xff" * (self.size - len(_SHA256_DIGEST_INFO) - 35) + b"\x00"
+
+    def verify(self, signature: bytes, message: bytes) -> bool:
+        if len(signature) != self.size:
+            return False
+        decrypted = pow(int.from_bytes(signature, "big"), self.e, self.n)
+        expected = self._padding + _SHA256_DIGEST_INFO + hashlib.sha256(message).digest()
+        return hmac.compare_digest(decrypted.to_bytes(self.size, "big"), expected)
+
+
+class _OpenSslRsaPublicKey:
+    alg = "RS256"
+
+    def __init__(self, n: int, e: int):
+        self._key = rsa.RSAPublicNumbers(e, n).public_key()
+        self._padding = padding.PKCS1v15()
+        self._algorithm = hashes.SHA256()
+
+    def verify(self, signature: bytes, message: bytes) -> bool:
+        try:
+            self._key.verify(signature, message, self._padding, self._algorithm)
+            return True
+        except InvalidSignature:
+            return False
+
+
+class _EcPublicKey:
+    alg = "ES256"
+
+    def __init__(self, x: int, y: int):
+        self._key = ec.EllipticCurvePublicNumbers(x, y, ec.SECP256R1()).public_key()
+        self._algorithm = ec.ECDSA(hashes.SHA256())
+
+    def verify(self, signature: bytes, message: bytes) -> bool:
+        if len(signature) != 64:
+            return False
+        der = encode_dss_signature(int.from_bytes(signature[:32], "big"), int.from_bytes(signature[32:], "big"))
+        try:
+            self._key.verify(der, message, self._algorithm)
+            return True
+        except InvalidSignature:
+            return False
+
+
+def key_from_jwk(jwk: dict):
+    """Build a verifier from a JWK; returns None for unusable keys."""
+    if jwk.get("use", "sig") != "sig":
+        return None
+    kty = jwk.get("kty")
+    if kty == "RSA" and jwk.get("alg", "RS256") == "RS256":
+        key_class = _RsaPublicKey if ec is None else _OpenSslRsaPublicKey
+        return key_class(_b64int(jwk["n"]), _b64int(jwk["e"]))
+    if kty == "EC" and jwk.get("crv") == "P-256" and jwk.get("alg", "ES256") == "ES256":
+        if ec is None:
+            logger.warning(f"Skipping ES256 key {jwk.get('kid')}: 'cryptography' is not installed")
+            return None
+        return _EcPublicKey(_b64int(jwk["x"]), _b64int(jwk["y"]))
+    return None
+
+
+# ============================================================================
+# JWKS cache
+# ============================================================================
+
+class JwksCache:
+    """In-memory key set fetched from a JWKS URL (http(s):// or file://)."""
+
+    def __init__(self, url: str, refresh_interval: float = 300.0,
+                 min_refetch_interval: float = 30.0, timeout: float = 2.0):
+        self.url = url
+        self.refresh_interval = refresh_interval
+        self.min_refetch_interval = min_refetch_interval
+        self.timeout = timeout
+        self._keys = {}
+        self._fetched_at = float("-inf")
+        self._last_attempt = float("-inf")
+        self._lock = threading.Lock()
+        self._background = False
+        self.fetches = 0
+        self.fetch_errors = 0
+        self.kid_misses = 0
+
+    def refresh(self) -> bool:
+        """Fetch and parse the key set; on failure the previous keys are kept."""
+        with self._lock:
+            return self._refresh_locked()
+
+    def _refresh_locked(self) -> bool:
+        self._last_attempt = time.monotonic()
+        try:
+            with urllib.request.urlopen(self.url, timeout=self.timeout) as response:
+                document = json.loads(response.read())
+            keys = {}
+            for jwk in document.get("keys", []):
+                key = key_from_jwk(jwk)
+                if key is not None:
+                    keys[jwk.get("kid")] = key
+        except Exception as e:
+            self.fetch_errors += 1
+            logger.error(f"JWKS fetch from {self.url} failed: {e}")
+            return False
+
+        self._keys = keys
+        self._fetched_at = time.monotonic()
+        self.fetches += 1
+        logger.info(f"Loaded {len(keys)} signing keys from {self.url}")
+        return True
+
+    def _throttled_refresh(self):
+        if time.monotonic() - self._last_attempt < self.min_refetch_interval:
+            return
+        with self._lock:
+            if time.monotonic() - self._last_attempt >= self.min_refetch_interval:
+                self._refresh_locked()
+
+    def maybe_refresh(self):
+        """Refresh inline when the key set is older than refresh_interval."""
+        if time.monotonic() - self._fetched_at >= self.refresh_interval:
+            self._throttled_refresh()
+
+    def get_key(self, kid: Optional[str]):
+        if not self._background:
+            self.maybe_refresh()
+
+        keys = self._keys
+        if kid is None and len(keys) == 1:
+            return next(iter(keys.values()))
+        key = keys.get(kid)
+        if key is None:
+            self.kid_misses += 1
+            self._throttled_refresh()
+            key = self._keys.get(kid)
+        return key
+
+    def start_refresher(self):
+        """Refresh the key set every refresh_interval in a daemon thread."""
+        self._background = True
+
+        def run():
+            while True:
+                time.sleep(self.refresh_interval)
+                self.refresh()
+
+        thread = threading.Thread(target=run, name="jwks-refresher", daemon=True)
+        thread.start()
+        return thread
+
+
+# ============================================================================
+# Verifier
+# ============================================================================
+
+class JwtVerifier:
+    """
+    Verifies signature, issuer, audience, exp/nbf types and nbf of a JWT and returns its claims.
+
+    Any malformed token, header or claim raises JwtError, never another
+    exception. exp itself is checked by the caller (parse_token).
+    """
+
+    def __init__(self, hmac_secret: Optional[str] = None, jwks: Optional[JwksCache] = None,
+                 allowed_issuers=(), algorithms=SUPPORTED_ALGORITHMS, leeway: int = 0,
+                 allowed_audiences=()):
+        self._hmac = hmac.new(hmac_secret.encode(), digestmod=hashlib.sha256) if hmac_secret else None
+        self.jwks = jwks
+        self.allowed_issuers = frozenset(i for i in allowed_issuers if i)
+        self.allowed_audiences = frozenset(a for a in allowed_audiences if a)
+        self.algorithms = frozenset(a for a in algorithms if a in SUPPORTED_ALGORITHMS)
+        self.leeway = leeway
+        self._headers = {}
+
+    def _header(self, segment: str) -> dict:
+        header = self._headers.get(segment)
+        if header is None:
+            try:
+                header = json.loads(_b64decode(segment))
+            except ValueError:
+                raise JwtError("Malformed token header")
+            if not isinstance(header, dict):
+                raise JwtError("Malformed token header")
+            if len(self._headers) >= _HEADER_CACHE_SIZE:
+                self._headers.clear()
+            self._headers[segment] = header
+        return header
+
+    def verify(self, token: str) -> dict:
+        parts = token.split(".")
+        if len(parts) != 3:
+            raise JwtError("Token must have three segments")
+
+        header = self._header(parts[0])
+        alg = header.get("alg")
+        if not isinstance(alg, str) or alg not in self.algorithms:
+            raise JwtError(f"Algorithm not allowed: {alg}")
+        kid = header.get("kid")
+        if kid is not None and not isinstance(kid, str):
+            raise JwtError("Malformed token header")
+
+        try:
+            signature = _b64decode(parts[2])
+            signing_input = f"{parts[0]}.{parts[1]}".encode("ascii")
+        except ValueError:
+            raise JwtError("Malformed token")
+
+        if alg == "HS256":
+            if self._hmac is None:
+                raise JwtError("HS256 secret not configured")
+            mac = self._hmac.copy()
+            mac.update(signing_input)
+            valid = hmac.compare_digest(mac.digest(), signature)
+        else:
+            key = self.jwks.get_key(kid) if self.jwks else None
+            if key is None or key.alg != alg:
+                raise JwtError(f"No {alg} key for kid {kid}")
+            valid = key.verify(signature, signing_input)
+        if not valid:
+            raise JwtError("Invalid signature")
+
+        try:
+            claims = json.loads(_b64decode(parts[1]))
+        except ValueError:
+            raise JwtError("Malformed token payload")
+        if not isinstance(claims, dict):
+            raise JwtError("Malformed token payload")
+
+        issuer = claims.get("iss")
+        if self.allowed_issuers and (not isinstance(issuer, str) or issuer not in self.allowed_issuers):
+            raise JwtError(f"Issuer not allowed: {issuer}")
+
+        if self.allowed_audiences:
+            audience = claims.get("aud")
+            audiences = [audience] if isinstance(audience, str) else audience
+            if not isinstance(audiences, list) or not any(
+                isinstance(a, str) and a in self.allowed_audiences for a in audiences
+            ):
+                raise JwtError(f"Audience not allowed: {audience}")
+
+        # leeway tolerates clock skew with the issuer in both directions
+        now = time.time()
+        exp = _numeric_claim(claims, "exp")
+        if exp is not None and exp + self.leeway <= now:
+            raise JwtError("Token expired")
+        nbf = _numeric_claim(claims, "nbf")
+        if nbf is not None and nbf > now + self.leeway:
+            raise JwtError("Token not yet valid")
+
+        return claims
@@ -7,32 +7,348 @@ Supports both ALB and Lambda Function URL as HTTP endpoints.
 Architecture:
 - ALB mode: Istio Gateway -> HTTP:80 -> Internal ALB -> Lambda (ALB event format)
 - Function URL mode: Direct HTTPS to Lambda Function URL (not supported by Istio ext_authz)
+
+Cold starts: the zip ships sources only, so every module is compiled on
+init. Modules and clients a configuration does not use (cedar_engine,
+jwt_verify, boto3 with POLICY_ENGINE=local) are not imported, the time of
+each init phase is logged with the first invocation, and warm-up events
+({"warmup": true} or an EventBridge schedule) prepare the environment
+without being treated as auth checks.
 """
 
+import time
+
+_init_start = time.perf_counter()
+
 import logging
 import os
-import time
-import base64
 import json
 
-import boto3
-from botocore.config import Config
+from authz_check import Checker
+from circuit_breaker import CircuitBreaker
+from deadline import AvpCaller, check_deadline, parse_timeout_ms
+from decision_cache import DecisionCache
+from decision_log import DecisionLog, configure as configure_logging
+from entity_builder import CheckRequest, EntityBuilder
+from metrics import Metrics, error_code
+from token_cache import TokenCache
+
+# Milliseconds per init phase, logged once with the first invocation
+init_timings = {}
+_init_mark = _init_start
+_cold_start = True
+
+
+def _init_phase(name: str):
+    global _init_mark
+    now = time.perf_counter()
+    init_timings[f"{name}_ms"] = round((now - _init_mark) * 1000, 1)
+    _init_mark = now
+
+
+_init_phase("imports")
 
 # Configuration
 LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+# "text" (per-check lines) or "json" (one JSON decision record per check)
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+# Share of ALLOW decision records kept (denials and errors are always logged)
+LOG_ALLOW_SAMPLE_RATE = float(os.environ.get("LOG_ALLOW_SAMPLE_RATE", "1.0"))
 POLICY_STORE_ID = os.environ.get("POLICY_STORE_ID")
 AWS_REGION = os.environ.get("AWS_REGION", "us-east-1")
-
-# Logging setup
+# Policy engine: "avp" (remote only), "local" (in-process Cedar, AVP fallback
+# while no snapshot is loaded) or "shadow" (AVP decides, local is compared)
+POLICY_ENGINE = os.environ.get("POLICY_ENGINE", "avp")
+LOCAL_POLICY_DIRS = os.environ.get("LOCAL_POLICY_DIRS", "")
+LOCAL_SCHEMA_FILE = os.environ.get("LOCAL_SCHEMA_FILE", "")
+LOCAL_POLICY_RELOAD_SECONDS = float(os.environ.get("LOCAL_POLICY_RELOAD_SECONDS", "5"))
+JWT_VERIFY = os.environ.get("JWT_VERIFY", "false").lower() == "true"
+JWT_HMAC_SECRET = os.environ.get("JWT_HMAC_SECRET", "")
+JWT_JWKS_URL = os.environ.get("JWT_JWKS_URL", "")
+JWT_ALLOWED_ISSUERS = os.environ.get("JWT_ALLOWED_ISSUERS", "")
+# Comma-separated audiences; a verified token's aud must list one (empty: aud not checked)
+JWT_ALLOWED_AUDIENCES = os.environ.get("JWT_ALLOWED_AUDIENCES", "")
+JWT_ALGORITHMS = os.environ.get("JWT_ALGORITHMS", "HS256,RS256,ES256")
+JWT_LEEWAY_SECONDS = int(os.environ.get("JWT_LEEWAY_SECONDS", "0"))
+JWT_JWKS_REFRESH_SECONDS = float(os.environ.get("JWT_JWKS_REFRESH_SECONDS", "300"))
+JWT_JWKS_MIN_REFETCH_SECONDS = float(os.environ.get("JWT_JWKS_MIN_REFETCH_SECONDS", "30"))
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_MAX_TTL = float(os.environ.get("TOKEN_CACHE_MAX_TTL", "300"))
+DECISION_CACHE_SIZE = int(os.environ.get("DECISION_CACHE_SIZE", "10000"))
+DECISION_CACHE_TTL = float(os.environ.get("DECISION_CACHE_TTL", "60"))
+# Expired decisions served while AVP fails or the breaker is open (0 disables,
+# the default: a stale ALLOW fails open)
+DECISION_CACHE_MAX_STALE = float(os.environ.get("DECISION_CACHE_MAX_STALE", "0"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.environ.get("CIRCUIT_RESET_SECONDS", "10"))
+# Status when AVP fails and no stale decision exists (fail closed)
+AVP_FAILURE_STATUS = int(os.environ.get("AVP_FAILURE_STATUS", "500"))
+METRICS_SUMMARY_SECONDS = float(os.environ.get("METRICS_SUMMARY_SECONDS", "60"))
+# One check per invocation: a couple of pooled AVP connections are enough
+AVP_MAX_POOL_CONNECTIONS = int(os.environ.get("AVP_MAX_POOL_CONNECTIONS", "2"))
+AVP_CONNECT_TIMEOUT = float(os.environ.get("AVP_CONNECT_TIMEOUT", "2"))
+AVP_READ_TIMEOUT = float(os.environ.get("AVP_READ_TIMEOUT", "5"))
+AVP_MAX_ATTEMPTS = int(os.environ.get("AVP_MAX_ATTEMPTS", "3"))
+# Time a check may take, AVP retries included (0: only the caller's deadline
+# header; with neither the AVP call runs inline, without a deadline)
+AVP_DEADLINE_MS = float(os.environ.get("AVP_DEADLINE_MS", "0"))
+AVP_DEADLINE_HEADER = os.environ.get("AVP_DEADLINE_HEADER", "x-envoy-expected-rq-timeout-ms")
+# Kept from the deadline to return the answer
+AVP_DEADLINE_MARGIN_MS = float(os.environ.get("AVP_DEADLINE_MARGIN_MS", "20"))
+# Second IsAuthorized when the first has no answer after the AVP_HEDGE_QUANTILE
+# latency of recent calls in this environment; the first answer wins
+AVP_HEDGE = os.environ.get("AVP_HEDGE", "false").lower() == "true"
+AVP_HEDGE_QUANTILE = float(os.environ.get("AVP_HEDGE_QUANTILE", "0.95"))
+AVP_HEDGE_MIN_DELAY_MS = float(os.environ.get("AVP_HEDGE_MIN_DELAY_MS", "5"))
+# NP_CONTEXT JSON whose routes map request paths to templates (empty disables)
+ROUTE_TABLE_FILE = os.environ.get("ROUTE_TABLE_FILE", "")
+ROUTE_REJECT_UNMATCHED = os.environ.get("ROUTE_REJECT_UNMATCHED", "true").lower() == "true"
+# NP_CONTEXT JSON or generate-cedars.py manifest.json of the generated policies:
+# routed checks no permit policy could allow are denied locally (empty disables)
+PERMIT_INDEX_FILE = os.environ.get("PERMIT_INDEX_FILE", "")
+PERMIT_INDEX_GROUP_CLAIM = os.environ.get("PERMIT_INDEX_GROUP_CLAIM", "custom:groups")
+PERMIT_INDEX_RELOAD_SECONDS = float(os.environ.get("PERMIT_INDEX_RELOAD_SECONDS", "5"))
+# Token claims that carry a warm-up check's groups (as in the real tokens)
+WARMUP_GROUP_CLAIMS = [c for c in os.environ.get("WARMUP_GROUP_CLAIMS", "groups,custom:groups").split(",") if c]
+
+# Logging setup. Records are written inline: the environment is frozen as
+# soon as the handler returns, so a background writer could lose them.
 logger = logging.getLogger()
 logger.setLevel(LOG_LEVEL)
+configure_logging(LOG_FORMAT)
+decision_log = DecisionLog(LOG_FORMAT == "json", LOG_ALLOW_SAMPLE_RATE)
+
+# AWS client with retry configuration (reused across invocations). Created on
+# first use: at init below unless POLICY_ENGINE=local, where AVP is only the
+# fallback while no policy snapshot is loaded.
+_avp_client = None
+
+# AVP calls bounded by the check's deadline, optionally hedged. An abandoned
+# attempt keeps its thread until botocore's read timeout, hence the headroom
+avp_caller = AvpCaller(
+    max_workers=max(2 * AVP_MAX_POOL_CONNECTIONS, 4),
+    hedge=AVP_HEDGE,
+    hedge_quantile=AVP_HEDGE_QUANTILE,
+    min_hedge_delay=AVP_HEDGE_MIN_DELAY_MS / 1000
+)
 
-# AWS client with retry configuration (reused across invocations)
-boto_config = Config(
-    region_name=AWS_REGION,
-    retries={"max_attempts": 3, "mode": "standard"}
+
+def get_avp_client():
+    """Return the Verified Permissions client, importing boto3 on first call."""
+    global _avp_client
+    if _avp_client is None:
+        import boto3
+        from botocore.config import Config
+
+        boto_config = Config(
+            region_name=AWS_REGION,
+            retries={"max_attempts": AVP_MAX_ATTEMPTS, "mode": "standard"},
+            max_pool_connections=AVP_MAX_POOL_CONNECTIONS,
+            connect_timeout=AVP_CONNECT_TIMEOUT,
+            read_timeout=AVP_READ_TIMEOUT,
+            tcp_keepalive=True
+        )
+        _avp_client = boto3.client("verifiedpermissions", config=boto_config)
+        avp_caller.install(_avp_client)
+    return _avp_client
+
+
+def avp_validation_error():
+    """AVP ValidationException class, or () (matches nothing) if no client exists."""
+    return _avp_client.exceptions.ValidationException if _avp_client is not None else ()
+
+
+if POLICY_ENGINE != "local":
+    get_avp_client()
+    _init_phase("avp_client")
+
+# Decisions shared across users with the same groups (0 disables)
+decision_cache = DecisionCache(
+    max_size=DECISION_CACHE_SIZE,
+    ttl_seconds=DECISION_CACHE_TTL,
+    max_stale_seconds=DECISION_CACHE_MAX_STALE
+)
+
+# Fail fast while AVP keeps failing (0 disables); validation errors don't count
+avp_breaker = CircuitBreaker(
+    failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+    reset_seconds=CIRCUIT_RESET_SECONDS,
+    is_failure=lambda e: error_code(e) != "ValidationException"
+)
+
+# Verified JWT validation; without it claims are decoded but not verified
+jwt_verifier = None
+if JWT_VERIFY:
+    from jwt_verify import JwksCache, JwtVerifier
+
+    jwks_cache = None
+    if JWT_JWKS_URL:
+        jwks_cache = JwksCache(
+            JWT_JWKS_URL,
+            refresh_interval=JWT_JWKS_REFRESH_SECONDS,
+            min_refetch_interval=JWT_JWKS_MIN_REFETCH_SECONDS
+        )
+    jwt_verifier = JwtVerifier(
+        hmac_secret=JWT_HMAC_SECRET or None,
+        jwks=jwks_cache,
+        allowed_issuers=JWT_ALLOWED_ISSUERS.split(","),
+        allowed_audiences=JWT_ALLOWED_AUDIENCES.split(","),
+        algorithms=JWT_ALGORITHMS.split(","),
+        leeway=JWT_LEEWAY_SECONDS
+    )
+    _init_phase("jwt")
+
+# Reusable entity fragments for IsAuthorized requests
+entity_builder = EntityBuilder(POLICY_STORE_ID)
+
+# Parsed claims per token digest (0 disables)
+token_cache = TokenCache(max_size=TOKEN_CACHE_SIZE, max_ttl_seconds=TOKEN_CACHE_MAX_TTL)
+
+# In-process Cedar evaluation (POLICY_ENGINE=local|shadow)
+local_engine = None
+if POLICY_ENGINE in ("local", "shadow"):
+    from cedar_engine import LocalPolicyEngine
+
+    local_engine = LocalPolicyEngine(
+        LOCAL_POLICY_DIRS.split(os.pathsep),
+        schema_file=LOCAL_SCHEMA_FILE,
+        reload_interval=LOCAL_POLICY_RELOAD_SECONDS
+    )
+    local_engine.load()
+    _init_phase("local_engine")
+
+# Path -> route template, resource type and action (ROUTE_TABLE_FILE)
+route_index = None
+if ROUTE_TABLE_FILE:
+    from route_index import RouteIndex
+
+    route_index = RouteIndex.load(ROUTE_TABLE_FILE)
+    _init_phase("route_index")
+
+# (action, resource) -> groups any permit policy allows (PERMIT_INDEX_FILE)
+permit_index = None
+if PERMIT_INDEX_FILE:
+    from permit_index import PermitIndex
+
+    permit_index = PermitIndex(
+        PERMIT_INDEX_FILE, group_claim=PERMIT_INDEX_GROUP_CLAIM, reload_interval=PERMIT_INDEX_RELOAD_SECONDS
+    )
+    permit_index.load()
+    _init_phase("permit_index")
+
+# Stage latencies, decision/status counters and component stats, logged as a
+# JSON summary every METRICS_SUMMARY_SECONDS (no /metrics scrape in Lambda)
+metrics = Metrics()
+metrics.register("decision_cache", decision_cache.stats)
+metrics.register("circuit_breaker", avp_breaker.stats)
+metrics.register("avp_caller", avp_caller.stats)
+metrics.register("token_cache", token_cache.stats)
+metrics.register("entity_builder", entity_builder.stats)
+metrics.register("decision_log", decision_log.stats)
+metrics.register("init", lambda: init_timings)
+if local_engine is not None:
+    metrics.register("local_engine", local_engine.stats)
+if route_index is not None:
+    metrics.register("route_index", route_index.stats)
+if permit_index is not None:
+    metrics.register("permit_index", permit_index.stats)
+
+init_timings["total_ms"] = round((time.perf_counter() - _init_start) * 1000, 1)
+
+
+def authorize(request: dict, context: dict, deadline=None) -> tuple:
+    """
+    Answer an IsAuthorized request with the configured policy engine.
+
+    Returns (response, engine name). The context (token claims) is only
+    given to the local engine; AVP requests are sent unchanged and fail
+    with DeadlineExceeded when AVP hasn't answered by the deadline.
+    """
+    if local_engine is not None:
+        # No background threads in Lambda: check for policy changes inline
+        local_engine.maybe_reload()
+
+    if POLICY_ENGINE == "local" and local_engine.ready:
+        return local_engine.is_authorized(**request, context=context), "Local"
+
+    response = avp_breaker.call(avp_caller.call, get_avp_client().is_authorized, request, deadline)
+    if POLICY_ENGINE == "shadow" and local_engine.ready:
+        local_engine.shadow_compare(request, context, response)
+    return response, "AVP"
+
+
+# The check itself (authz_check.py, shared with server.py); no background
+# threads in Lambda, so the permit index is reloaded from the check
+checker = Checker(
+    authorize,
+    POLICY_STORE_ID,
+    token_cache=token_cache,
+    entity_builder=entity_builder,
+    decision_cache=decision_cache,
+    metrics=metrics,
+    jwt_verifier=jwt_verifier,
+    route_index=route_index,
+    route_reject_unmatched=ROUTE_REJECT_UNMATCHED,
+    permit_index=permit_index,
+    local_engine=local_engine if POLICY_ENGINE == "local" else None,
+    validation_error=avp_validation_error,
+    failure_status=AVP_FAILURE_STATUS,
+    reload_inline=True,
+    leeway=JWT_LEEWAY_SECONDS
 )
-avp_client = boto3.client("verifiedpermissions", config=boto_config)
+
+
+def is_warmup_event(event: dict) -> bool:
+    """Warm-up invocation: {"warmup": true} payload or an EventBridge scheduled event."""
+    return event.get("warmup") is True or event.get("source") in ("aws.events", "serverless-plugin-warmup")
+
+
+def warm_up(event: dict, cold_start: bool) -> dict:
+    """
+    Prepare this execution environment without running an auth check.
+
+    Reloads local policies and JWKS if stale, opens the HTTPS connection to
+    Verified Permissions with one probe check (result discarded) and answers
+    the optional event["checks"] ([{"groups", "method", "path", "host"}])
+    into the decision cache, so the first real requests for them are hits.
+    Each check's groups go into the WARMUP_GROUP_CLAIMS claims of a
+    synthetic token, the claims the policies read.
+    """
+    start = time.perf_counter()
+    result = {"warmup": True, "cold_start": cold_start, "init": init_timings}
+
+    if local_engine is not None:
+        local_engine.maybe_reload()
+    if jwt_verifier is not None and jwt_verifier.jwks is not None:
+        jwt_verifier.jwks.maybe_refresh()
+
+    if POLICY_ENGINE != "local" or not local_engine.ready:
+        probe = entity_builder.build(CheckRequest("GET", "/__warmup", "", "warmup", "", ()))
+        probe_start = time.perf_counter()
+        try:
+            get_avp_client().is_authorized(**probe)
+            result["avp_ms"] = round((time.perf_counter() - probe_start) * 1000, 1)
+        except Exception as e:
+            logger.warning(f"Warm-up AVP probe failed: {e}")
+            result["avp_error"] = str(e)
+
+    warmed = 0
+    for item in event.get("checks", []):
+        groups = list(item.get("groups", ()))
+        method = item.get("method", "GET").upper()
+        path = item.get("path", "/")
+        # Claims shaped like the real tokens', so the entries get their keys
+        claims = {"sub": "warmup", **{claim: groups for claim in WARMUP_GROUP_CLAIMS}}
+        try:
+            if checker.prefetch(claims, method, path, item.get("host", "")):
+                warmed += 1
+        except Exception as e:
+            logger.warning(f"Warm-up check {method} {path} failed: {e}")
+
+    result["decisions_warmed"] = warmed
+    result["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    logger.info(json.dumps(result))
+    return result
 
 
 def is_alb_event(event: dict) -> bool:
@@ -40,26 +356,6 @@ def is_alb_event(event: dict) -> bool:
     return "requestContext" in event and "elb" in event.get("requestContext", {})
 
 
-def decode_jwt_payload(token: str) -> dict:
-    """Decode JWT payload without verification (for extracting claims)."""
-    try:
-        parts = token.split(".")
-        if len(parts) != 3:
-            return {}
-
-        payload = parts[1]
-        # Add padding if needed
-        padding = 4 - len(payload) % 4
-        if padding != 4:
-            payload += "=" * padding
-
-        decoded = base64.urlsafe_b64decode(payload)
-        return json.loads(decoded)
-    except Exception as e:
-        logger.error(f"Failed to decode JWT: {e}")
-        return {}
-
-
 def build_response(status_code: int, message: str = "", headers: dict = None, is_alb: bool = False) -> dict:
     """
     Build response for either ALB or Lambda Function URL.
@@ -94,6 +390,15 @@ def build_response(status_code: int, message: str = "", headers: dict = None, is
     return response
 
 
+def respond(status_code: int, message: str = "", headers: dict = None, is_alb: bool = False) -> dict:
+    """build_response for check results: counted in the metrics summary."""
+    start = time.perf_counter()
+    response = build_response(status_code, message, headers, is_alb)
+    metrics.record_response(status_code, time.perf_counter() - start)
+    metrics.maybe_log_summary(logger, METRICS_SUMMARY_SECONDS)
+    return response
+
+
 def handler(event: dict, context) -> dict:
     """
     Lambda handler for ext-authz requests.
@@ -118,8 +423,21 @@ def handler(event: dict, context) -> dict:
         "requestContext": {"http": {"method": "GET", "path": "/"}},
         "headers": {...}
     }
+
+    Warm-up events ({"warmup": true, "checks": [...]}) are handled by warm_up().
     """
+    global _cold_start
+    cold_start, _cold_start = _cold_start, False
+    if cold_start:
+        logger.info(json.dumps({"cold_start": init_timings}))
+
+    if is_warmup_event(event):
+        return warm_up(event, cold_start)
+
     start_time = time.time()
+    started_at = time.monotonic()
+    timer = metrics.timer()
+    record = {}
 
     # Detect event source
     alb_mode = is_alb_event(event)
@@ -159,141 +477,29 @@ def handler(event: dict, context) -> dict:
         path = headers.get("x-original-uri", request_path)
         host = headers.get("x-original-host", headers.get("host", ""))
 
-        # Clean path (remove query string)
-        if "?" in path:
-            path = path.split("?")[0]
-
-        logger.info(f"Auth check: {method} {path} (host: {host})")
-
-        # Get Authorization header
-        auth_header = headers.get("authorization", "")
-
-        if not auth_header:
-            logger.warning("Missing Authorization header")
-            return build_response(401, "Authorization header required", is_alb=alb_mode)
-
-        # Extract Bearer token
-        if not auth_header.lower().startswith("bearer "):
-            logger.warning("Invalid Authorization header format")
-            return build_response(401, "Bearer token required", is_alb=alb_mode)
-
-        token = auth_header[7:]  # Remove "Bearer " prefix
-
-        # Decode token to extract claims
-        token_payload = decode_jwt_payload(token)
-        if not token_payload:
-            logger.warning("Failed to decode JWT payload")
-            return build_response(401, "Invalid token format", is_alb=alb_mode)
-
-        # Check expiration locally (defense in depth)
-        exp = token_payload.get("exp")
-        if exp and int(exp) < int(time.time()):
-            logger.warning(f"Token expired at {exp}")
-            return build_response(401, "Token expired", is_alb=alb_mode)
-
-        subject = token_payload.get("sub", "unknown")
-        logger.info(f"Token subject: {subject}")
-
-        # Extract groups from token
-        groups = token_payload.get("groups", [])
-        if isinstance(groups, str):
-            groups = [groups]
-
-        # Build entities for AVP
-        entities = []
-
-        # Add user entity
-        user_entity = {
-            "identifier": {
-                "entityType": "ApiAccess::User",
-                "entityId": subject
-            },
-            "attributes": {
-                "sub": {"string": subject},
-                "iss": {"string": token_payload.get("iss", "")}
-            },
-            "parents": [
-                {"entityType": "ApiAccess::Group", "entityId": g}
-                for g in groups
-            ]
-        }
-        entities.append(user_entity)
-
-        # Add group entities
-        for group in groups:
-            group_entity = {
-                "identifier": {
-                    "entityType": "ApiAccess::Group",
-                    "entityId": group
-                },
-                "attributes": {
-                    "name": {"string": group}
-                }
-            }
-            entities.append(group_entity)
-
-        # Add resource entity
-        resource_entity = {
-            "identifier": {
-                "entityType": "ApiAccess::Resource",
-                "entityId": f"resource:{path}"
-            },
-            "attributes": {
-                "path": {"string": path},
-                "method": {"string": method},
-                "host": {"string": host}
-            }
-        }
-        entities.append(resource_entity)
-
-        # Query Amazon Verified Permissions
-        try:
-            avp_response = avp_client.is_authorized(
-                policyStoreId=POLICY_STORE_ID,
-                principal={
-                    "entityType": "ApiAccess::User",
-                    "entityId": subject
-                },
-                action={
-                    "actionType": "ApiAccess::Action",
-                    "actionId": method
-                },
-                resource={
-                    "entityType": "ApiAccess::Resource",
-                    "entityId": f"resource:{path}",
-                },
-                entities={"entityList": entities}
-            )
-
-            decision = avp_response.get("decision", "DENY")
-            duration_ms = (time.time() - start_time) * 1000
-            logger.info(f"AVP decision: {decision} ({duration_ms:.1f}ms)")
-
-            if decision == "ALLOW":
-                return build_response(200, "", {
-                    "x-user-id": subject,
-                    "x-avp-decision": "ALLOW",
-                    "x-validated-by": "amazon-verified-permissions"
-                }, is_alb=alb_mode)
-            else:
-                determining_policies = avp_response.get("determiningPolicies", [])
-                errors = avp_response.get("errors", [])
-
-                if determining_policies:
-                    logger.info(f"Determining policies: {determining_policies}")
-                if errors:
-                    logger.warning(f"AVP errors: {errors}")
-
-                return build_response(403, "Access denied by policy", is_alb=alb_mode)
-
-        except avp_client.exceptions.ValidationException as e:
-            logger.error(f"AVP validation error: {e}")
-            return build_response(401, "Token validation failed", is_alb=alb_mode)
-        except Exception as e:
-            logger.error(f"AVP error: {e}")
-            return build_response(500, "Authorization service error", is_alb=alb_mode)
+        # Deadline: AVP_DEADLINE_MS or the caller's header, capped by the invocation's
+        # remaining time. Without either the call skips the AvpCaller pool and runs inline.
+        timeout_ms = parse_timeout_ms(headers.get(AVP_DEADLINE_HEADER)) if AVP_DEADLINE_HEADER else None
+        if context is not None and (AVP_DEADLINE_MS > 0 or timeout_ms is not None):
+            remaining_ms = context.get_remaining_time_in_millis()
+            timeout_ms = min(timeout_ms, remaining_ms) if timeout_ms is not None else remaining_ms
+        deadline = check_deadline(started_at, AVP_DEADLINE_MS, timeout_ms, AVP_DEADLINE_MARGIN_MS)
+
+        status_code, message, subject = checker.check(
+            method, path, host, headers.get("authorization", ""), timer, record, start_time, deadline
+        )
+        decision_log.log(status_code, message, record, (time.time() - start_time) * 1000)
+        if status_code == 200:
+            return respond(200, "", {
+                "x-user-id": subject,
+                "x-avp-decision": "ALLOW",
+                "x-validated-by": "amazon-verified-permissions"
+            }, is_alb=alb_mode)
+        return respond(status_code, message, is_alb=alb_mode)
 
     except Exception as e:
         logger.error(f"Check error: {e}")
+        record["error"] = str(e)
+        decision_log.log(500, "Internal authorization error", record, (time.time() - start_time) * 1000)
         # alb_mode is defined at the start of handler, before any exceptions
-        return build_response(500, "Internal authorization error", is_alb=alb_mode)
+        return respond(500, "Internal authorization error", is_alb=alb_mode)
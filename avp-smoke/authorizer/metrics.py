@@ -0,0 +1,314 @@
+"""
+Request metrics for the AVP authorizer.
+
+Latency histograms per request stage, counters per decision, status code
+and policy engine error, and an in-flight gauge, plus the stats() of the
+caches and other components registered as collectors. The in-cluster server
+exposes them on /metrics in the Prometheus text format; Lambda, which has
+no scrape target, logs the same data as one JSON summary line.
+
+Stages, in request order:
+
+- parse:    reading the original method/path/host and the bearer token
+- token:    token cache lookup, JWT verify/decode and expiry check
+- cache:    decision cache lookup
+- entities: building the IsAuthorized request
+- avp:      the policy engine call (AVP, batcher or local Cedar)
+- respond:  writing the response
+"""
+
+import json
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+STAGES = ("parse", "token", "cache", "entities", "avp", "respond")
+
+# Seconds; the authorizer answers from cache in microseconds and from AVP in
+# tens of milliseconds, so the buckets cover both ends.
+DEFAULT_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+)
+
+# name -> (help, label names)
+COUNTERS = {
+    "decisions_total": ("Authorization decisions by outcome and source (cache, AVP, Local).", ("decision", "source")),
+    "responses_total": ("Check responses by HTTP status code.", ("code",)),
+    "avp_errors_total": ("Failed policy engine calls by error code.", ("error",)),
+    "avp_throttles_total": ("Policy engine calls rejected by throttling.", ()),
+}
+
+THROTTLING_CODES = frozenset(("ThrottlingException", "TooManyRequestsException", "RequestLimitExceeded"))
+
+
+def error_code(error: Exception) -> str:
+    """AWS error code of a botocore ClientError, else the exception class name."""
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        code = response.get("Error", {}).get("Code")
+        if code:
+            return code
+    return type(error).__name__
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _metric_name(value: str) -> str:
+    return "".join(c if c.isalnum() or c == "_" else "_" for c in value)
+
+
+def _merge(stages: dict, counters: dict, state: dict):
+    """Add an export_state() dict into stage histograms and counters."""
+    for stage, (counts, total, count, maximum) in state.get("stages", {}).items():
+        hist = stages.get(stage)
+        if hist is None or len(counts) != len(hist.counts):
+            continue
+        hist.counts = [a + b for a, b in zip(hist.counts, counts)]
+        hist.sum += total
+        hist.count += count
+        hist.max = max(hist.max, maximum)
+    for name, values, value in state.get("counters", []):
+        key = (name, tuple(values))
+        counters[key] = counters.get(key, 0) + value
+
+
+class Histogram:
+    """Fixed-bucket histogram (not thread-safe; Metrics holds the lock)."""
+
+    __slots__ = ("buckets", "counts", "sum", "count", "max")
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile, capped at the max seen."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(self.buckets[index], self.max) if index < len(self.buckets) else self.max
+        return self.max
+
+
+class StageTimer:
+    """
+    Per-request stopwatch: lap(stage) records the time since the previous lap.
+    With keep_laps the seconds per stage are also kept in `laps`.
+    """
+
+    __slots__ = ("_metrics", "_last", "laps")
+
+    def __init__(self, metrics: "Metrics", keep_laps: bool = False):
+        self._metrics = metrics
+        self._last = time.perf_counter()
+        self.laps = {} if keep_laps else None
+
+    def lap(self, stage: str):
+        now = time.perf_counter()
+        self._metrics.observe(stage, now - self._last)
+        if self.laps is not None:
+            self.laps[stage] = now - self._last
+        self._last = now
+
+
+class Metrics:
+    """Thread-safe registry of stage histograms, counters and collectors."""
+
+    def __init__(self, prefix: str = "avp_authz", buckets: tuple = DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self._stages = {stage: Histogram(buckets) for stage in STAGES}
+        self._counters = {}
+        self._collectors = []
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._last_summary = self._started
+        # Timers keep per-request stage times (traffic capture)
+        self.keep_laps = False
+
+    def register(self, name: str, stats_fn):
+        """Export the numeric values of stats_fn() as <prefix>_<name>_<key> gauges."""
+        self._collectors.append((name, stats_fn))
+
+    def timer(self) -> StageTimer:
+        return StageTimer(self, self.keep_laps)
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            self._stages[stage].observe(seconds)
+
+    def inc(self, name: str, *label_values):
+        key = (name, label_values)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+
+    def record_response(self, status_code: int, seconds: float):
+        """Count a check response and record its write time."""
+        key = ("responses_total", (status_code,))
+        with self._lock:
+            self._stages["respond"].observe(seconds)
+            self._counters[key] = self._counters.get(key, 0) + 1
+
+    def record_error(self, error: Exception):
+        """Count a failed policy engine call (and throttling separately)."""
+        code = error_code(error)
+        self.inc("avp_errors_total", code)
+        if code in THROTTLING_CODES:
+            self.inc("avp_throttles_total")
+
+    @contextmanager
+    def tracking(self):
+        """Count the enclosed block as an in-flight request."""
+        with self._lock:
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def export_state(self) -> dict:
+        """Histograms, counters and in-flight gauge as JSON-serializable data."""
+        stages, counters, in_flight = self._snapshot()
+        return {
+            "stages": {stage: [hist.counts, hist.sum, hist.count, hist.max] for stage, hist in stages.items()},
+            "counters": [[name, list(values), value] for (name, values), value in counters.items()],
+            "in_flight": in_flight,
+        }
+
+    def merge_state(self, state: dict):
+        """Add the histograms and counters of an exported state to this registry."""
+        with self._lock:
+            _merge(self._stages, self._counters, state)
+
+    def _snapshot(self, merge_states=()) -> tuple:
+        with self._lock:
+            stages = {}
+            for stage, hist in self._stages.items():
+                copy = Histogram(hist.buckets)
+                copy.counts = list(hist.counts)
+                copy.sum, copy.count, copy.max = hist.sum, hist.count, hist.max
+                stages[stage] = copy
+            counters = dict(self._counters)
+            in_flight = self._in_flight
+        for state in merge_states:
+            _merge(stages, counters, state)
+            in_flight += state.get("in_flight", 0)
+        return stages, counters, in_flight
+
+    def _collect(self) -> list:
+        collected = []
+        for name, stats_fn in self._collectors:
+            try:
+                collected.append((name, stats_fn()))
+            except Exception:
+                collected.append((name, {"collect_error": 1}))
+        return collected
+
+    def render_prometheus(self, merge_states=()) -> str:
+        """
+        Return all metrics in the Prometheus text exposition format (0.0.4).
+
+        merge_states (export_state() of other processes) are added to the
+        histograms, counters and in-flight gauge; collector gauges are this
+        process's own.
+        """
+        stages, counters, in_flight = self._snapshot(merge_states)
+        p = self.prefix
+        lines = [
+            f"# HELP {p}_stage_duration_seconds Time spent in each stage of a check.",
+            f"# TYPE {p}_stage_duration_seconds histogram",
+        ]
+        for stage, hist in stages.items():
+            cumulative = 0
+            for bound, count in zip(hist.buckets + ("+Inf",), hist.counts):
+                cumulative += count
+                lines.append(f'{p}_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{p}_stage_duration_seconds_sum{{stage="{stage}"}} {hist.sum:.9f}')
+            lines.append(f'{p}_stage_duration_seconds_count{{stage="{stage}"}} {hist.count}')
+
+        for name, (help_text, label_names) in COUNTERS.items():
+            lines.append(f"# HELP {p}_{name} {help_text}")
+            lines.append(f"# TYPE {p}_{name} counter")
+            samples = [(values, v) for (n, values), v in counters.items() if n == name]
+            if not samples and not label_names:
+                samples = [((), 0)]
+            for values, value in sorted(samples, key=lambda s: tuple(map(str, s[0]))):
+                lines.append(f"{p}_{name}{_labels(label_names, values)} {value}")
+
+        lines.append(f"# HELP {p}_in_flight_requests Checks currently being processed.")
+        lines.append(f"# TYPE {p}_in_flight_requests gauge")
+        lines.append(f"{p}_in_flight_requests {in_flight}")
+        lines.append(f"# TYPE {p}_uptime_seconds gauge")
+        lines.append(f"{p}_uptime_seconds {time.monotonic() - self._started:.3f}")
+
+        for name, stats in self._collect():
+            for key, value in stats.items():
+                if not isinstance(value, (int, float)):
+                    continue
+                metric = _metric_name(f"{p}_{name}_{key}")
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {int(value) if isinstance(value, bool) else value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> dict:
+        """Return the metrics as a JSON-serializable dict (latencies in ms)."""
+        stages, counters, in_flight = self._snapshot()
+        summary = {
+            "uptime_seconds": round(time.monotonic() - self._started, 3),
+            "in_flight": in_flight,
+            "stages": {
+                stage: {
+                    "count": hist.count,
+                    "mean_ms": round(hist.sum / hist.count * 1000, 3) if hist.count else 0.0,
+                    "p50_ms": round(hist.quantile(0.50) * 1000, 3),
+                    "p95_ms": round(hist.quantile(0.95) * 1000, 3),
+                    "p99_ms": round(hist.quantile(0.99) * 1000, 3),
+                    "max_ms": round(hist.max * 1000, 3),
+                }
+                for stage, hist in stages.items()
+            },
+            "counters": {name: {} if label_names else 0 for name, (_, label_names) in COUNTERS.items()},
+        }
+        for (name, values), value in counters.items():
+            if values:
+                summary["counters"][name][",".join(map(str, values))] = value
+            else:
+                summary["counters"][name] = value
+        for name, stats in self._collect():
+            summary[name] = stats
+        return summary
+
+    def maybe_log_summary(self, log, interval_seconds: float):
+        """Log summary() as one JSON line at most once per interval (0 disables)."""
+        if interval_seconds <= 0:
+            return
+        now = time.monotonic()
+        if now - self._last_summary < interval_seconds:
+            return
+        self._last_summary = now
+        log.info(json.dumps({"metrics": self.summary()}, default=str))
@@ -0,0 +1,172 @@
+"""
+Permit index: local denials for checks no permit policy could allow.
+
+The policies avp/generate-cedars.py writes all have the same shape: permit
+one action on one or more `Namespace::Component::"template"` resources when
+`context.token["custom:groups"]` contains any of a list of groups. So for a
+routed check (route_index.py) the question "could any policy permit this?"
+is a dict lookup: (action, resource type, template) -> union of the groups
+of every policy on it. When the key is missing or the token's groups don't
+intersect the union, the engine can only answer DENY and the authorizer
+returns 403 without calling it.
+
+The index is built from either source of those policies:
+
+- the NP_CONTEXT document (`parameters.routes[].policies` plus
+  `parameters.cedar.group_prefix`, the same groups generate-cedars.py derives)
+- the manifest.json generate-cedars.py writes next to the policies
+  (version 2, whose entries list namespace, app_component, paths, action
+  and groups)
+
+The file is polled like the local policy snapshot: on change a new dict is
+built and swapped in with a single assignment, so a check sees either the
+old or the new index, never a partial one. A reload that fails keeps the
+previous index; until one loads, every check goes on to the engine.
+
+Only valid when the policy store holds nothing but the generated policies:
+a hand-written permit the index doesn't know about would be shadowed by
+local denials.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Claim the generated policies read the groups from
+DEFAULT_GROUP_CLAIM = "custom:groups"
+
+
+def entries_from_context(context: dict) -> dict:
+    """(action, resource type, template) -> groups, from an NP_CONTEXT document."""
+    parameters = context.get("parameters", context)
+    cedar = parameters.get("cedar", {})
+    namespace = cedar.get("namespace", "DefaultNamespace")
+    group_prefix = cedar.get("group_prefix", "")
+    entries = {}
+    for route in parameters.get("routes", []):
+        resource_type = f"{namespace}::{route.get('app_component', 'DefaultComponent')}"
+        scope = route.get("scope", "")
+        for action, roles in route.get("policies", {}).items():
+            key = (action, resource_type, route.get("path", ""))
+            entries.setdefault(key, set()).update(f"{group_prefix}{role}_{scope}" for role in roles)
+    return entries
+
+
+def entries_from_manifest(manifest: dict) -> dict:
+    """(action, resource type, template) -> groups, from a generate-cedars.py manifest."""
+    if manifest.get("version") != 2:
+        raise ValueError(f"Unsupported manifest version {manifest.get('version')!r}")
+    entries = {}
+    for filename, policy in manifest.get("policies", {}).items():
+        if "groups" not in policy:
+            raise ValueError(f"Manifest entry {filename} has no groups (regenerate with generate-cedars.py)")
+        resource_type = f"{policy['namespace']}::{policy['app_component']}"
+        for path in policy["paths"]:
+            entries.setdefault((policy["action"], resource_type, path), set()).update(policy["groups"])
+    return entries
+
+
+def load_entries(filename: str) -> dict:
+    """Read an NP_CONTEXT document or a manifest.json into frozen index entries."""
+    with open(filename) as f:
+        document = json.load(f)
+    if "policies" in document and "version" in document:
+        entries = entries_from_manifest(document)
+    else:
+        entries = entries_from_context(document)
+    return {key: frozenset(groups) for key, groups in entries.items()}
+
+
+class PermitIndex:
+    """Hot-reloaded permit index; could_permit() is O(1) in the number of policies."""
+
+    def __init__(self, filename: str, group_claim: str = DEFAULT_GROUP_CLAIM, reload_interval: float = 5.0):
+        self.filename = filename
+        self.group_claim = group_claim
+        self.reload_interval = reload_interval
+        self._entries = None
+        self._fingerprint = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.reloads = 0
+        self.reload_errors = 0
+        self.denied = 0
+        self.passed = 0
+
+    def load(self) -> bool:
+        """Rebuild the index if the file changed. Returns True if a new index was installed."""
+        with self._lock:
+            self._last_check = time.time()
+            try:
+                st = os.stat(self.filename)
+                fingerprint = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                fingerprint = None
+            if fingerprint == self._fingerprint:
+                return False
+            self._fingerprint = fingerprint
+
+            try:
+                entries = load_entries(self.filename)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                self.reload_errors += 1
+                logger.error(f"Permit index reload failed, keeping previous index: {e}")
+                return False
+
+            self._entries = entries
+            self.reloads += 1
+            logger.info(f"Loaded permit index: {len(entries)} action/resource pairs from {self.filename}")
+            return True
+
+    def maybe_reload(self):
+        """Check for changes at most once per reload_interval."""
+        if time.time() - self._last_check >= self.reload_interval and not self._lock.locked():
+            self.load()
+
+    def start_reloader(self):
+        """Poll the index file in a daemon thread."""
+        def run():
+            while True:
+                time.sleep(self.reload_interval)
+                try:
+                    self.load()
+                except Exception as e:
+                    logger.error(f"Permit index reloader error: {e}")
+
+        thread = threading.Thread(target=run, name="permit-index-reloader", daemon=True)
+        thread.start()
+        return thread
+
+    def could_permit(self, action: str, resource_type: str, resource_id: str, claims: dict) -> bool:
+        """False when no permit policy on (action, resource) lists any of the token's groups."""
+        entries = self._entries
+        if entries is None:
+            return True
+        allowed = entries.get((action, resource_type, resource_id))
+        groups = claims.get(self.group_claim, ())
+        if isinstance(groups, str):
+            groups = (groups,)
+        plausible = allowed is not None and not allowed.isdisjoint(groups)
+        with self._stats_lock:
+            if plausible:
+                self.passed += 1
+            else:
+                self.denied += 1
+        return plausible
+
+    def stats(self) -> dict:
+        entries = self._entries
+        with self._stats_lock:
+            return {
+                "ready": entries is not None,
+                "entries": len(entries) if entries is not None else 0,
+                "reloads": self.reloads,
+                "reload_errors": self.reload_errors,
+                "denied": self.denied,
+                "passed": self.passed,
+            }
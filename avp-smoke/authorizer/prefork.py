@@ -0,0 +1,176 @@
+"""
+Pre-fork worker processes for the in-cluster authorizer.
+
+CPython runs Python code on one core per process (GIL), so server.py with
+SERVER_PROCESSES > 1 runs its checks in several forked workers. The
+Supervisor forks them once server.py has loaded its configuration,
+policies and shared decision cache (shared copy-on-write); every worker
+opens its own listening socket on the same port with SO_REUSEPORT and the
+kernel spreads new connections across them. A worker that dies is forked
+again, after RESTART_BACKOFF_SECONDS if it lived less than
+MIN_UPTIME_SECONDS so a crash loop doesn't spin. SIGTERM/SIGINT are passed
+on to the workers, which get SHUTDOWN_GRACE_SECONDS to finish.
+
+Prometheus scrapes /metrics from whichever worker accepts the connection.
+MetricsExchange lets that worker answer for the whole pod: each worker
+writes its Metrics.export_state() to a shared directory every
+SYNC_SECONDS, and /metrics adds the other workers' latest state to its own.
+A restarted worker picks up the state of the worker it replaces, so
+counters don't go backwards.
+"""
+
+import json
+import logging
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+MIN_UPTIME_SECONDS = 5.0
+RESTART_BACKOFF_SECONDS = 1.0
+SHUTDOWN_GRACE_SECONDS = 10.0
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+class Supervisor:
+    """Fork `processes` workers running run_worker(worker_id, state_dir) and keep them running."""
+
+    def __init__(self, processes: int, run_worker, grace_seconds: float = SHUTDOWN_GRACE_SECONDS):
+        self.processes = processes
+        self.run_worker = run_worker
+        self.grace_seconds = grace_seconds
+        self.state_dir = tempfile.mkdtemp(prefix="avp-authz-")
+        self._workers = {}  # pid -> (worker id, started at)
+        self._stopping = False
+
+    def _spawn(self, worker_id: int):
+        pid = os.fork()
+        if pid == 0:
+            # Worker: SIGTERM/SIGINT end serve_forever() through KeyboardInterrupt
+            signal.signal(signal.SIGTERM, _interrupt)
+            signal.signal(signal.SIGINT, _interrupt)
+            code = 0
+            try:
+                self.run_worker(worker_id, self.state_dir)
+            except KeyboardInterrupt:
+                pass
+            except BaseException:
+                logger.exception(f"Worker {worker_id} failed")
+                code = 1
+            finally:
+                logging.shutdown()
+                os._exit(code)
+        self._workers[pid] = (worker_id, time.monotonic())
+        logger.info(f"Started worker {worker_id} (pid {pid})")
+
+    def run(self):
+        """Run the workers until SIGTERM/SIGINT and all of them have exited."""
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        try:
+            for worker_id in range(self.processes):
+                self._spawn(worker_id)
+            while self._workers:
+                try:
+                    pid, status = os.wait()
+                except ChildProcessError:
+                    break
+                worker_id, started_at = self._workers.pop(pid)
+                if self._stopping:
+                    continue
+                logger.error(f"Worker {worker_id} (pid {pid}) exited with code "
+                             f"{os.waitstatus_to_exitcode(status)}, restarting")
+                if time.monotonic() - started_at < MIN_UPTIME_SECONDS:
+                    time.sleep(RESTART_BACKOFF_SECONDS)
+                if not self._stopping:
+                    self._spawn(worker_id)
+        finally:
+            shutil.rmtree(self.state_dir, ignore_errors=True)
+
+    def _stop(self, signum, frame):
+        if self._stopping:
+            return
+        self._stopping = True
+        logger.info(f"Stopping {len(self._workers)} workers...")
+        for pid in list(self._workers):
+            _signal(pid, signal.SIGTERM)
+        timer = threading.Timer(self.grace_seconds, self._kill_remaining)
+        timer.daemon = True
+        timer.start()
+
+    def _kill_remaining(self):
+        for pid, (worker_id, _) in list(self._workers.items()):
+            logger.warning(f"Worker {worker_id} (pid {pid}) still running, killing it")
+            _signal(pid, signal.SIGKILL)
+
+
+def _signal(pid: int, signum: int):
+    try:
+        os.kill(pid, signum)
+    except ProcessLookupError:
+        pass
+
+
+class MetricsExchange:
+    """Share one worker's Metrics with the other workers through state_dir."""
+
+    SYNC_SECONDS = 1.0
+
+    def __init__(self, state_dir: str, worker_id: int, metrics):
+        self.state_dir = state_dir
+        self.worker_id = worker_id
+        self.metrics = metrics
+        self._path = self._state_path(worker_id)
+
+    def _state_path(self, worker_id) -> str:
+        return os.path.join(self.state_dir, f"metrics-{worker_id}.json")
+
+    def _read(self, path: str):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def start(self):
+        """Continue from the state of the worker this one replaces, then sync periodically."""
+        previous = self._read(self._path)
+        if previous is not None:
+            self.metrics.merge_state(previous)
+        self.write()
+        thread = threading.Thread(target=self._run, name="metrics-sync", daemon=True)
+        thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.SYNC_SECONDS)
+            try:
+                self.write()
+            except OSError as e:
+                logger.warning(f"Failed to write metrics state: {e}")
+
+    def write(self):
+        """Atomically replace this worker's state file."""
+        temp_path = f"{self._path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.metrics.export_state(), f, separators=(",", ":"))
+        os.replace(temp_path, self._path)
+
+    def render_prometheus(self) -> str:
+        """This worker's live metrics plus the last state written by the others."""
+        states = []
+        for name in os.listdir(self.state_dir):
+            path = os.path.join(self.state_dir, name)
+            if not name.endswith(".json") or path == self._path:
+                continue
+            state = self._read(path)
+            if state is not None:
+                states.append(state)
+        return self.metrics.render_prometheus(merge_states=states)
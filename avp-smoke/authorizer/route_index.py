@@ -0,0 +1,191 @@
+"""
+Compiled route table for the AVP authorizer.
+
+NP_CONTEXT routes (`parameters.routes`) describe each API path as a template
+with its method and app_component. Without them every concrete path
+(`/orders/123`, `/orders/124`, ...) is its own AVP resource and decision
+cache key. RouteIndex compiles the templates into a segment trie so each
+request path maps to its route in one walk over the path segments; the
+authorizer then uses the template as the resource id, the component as the
+Cedar resource type (the same `Namespace::Component::"template"` entities
+avp/generate-cedars.py writes policies for) and can deny paths that match
+no route without calling the policy engine.
+
+Template syntax, per segment:
+
+- `literal`             matches itself
+- `{id}` or `:id`       matches any single segment
+- `{proxy+}` or `*`     (last segment only) matches one or more segments
+
+A route with `path_param: true` and no placeholder also matches any path
+below its template. Literal segments win over `{param}`, which wins over the
+catch-all; the walk backtracks when a more specific branch dead-ends.
+
+The Cedar action of a route is its only `policies` action. A route with
+several actions is indexed once per method that maps to one of them
+(METHOD_ACTIONS: GET -> Read, PATCH -> Update, ...), so each request is
+checked against the action its method performs; methods that map to none of
+its actions match no route.
+"""
+
+import json
+import sys
+import threading
+
+ANY_METHOD = "*"
+
+# Action of each method on routes with several policy actions
+METHOD_ACTIONS = {
+    "GET": "Read",
+    "HEAD": "Read",
+    "POST": "Create",
+    "PUT": "Update",
+    "PATCH": "Update",
+    "DELETE": "Delete",
+}
+
+
+class Route:
+    """One compiled route; resource/action identifiers are built once."""
+
+    __slots__ = ("template", "method", "app_component", "resource_type", "action", "action_type")
+
+    def __init__(self, template: str, method: str, app_component: str, namespace: str, action: str):
+        self.template = sys.intern(template)
+        self.method = method
+        self.app_component = app_component
+        self.resource_type = sys.intern(f"{namespace}::{app_component}")
+        self.action = sys.intern(action)
+        self.action_type = sys.intern(f"{namespace}::Action")
+
+
+class _Node:
+    __slots__ = ("static", "param", "catch_all", "routes")
+
+    def __init__(self):
+        self.static = {}
+        self.param = None
+        self.catch_all = None  # method -> Route
+        self.routes = None     # method -> Route
+
+
+def _segments(path: str) -> list:
+    return [s for s in path.split("/") if s]
+
+
+def _is_param(segment: str) -> bool:
+    return (segment.startswith("{") and segment.endswith("}")) or segment.startswith(":")
+
+
+def _is_catch_all(segment: str) -> bool:
+    return segment == "*" or (segment.startswith("{") and segment.endswith("+}"))
+
+
+class RouteIndex:
+    """Segment trie of route templates; match() is thread-safe."""
+
+    def __init__(self, routes: list):
+        self._root = _Node()
+        self._lock = threading.Lock()
+        self.routes = 0
+        self.matched = 0
+        self.unmatched = 0
+        for route, prefix in routes:
+            self.add(route, prefix)
+
+    @classmethod
+    def from_context(cls, context: dict) -> "RouteIndex":
+        """Compile the routes of an NP_CONTEXT document."""
+        parameters = context.get("parameters", context)
+        namespace = parameters.get("cedar", {}).get("namespace", "DefaultNamespace")
+        routes = []
+        for item in parameters.get("routes", []):
+            template = item.get("path", "/")
+            app_component = item.get("app_component", "DefaultComponent")
+            prefix = bool(item.get("path_param"))
+            for method, action in _route_actions(item):
+                routes.append((Route(template, method, app_component, namespace, action), prefix))
+        return cls(routes)
+
+    @classmethod
+    def load(cls, filename: str) -> "RouteIndex":
+        with open(filename) as f:
+            return cls.from_context(json.load(f))
+
+    def add(self, route: Route, prefix: bool = False):
+        """Insert a route; prefix=True also matches every path below it."""
+        node = self._root
+        segments = _segments(route.template)
+        exact = True
+        if segments and _is_catch_all(segments[-1]):
+            # {proxy+} needs at least one segment: only the catch-all matches
+            segments.pop()
+            prefix, exact = True, False
+        elif prefix and any(_is_param(s) for s in segments):
+            # path_param with explicit placeholders: the placeholders are the params
+            prefix = False
+        for segment in segments:
+            if _is_catch_all(segment):
+                raise ValueError(f"Catch-all must be the last segment: {route.template}")
+            if _is_param(segment):
+                if node.param is None:
+                    node.param = _Node()
+                node = node.param
+            else:
+                node = node.static.setdefault(segment, _Node())
+        if exact:
+            if node.routes is None:
+                node.routes = {}
+            node.routes.setdefault(route.method, route)
+        if prefix:
+            if node.catch_all is None:
+                node.catch_all = {}
+            node.catch_all.setdefault(route.method, route)
+        self.routes += 1
+
+    def match(self, method: str, path: str):
+        """Return the Route for method + path (query string already removed), or None."""
+        route = self._match(self._root, _segments(path), 0, method.upper())
+        with self._lock:
+            if route is None:
+                self.unmatched += 1
+            else:
+                self.matched += 1
+        return route
+
+    def _match(self, node: _Node, segments: list, index: int, method: str):
+        if index == len(segments):
+            return _by_method(node.routes, method) if node.routes else None
+        child = node.static.get(segments[index])
+        if child is not None:
+            route = self._match(child, segments, index + 1, method)
+            if route:
+                return route
+        if node.param is not None:
+            route = self._match(node.param, segments, index + 1, method)
+            if route:
+                return route
+        if node.catch_all:
+            return _by_method(node.catch_all, method)
+        return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"routes": self.routes, "matched": self.matched, "unmatched": self.unmatched}
+
+
+def _route_actions(item: dict) -> list:
+    """(method, action) pairs of an NP_CONTEXT route."""
+    policies = item.get("policies", {})
+    method = (item.get("method") or ANY_METHOD).upper()
+    if len(policies) == 1:
+        return [(method, next(iter(policies)))]
+    if not policies:
+        # No generated policy: the method stands in for the action
+        return [(method, method)]
+    methods = METHOD_ACTIONS if method == ANY_METHOD else (method,)
+    return [(m, METHOD_ACTIONS[m]) for m in methods if METHOD_ACTIONS.get(m) in policies]
+
+
+def _by_method(routes: dict, method: str):
+    return routes.get(method) or routes.get(ANY_METHOD)
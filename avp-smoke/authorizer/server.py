@@ -3,24 +3,131 @@ Amazon Verified Permissions HTTP Authorizer for Istio ext-authz
 
 This server implements the Envoy ext_authz HTTP protocol,
 which is simpler than gRPC and doesn't require proto generation.
+With GRPC_PORT set it also serves the ext_authz v3 gRPC protocol
+(grpc_server.py) with the same check logic; /health and /metrics stay
+on HTTP_PORT. SERVER_PROCESSES > 1 runs that many pre-fork worker
+processes on the same ports (prefork.py).
 """
 
 import logging
 import os
 import sys
 import time
-import base64
-import json
+import select
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from http.server import HTTPServer, BaseHTTPRequestHandler
 
 import boto3
 from botocore.config import Config
 
+from authz_check import Checker
+from avp_batcher import AuthzBatcher
+from cedar_engine import LocalPolicyEngine
+from circuit_breaker import CircuitBreaker
+from deadline import AvpCaller, check_deadline, parse_timeout_ms
+from decision_cache import DecisionCache, SharedDecisionCache
+from decision_log import DecisionLog, configure as configure_logging
+from entity_builder import EntityBuilder
+from jwt_verify import JwksCache, JwtVerifier
+from metrics import Metrics, error_code
+from permit_index import PermitIndex
+from prefork import MetricsExchange, Supervisor
+from route_index import RouteIndex
+from singleflight import SingleFlight
+from token_cache import TokenCache
+from traffic_capture import TrafficCapture
+
 # Configuration
 LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+# "text" (per-check lines) or "json" (one JSON decision record per check)
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+# Records waiting for a log writer thread, beyond this they are dropped (0, the default,
+# writes inline from the request thread)
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "0"))
+# Share of ALLOW decision records kept (denials and errors are always logged)
+LOG_ALLOW_SAMPLE_RATE = float(os.environ.get("LOG_ALLOW_SAMPLE_RATE", "1.0"))
 POLICY_STORE_ID = os.environ.get("POLICY_STORE_ID")
 HTTP_PORT = int(os.environ.get("HTTP_PORT", "9191"))
+# ext_authz v3 gRPC port (0 disables)
+GRPC_PORT = int(os.environ.get("GRPC_PORT", "0"))
 AWS_REGION = os.environ.get("AWS_REGION", "us-east-1")
+SERVER_WORKERS = int(os.environ.get("SERVER_WORKERS", "16"))
+SERVER_MAX_PENDING = int(os.environ.get("SERVER_MAX_PENDING", "64"))
+# Pre-fork worker processes sharing HTTP_PORT (SO_REUSEPORT); 1 = single process
+SERVER_PROCESSES = int(os.environ.get("SERVER_PROCESSES", "1"))
+# Idle seconds an Envoy keep-alive connection may hold its worker (0 closes after each check)
+SERVER_KEEPALIVE_SECONDS = float(os.environ.get("SERVER_KEEPALIVE_SECONDS", "60"))
+# How often an idle keep-alive connection checks whether others wait for its worker
+SERVER_IDLE_POLL_SECONDS = 0.25
+# Outbound AVP connections; default matches the worker pool so no check waits for one
+AVP_MAX_POOL_CONNECTIONS = int(os.environ.get("AVP_MAX_POOL_CONNECTIONS", str(max(SERVER_WORKERS, 10))))
+AVP_CONNECT_TIMEOUT = float(os.environ.get("AVP_CONNECT_TIMEOUT", "2"))
+AVP_READ_TIMEOUT = float(os.environ.get("AVP_READ_TIMEOUT", "5"))
+AVP_MAX_ATTEMPTS = int(os.environ.get("AVP_MAX_ATTEMPTS", "3"))
+# Time a check may take, AVP retries included (0: only the caller's deadline);
+# set it to Envoy's ext_authz timeout so no answer comes after Envoy gave up
+AVP_DEADLINE_MS = float(os.environ.get("AVP_DEADLINE_MS", "0"))
+# HTTP header with the milliseconds the caller still waits (empty ignores it);
+# over gRPC the call's own deadline is used
+AVP_DEADLINE_HEADER = os.environ.get("AVP_DEADLINE_HEADER", "x-envoy-expected-rq-timeout-ms")
+# Kept from the deadline to write the answer
+AVP_DEADLINE_MARGIN_MS = float(os.environ.get("AVP_DEADLINE_MARGIN_MS", "20"))
+# Second IsAuthorized when the first has no answer after the AVP_HEDGE_QUANTILE
+# latency of recent calls; the first answer wins
+AVP_HEDGE = os.environ.get("AVP_HEDGE", "false").lower() == "true"
+AVP_HEDGE_QUANTILE = float(os.environ.get("AVP_HEDGE_QUANTILE", "0.95"))
+AVP_HEDGE_MIN_DELAY_MS = float(os.environ.get("AVP_HEDGE_MIN_DELAY_MS", "5"))
+# Policy engine: "avp" (remote only), "local" (in-process Cedar, AVP fallback
+# while no snapshot is loaded) or "shadow" (AVP decides, local is compared)
+POLICY_ENGINE = os.environ.get("POLICY_ENGINE", "avp")
+LOCAL_POLICY_DIRS = os.environ.get("LOCAL_POLICY_DIRS", "")
+LOCAL_SCHEMA_FILE = os.environ.get("LOCAL_SCHEMA_FILE", "")
+LOCAL_POLICY_RELOAD_SECONDS = float(os.environ.get("LOCAL_POLICY_RELOAD_SECONDS", "5"))
+AVP_BATCH_WINDOW_MS = float(os.environ.get("AVP_BATCH_WINDOW_MS", "0"))
+AVP_BATCH_MAX_SIZE = int(os.environ.get("AVP_BATCH_MAX_SIZE", "30"))
+JWT_VERIFY = os.environ.get("JWT_VERIFY", "false").lower() == "true"
+JWT_HMAC_SECRET = os.environ.get("JWT_HMAC_SECRET", "")
+JWT_JWKS_URL = os.environ.get("JWT_JWKS_URL", "")
+JWT_ALLOWED_ISSUERS = os.environ.get("JWT_ALLOWED_ISSUERS", "")
+# Comma-separated audiences; a verified token's aud must list one (empty: aud not checked)
+JWT_ALLOWED_AUDIENCES = os.environ.get("JWT_ALLOWED_AUDIENCES", "")
+JWT_ALGORITHMS = os.environ.get("JWT_ALGORITHMS", "HS256,RS256,ES256")
+JWT_LEEWAY_SECONDS = int(os.environ.get("JWT_LEEWAY_SECONDS", "0"))
+JWT_JWKS_REFRESH_SECONDS = float(os.environ.get("JWT_JWKS_REFRESH_SECONDS", "300"))
+JWT_JWKS_MIN_REFETCH_SECONDS = float(os.environ.get("JWT_JWKS_MIN_REFETCH_SECONDS", "30"))
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_MAX_TTL = float(os.environ.get("TOKEN_CACHE_MAX_TTL", "300"))
+SINGLE_FLIGHT = os.environ.get("SINGLE_FLIGHT", "true").lower() == "true"
+DECISION_CACHE_SIZE = int(os.environ.get("DECISION_CACHE_SIZE", "10000"))
+DECISION_CACHE_TTL = float(os.environ.get("DECISION_CACHE_TTL", "60"))
+# Expired decisions served while AVP fails or the breaker is open (0 disables,
+# the default: a stale ALLOW fails open)
+DECISION_CACHE_MAX_STALE = float(os.environ.get("DECISION_CACHE_MAX_STALE", "0"))
+# With SERVER_PROCESSES > 1, one decision cache in shared memory for all workers
+DECISION_CACHE_SHARED = os.environ.get("DECISION_CACHE_SHARED", "true").lower() == "true"
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.environ.get("CIRCUIT_RESET_SECONDS", "10"))
+# Status when AVP fails and no stale decision exists (fail closed)
+AVP_FAILURE_STATUS = int(os.environ.get("AVP_FAILURE_STATUS", "500"))
+# NP_CONTEXT JSON whose routes map request paths to templates (empty disables)
+ROUTE_TABLE_FILE = os.environ.get("ROUTE_TABLE_FILE", "")
+ROUTE_REJECT_UNMATCHED = os.environ.get("ROUTE_REJECT_UNMATCHED", "true").lower() == "true"
+# NP_CONTEXT JSON or generate-cedars.py manifest.json of the generated policies:
+# routed checks no permit policy could allow are denied locally (empty disables)
+PERMIT_INDEX_FILE = os.environ.get("PERMIT_INDEX_FILE", "")
+PERMIT_INDEX_GROUP_CLAIM = os.environ.get("PERMIT_INDEX_GROUP_CLAIM", "custom:groups")
+PERMIT_INDEX_RELOAD_SECONDS = float(os.environ.get("PERMIT_INDEX_RELOAD_SECONDS", "5"))
+# Directory for sanitized check records replayed by bench/replay.py (empty disables)
+CAPTURE_DIR = os.environ.get("CAPTURE_DIR", "")
+CAPTURE_MAX_BYTES = int(os.environ.get("CAPTURE_MAX_BYTES", str(64 * 1024 * 1024)))
+CAPTURE_MAX_FILES = int(os.environ.get("CAPTURE_MAX_FILES", "5"))
+# Share of tokens whose checks are captured (all checks of a captured token)
+CAPTURE_SAMPLE_RATE = float(os.environ.get("CAPTURE_SAMPLE_RATE", "1.0"))
+# Capture records waiting for the capture writer thread; beyond this they are dropped
+CAPTURE_QUEUE_SIZE = int(os.environ.get("CAPTURE_QUEUE_SIZE", "10000"))
+# Token claims the policies read, captured so the replay mints them (comma separated)
+CAPTURE_CLAIMS = [c for c in os.environ.get("CAPTURE_CLAIMS", "custom:groups").split(",") if c]
 
 # Logging setup
 logging.basicConfig(
@@ -28,242 +135,523 @@ logging.basicConfig(
     format="%(asctime)s [%(levelname)s] %(message)s",
     handlers=[logging.StreamHandler(sys.stdout)]
 )
+log_queue = configure_logging(LOG_FORMAT, LOG_QUEUE_SIZE)
 logger = logging.getLogger(__name__)
+decision_log = DecisionLog(LOG_FORMAT == "json", LOG_ALLOW_SAMPLE_RATE)
 
-# AWS client with retry configuration
+# AWS client with retry configuration and a connection pool sized for the workers
 boto_config = Config(
     region_name=AWS_REGION,
-    retries={"max_attempts": 3, "mode": "standard"}
+    retries={"max_attempts": AVP_MAX_ATTEMPTS, "mode": "standard"},
+    max_pool_connections=AVP_MAX_POOL_CONNECTIONS,
+    connect_timeout=AVP_CONNECT_TIMEOUT,
+    read_timeout=AVP_READ_TIMEOUT,
+    tcp_keepalive=True
 )
 avp_client = boto3.client("verifiedpermissions", config=boto_config)
 
+# Micro-batching of concurrent checks into BatchIsAuthorized (0 disables)
+avp_batcher = None
+if AVP_BATCH_WINDOW_MS > 0:
+    avp_batcher = AuthzBatcher(
+        avp_client,
+        window_seconds=AVP_BATCH_WINDOW_MS / 1000,
+        max_batch_size=AVP_BATCH_MAX_SIZE,
+        max_workers=max(SERVER_WORKERS, 1)
+    )
+
+# AVP calls bounded by their check's deadline, hedged (AVP_HEDGE) unless batched;
+# abandoned attempts keep a thread until botocore's read timeout, hence the headroom
+avp_caller = AvpCaller(
+    max_workers=2 * max(SERVER_WORKERS, 1),
+    hedge=AVP_HEDGE and avp_batcher is None,
+    hedge_quantile=AVP_HEDGE_QUANTILE,
+    min_hedge_delay=AVP_HEDGE_MIN_DELAY_MS / 1000
+)
+avp_caller.install(avp_client)
+
+# Decisions shared across users with the same groups (0 disables); in shared
+# memory when pre-fork workers should share it (created before the fork)
+decision_cache_class = SharedDecisionCache if SERVER_PROCESSES > 1 and DECISION_CACHE_SHARED else DecisionCache
+decision_cache = decision_cache_class(
+    max_size=DECISION_CACHE_SIZE,
+    ttl_seconds=DECISION_CACHE_TTL,
+    max_stale_seconds=DECISION_CACHE_MAX_STALE
+)
+
+# Fail fast while AVP keeps failing (0 disables); validation errors don't count
+avp_breaker = CircuitBreaker(
+    failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+    reset_seconds=CIRCUIT_RESET_SECONDS,
+    is_failure=lambda e: error_code(e) != "ValidationException"
+)
+
+# Verified JWT validation; without it claims are decoded but not verified
+jwt_verifier = None
+if JWT_VERIFY:
+    jwks_cache = None
+    if JWT_JWKS_URL:
+        jwks_cache = JwksCache(
+            JWT_JWKS_URL,
+            refresh_interval=JWT_JWKS_REFRESH_SECONDS,
+            min_refetch_interval=JWT_JWKS_MIN_REFETCH_SECONDS
+        )
+    jwt_verifier = JwtVerifier(
+        hmac_secret=JWT_HMAC_SECRET or None,
+        jwks=jwks_cache,
+        allowed_issuers=JWT_ALLOWED_ISSUERS.split(","),
+        allowed_audiences=JWT_ALLOWED_AUDIENCES.split(","),
+        algorithms=JWT_ALGORITHMS.split(","),
+        leeway=JWT_LEEWAY_SECONDS
+    )
+
+# Reusable entity fragments for IsAuthorized requests
+entity_builder = EntityBuilder(POLICY_STORE_ID)
+
+# Parsed claims per token digest (0 disables)
+token_cache = TokenCache(max_size=TOKEN_CACHE_SIZE, max_ttl_seconds=TOKEN_CACHE_MAX_TTL)
+
+# Coalescing of identical in-flight checks
+in_flight = SingleFlight(enabled=SINGLE_FLIGHT)
+
+# In-process Cedar evaluation (POLICY_ENGINE=local|shadow)
+local_engine = None
+if POLICY_ENGINE in ("local", "shadow"):
+    local_engine = LocalPolicyEngine(
+        LOCAL_POLICY_DIRS.split(os.pathsep),
+        schema_file=LOCAL_SCHEMA_FILE,
+        reload_interval=LOCAL_POLICY_RELOAD_SECONDS
+    )
+    local_engine.load()
+
+# Path -> route template, resource type and action (ROUTE_TABLE_FILE)
+route_index = RouteIndex.load(ROUTE_TABLE_FILE) if ROUTE_TABLE_FILE else None
+
+# (action, resource) -> groups any permit policy allows (PERMIT_INDEX_FILE)
+permit_index = None
+if PERMIT_INDEX_FILE:
+    permit_index = PermitIndex(
+        PERMIT_INDEX_FILE, group_claim=PERMIT_INDEX_GROUP_CLAIM, reload_interval=PERMIT_INDEX_RELOAD_SECONDS
+    )
+    permit_index.load()
+
+# Stage latencies, decision/status counters and component stats (/metrics)
+metrics = Metrics()
+metrics.register("decision_cache", decision_cache.stats)
+metrics.register("circuit_breaker", avp_breaker.stats)
+metrics.register("avp_caller", avp_caller.stats)
+metrics.register("token_cache", token_cache.stats)
+metrics.register("single_flight", in_flight.stats)
+metrics.register("entity_builder", entity_builder.stats)
+metrics.register("decision_log", decision_log.stats)
+if log_queue is not None:
+    metrics.register("log_queue", log_queue.stats)
+if avp_batcher is not None:
+    metrics.register("avp_batcher", avp_batcher.stats)
+if local_engine is not None:
+    metrics.register("local_engine", local_engine.stats)
+if route_index is not None:
+    metrics.register("route_index", route_index.stats)
+if permit_index is not None:
+    metrics.register("permit_index", permit_index.stats)
+
+# Sanitized check records for offline replay; each process opens its own file
+traffic_capture = None
+if CAPTURE_DIR:
+    traffic_capture = TrafficCapture(
+        CAPTURE_DIR, max_bytes=CAPTURE_MAX_BYTES, max_files=CAPTURE_MAX_FILES,
+        sample_rate=CAPTURE_SAMPLE_RATE, queue_size=CAPTURE_QUEUE_SIZE
+    )
+    metrics.keep_laps = True
+    metrics.register("traffic_capture", traffic_capture.stats)
+
+# Pod-wide /metrics across pre-fork workers (set in each worker)
+metrics_exchange = None
+
+
+def authorize(request: dict, context: dict, deadline=None) -> tuple:
+    """
+    Answer an IsAuthorized request with the configured policy engine.
+
+    Returns (response, engine name). The context (token claims) is only
+    given to the local engine; AVP requests are sent unchanged and fail
+    with DeadlineExceeded when AVP hasn't answered by the deadline.
+    """
+    if POLICY_ENGINE == "local" and local_engine.ready:
+        return local_engine.is_authorized(**request, context=context), "Local"
+
+    if avp_batcher is None:
+        is_authorized = avp_client.is_authorized
+    else:
+        # A batched check waits for its batch at most until the deadline
+        def is_authorized(**request):
+            return avp_batcher.is_authorized(timeout=deadline.remaining() if deadline else None, **request)
+    response = avp_breaker.call(avp_caller.call, is_authorized, request, deadline)
+    if POLICY_ENGINE == "shadow" and local_engine.ready:
+        local_engine.shadow_compare(request, context, response)
+    return response, "AVP"
+
+
+# The check itself (authz_check.py, shared with lambda_handler.py)
+checker = Checker(
+    authorize,
+    POLICY_STORE_ID,
+    token_cache=token_cache,
+    entity_builder=entity_builder,
+    decision_cache=decision_cache,
+    in_flight=in_flight,
+    metrics=metrics,
+    jwt_verifier=jwt_verifier,
+    route_index=route_index,
+    route_reject_unmatched=ROUTE_REJECT_UNMATCHED,
+    permit_index=permit_index,
+    local_engine=local_engine if POLICY_ENGINE == "local" else None,
+    validation_error=lambda: avp_client.exceptions.ValidationException,
+    failure_status=AVP_FAILURE_STATUS,
+    record_claims=CAPTURE_CLAIMS if CAPTURE_DIR else (),
+    leeway=JWT_LEEWAY_SECONDS
+)
+
 
-def decode_jwt_payload(token: str) -> dict:
-    """Decode JWT payload without verification (for extracting claims)."""
+def check_request(method: str, path: str, host: str, auth_header: str, timer, timeout_ms: float = None) -> tuple:
+    """
+    Run one ext-authz check, independent of the transport (HTTP or gRPC).
+
+    Returns (status code, deny message, subject): 200 is ALLOW and carries
+    the subject for x-user-id, any other status is a denial with its message.
+    timeout_ms is how long the caller still waits, if it said so; with
+    AVP_DEADLINE_MS it bounds the time spent waiting for AVP. With
+    LOG_FORMAT=json the check is logged as one decision record, and with
+    CAPTURE_DIR it is captured for replay.
+    """
+    start_time = time.time()
+    deadline = check_deadline(time.monotonic(), AVP_DEADLINE_MS, timeout_ms, AVP_DEADLINE_MARGIN_MS)
+    record = {}
     try:
-        parts = token.split(".")
-        if len(parts) != 3:
-            return {}
-
-        payload = parts[1]
-        # Add padding if needed
-        padding = 4 - len(payload) % 4
-        if padding != 4:
-            payload += "=" * padding
-
-        decoded = base64.urlsafe_b64decode(payload)
-        return json.loads(decoded)
+        status_code, message, subject = checker.check(
+            method, path, host, auth_header, timer, record, start_time, deadline
+        )
     except Exception as e:
-        logger.error(f"Failed to decode JWT: {e}")
-        return {}
+        record["error"] = str(e)
+        decision_log.log(500, "Internal authorization error", record, (time.time() - start_time) * 1000)
+        raise
+    duration_ms = (time.time() - start_time) * 1000
+    decision_log.log(status_code, message, record, duration_ms)
+    if traffic_capture is not None:
+        traffic_capture.record(record, status_code, start_time, duration_ms, timer.laps)
+    return status_code, message, subject
+
+
+def response_headers(status_code: int, subject: str = None) -> dict:
+    """Headers Envoy forwards upstream on ALLOW (or downstream on deny)."""
+    if status_code == 200:
+        return {
+            "x-user-id": subject,
+            "x-avp-decision": "ALLOW",
+            "x-validated-by": "amazon-verified-permissions",
+        }
+    return {"x-avp-decision": "DENY"}
 
 
 class AuthorizationHandler(BaseHTTPRequestHandler):
-    """HTTP handler for ext-authz requests."""
+    """
+    HTTP handler for ext-authz requests.
+
+    Speaks HTTP/1.1 so Envoy reuses its connections: every response carries
+    Content-Length, any request body is drained, TCP_NODELAY keeps the body
+    write from waiting on the header ACK, and an idle connection is closed
+    after SERVER_KEEPALIVE_SECONDS.
+    """
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    timeout = SERVER_KEEPALIVE_SECONDS or None
+
+    def handle(self):
+        """Serve checks on this connection until it is closed, idle or its worker is needed."""
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection and self._wait_for_request():
+            self.handle_one_request()
+
+    def _wait_for_request(self) -> bool:
+        """
+        Wait for the next request on an idle keep-alive connection.
+
+        Returns False (close) after SERVER_KEEPALIVE_SECONDS, or as soon as
+        the server needs this worker back. Envoy does not pipeline,
+        so nothing is left unread in rfile between checks.
+        """
+        needs_worker = getattr(self.server, "needs_worker", None)
+        deadline = time.monotonic() + SERVER_KEEPALIVE_SECONDS
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (needs_worker is not None and needs_worker()):
+                return False
+            readable, _, _ = select.select([self.connection], [], [], min(remaining, SERVER_IDLE_POLL_SECONDS))
+            if readable:
+                return True
 
     def log_message(self, format, *args):
         """Override to use our logger."""
         logger.debug(f"HTTP: {format % args}")
 
     def do_GET(self):
-        """Handle GET requests (health checks)."""
+        """Handle GET requests (health checks, metrics)."""
         if self.path == "/health" or self.path == "/healthz":
-            self.send_response(200)
-            self.send_header("Content-Type", "text/plain")
-            self.end_headers()
-            self.wfile.write(b"OK")
+            self._send(200, {"Content-Type": "text/plain"}, b"OK")
+            return
+
+        # Only scrapes hit /metrics directly; a check forwarded by Envoy for a
+        # client request to /metrics carries x-original-uri and is authorized
+        if self.path == "/metrics" and "x-original-uri" not in self.headers:
+            self._send_metrics()
             return
 
         # For any other GET, treat as auth check
-        self._handle_auth_check()
+        with metrics.tracking():
+            self._handle_auth_check()
 
     def do_POST(self):
         """Handle POST requests (some ext-authz configs use POST)."""
-        self._handle_auth_check()
+        with metrics.tracking():
+            self._handle_auth_check()
 
     def _handle_auth_check(self):
         """Process authorization check request."""
-        start_time = time.time()
+        timer = metrics.timer()
 
         try:
+            self._discard_body()
+
             # Extract request attributes from headers
             # Envoy/Istio sends the original request info in headers
             method = self.headers.get("x-original-method", self.headers.get(":method", "GET"))
             path = self.headers.get("x-original-uri", self.headers.get(":path", self.path))
             host = self.headers.get("x-original-host", self.headers.get(":authority", ""))
 
-            # Clean path (remove query string)
-            if "?" in path:
-                path = path.split("?")[0]
-
-            logger.info(f"Auth check: {method} {path} (host: {host})")
-
-            # Get Authorization header
-            auth_header = self.headers.get("authorization", "")
-
-            if not auth_header:
-                logger.warning("Missing Authorization header")
-                self._send_denied(401, "Authorization header required")
-                return
-
-            # Extract Bearer token
-            if not auth_header.lower().startswith("bearer "):
-                logger.warning("Invalid Authorization header format")
-                self._send_denied(401, "Bearer token required")
-                return
-
-            token = auth_header[7:]  # Remove "Bearer " prefix
-
-            # Decode token to extract claims
-            token_payload = decode_jwt_payload(token)
-            if not token_payload:
-                logger.warning("Failed to decode JWT payload")
-                self._send_denied(401, "Invalid token format")
-                return
-
-            # Check expiration locally (defense in depth)
-            exp = token_payload.get("exp")
-            if exp and int(exp) < int(time.time()):
-                logger.warning(f"Token expired at {exp}")
-                self._send_denied(401, "Token expired")
-                return
-
-            subject = token_payload.get("sub", "unknown")
-            logger.info(f"Token subject: {subject}")
-
-            # Extract groups from token
-            groups = token_payload.get("groups", [])
-            if isinstance(groups, str):
-                groups = [groups]
-
-            # Build entities for AVP
-            entities = []
-
-            # Add user entity
-            user_entity = {
-                "identifier": {
-                    "entityType": "ApiAccess::User",
-                    "entityId": subject
-                },
-                "attributes": {
-                    "sub": {"string": subject},
-                    "iss": {"string": token_payload.get("iss", "")}
-                },
-                "parents": [
-                    {"entityType": "ApiAccess::Group", "entityId": g}
-                    for g in groups
-                ]
-            }
-            entities.append(user_entity)
-
-            # Add group entities
-            for group in groups:
-                group_entity = {
-                    "identifier": {
-                        "entityType": "ApiAccess::Group",
-                        "entityId": group
-                    },
-                    "attributes": {
-                        "name": {"string": group}
-                    }
-                }
-                entities.append(group_entity)
-
-            # Add resource entity
-            resource_entity = {
-                "identifier": {
-                    "entityType": "ApiAccess::Resource",
-                    "entityId": f"resource:{path}"
-                },
-                "attributes": {
-                    "path": {"string": path},
-                    "method": {"string": method},
-                    "host": {"string": host}
-                }
-            }
-            entities.append(resource_entity)
-
-            # Query Amazon Verified Permissions
-            try:
-                avp_response = avp_client.is_authorized(
-                    policyStoreId=POLICY_STORE_ID,
-                    principal={
-                        "entityType": "ApiAccess::User",
-                        "entityId": subject
-                    },
-                    action={
-                        "actionType": "ApiAccess::Action",
-                        "actionId": method
-                    },
-                    resource={
-                        "entityType": "ApiAccess::Resource",
-                        "entityId": f"resource:{path}",
-                    },
-                    entities={"entityList": entities}
-                )
-
-                decision = avp_response.get("decision", "DENY")
-                duration_ms = (time.time() - start_time) * 1000
-                logger.info(f"AVP decision: {decision} ({duration_ms:.1f}ms)")
-
-                if decision == "ALLOW":
-                    self._send_allowed(subject)
-                else:
-                    determining_policies = avp_response.get("determiningPolicies", [])
-                    errors = avp_response.get("errors", [])
-
-                    if determining_policies:
-                        logger.info(f"Determining policies: {determining_policies}")
-                    if errors:
-                        logger.warning(f"AVP errors: {errors}")
-
-                    self._send_denied(403, "Access denied by policy")
-
-            except avp_client.exceptions.ValidationException as e:
-                logger.error(f"AVP validation error: {e}")
-                self._send_denied(401, "Token validation failed")
-            except Exception as e:
-                logger.error(f"AVP error: {e}")
-                self._send_denied(500, "Authorization service error")
-
+            timeout_ms = parse_timeout_ms(self.headers.get(AVP_DEADLINE_HEADER)) if AVP_DEADLINE_HEADER else None
+            status_code, message, subject = check_request(
+                method, path, host, self.headers.get("authorization", ""), timer, timeout_ms
+            )
         except Exception as e:
             logger.error(f"Check error: {e}")
-            self._send_denied(500, "Internal authorization error")
+            status_code, message, subject = 500, "Internal authorization error", None
+
+        if status_code == 200:
+            self._send_allowed(subject)
+        else:
+            self._send_denied(status_code, message)
+
+    def _send(self, status_code: int, headers: dict, body: bytes = b""):
+        """Send a complete response; Content-Length is always set."""
+        self.send_response(status_code)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        if not self._keep_alive():
+            self.send_header("Connection", "close")
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _discard_body(self):
+        """Drain a forwarded request body so the connection can take the next check."""
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            self.close_connection = True
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > 0:
+            self.rfile.read(length)
+
+    def _keep_alive(self) -> bool:
+        """Keep the connection unless disabled or other connections wait for a worker."""
+        if SERVER_KEEPALIVE_SECONDS <= 0 or self.close_connection:
+            return False
+        needs_worker = getattr(self.server, "needs_worker", None)
+        return needs_worker is not None and not needs_worker()
 
     def _send_allowed(self, subject: str):
         """Send an ALLOWED response."""
-        self.send_response(200)
-        self.send_header("x-user-id", subject)
-        self.send_header("x-avp-decision", "ALLOW")
-        self.send_header("x-validated-by", "amazon-verified-permissions")
-        self.end_headers()
+        start = time.perf_counter()
+        self._send(200, response_headers(200, subject))
+        metrics.record_response(200, time.perf_counter() - start)
 
     def _send_denied(self, status_code: int, message: str):
         """Send a DENIED response."""
-        self.send_response(status_code)
-        self.send_header("Content-Type", "text/plain")
-        self.send_header("x-avp-decision", "DENY")
-        self.end_headers()
-        self.wfile.write(message.encode())
+        start = time.perf_counter()
+        self._send(status_code, {"Content-Type": "text/plain", **response_headers(status_code)}, message.encode())
+        metrics.record_response(status_code, time.perf_counter() - start)
+
+    def _send_metrics(self):
+        """Send all metrics in the Prometheus text format."""
+        if metrics_exchange is not None:
+            body = metrics_exchange.render_prometheus().encode()
+        else:
+            body = metrics.render_prometheus().encode()
+        self._send(200, {"Content-Type": "text/plain; version=0.0.4"}, body)
+
+
+class PooledHTTPServer(HTTPServer):
+    """
+    HTTPServer that hands each connection to a bounded worker pool.
+
+    AVP calls run in parallel on up to max_workers threads. At most
+    max_pending further connections wait for a worker; beyond that the
+    accept loop blocks and new connections queue in the listen backlog.
+    A keep-alive connection holds its worker between checks, so handlers
+    close theirs (needs_worker()) while other connections are queued or the
+    server is closing, both when answering and while idle. With reuse_port
+    the pre-fork workers each bind HTTP_PORT (SO_REUSEPORT).
+    """
+
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler_class, max_workers: int, max_pending: int,
+                 reuse_port: bool = False):
+        self.allow_reuse_port = reuse_port
+        super().__init__(server_address, handler_class)
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="authz")
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._lock = threading.Lock()
+        self._connections = 0
+        self._closing = False
+
+    def needs_worker(self) -> bool:
+        """True when accepted connections wait for a free worker or the server is closing."""
+        return self._closing or self._connections > self.max_workers
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        with self._lock:
+            self._connections += 1
+        try:
+            self._pool.submit(self._process_in_worker, request, client_address)
+        except RuntimeError:
+            # Pool already shut down
+            self._release()
+            self.shutdown_request(request)
+
+    def _release(self):
+        with self._lock:
+            self._connections -= 1
+        self._slots.release()
+
+    def _process_in_worker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._release()
+
+    def server_close(self):
+        self._closing = True
+        super().server_close()
+        self._pool.shutdown(wait=True)
+
+
+def _http_server(reuse_port: bool) -> HTTPServer:
+    """Bind the ext-authz HTTP server; reuse_port lets pre-fork workers share HTTP_PORT."""
+    if SERVER_WORKERS > 0:
+        server = PooledHTTPServer(
+            ("0.0.0.0", HTTP_PORT), AuthorizationHandler,
+            max_workers=SERVER_WORKERS, max_pending=SERVER_MAX_PENDING, reuse_port=reuse_port
+        )
+    else:
+        server = HTTPServer(("0.0.0.0", HTTP_PORT), AuthorizationHandler, bind_and_activate=False)
+        server.allow_reuse_port = reuse_port
+        try:
+            server.server_bind()
+            server.server_activate()
+        except BaseException:
+            server.server_close()
+            raise
+    return server
+
+
+def _serve_process(worker_id=None):
+    """Serve checks in this process until interrupted (one pre-fork worker, or the only process)."""
+    server = _http_server(reuse_port=worker_id is not None)
+    name = "" if worker_id is None else f" (worker {worker_id}, pid {os.getpid()})"
+    logger.info(f"AVP Authorizer HTTP server started on port {HTTP_PORT}{name}")
+
+    if local_engine is not None:
+        local_engine.start_reloader()
+    if permit_index is not None:
+        permit_index.start_reloader()
+    if traffic_capture is not None:
+        logger.info(f"Capturing checks to {traffic_capture.start()}{name}")
+    if jwt_verifier is not None and jwt_verifier.jwks is not None:
+        jwt_verifier.jwks.refresh()
+        jwt_verifier.jwks.start_refresher()
+    grpc_server = None
+    if GRPC_PORT > 0:
+        # Imported here so HTTP-only deployments don't need grpcio
+        import grpc_server as grpc_ext_authz
+        grpc_server = grpc_ext_authz.start_server(
+            GRPC_PORT,
+            grpc_ext_authz.AuthorizationServicer(check_request, response_headers, metrics),
+            max_workers=max(SERVER_WORKERS, 1), max_pending=SERVER_MAX_PENDING
+        )
+        logger.info(f"AVP Authorizer gRPC ext_authz server started on port {GRPC_PORT}{name}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info(f"Shutting down{name}...")
+        server.shutdown()
+        if grpc_server is not None:
+            grpc_server.stop(grace=5)
+    finally:
+        server.server_close()
+
+
+def _serve_worker(worker_id: int, state_dir: str):
+    global metrics_exchange
+    metrics_exchange = MetricsExchange(state_dir, worker_id, metrics)
+    metrics_exchange.start()
+    _serve_process(worker_id)
 
 
 def serve():
-    """Start the HTTP server."""
+    """Start the HTTP server (and gRPC server), in SERVER_PROCESSES processes."""
     if not POLICY_STORE_ID:
         logger.error("POLICY_STORE_ID environment variable is required")
         sys.exit(1)
 
-    server = HTTPServer(("0.0.0.0", HTTP_PORT), AuthorizationHandler)
-
-    logger.info(f"AVP Authorizer HTTP server started on port {HTTP_PORT}")
+    if SERVER_WORKERS > 0:
+        logger.info(f"Worker pool: {SERVER_WORKERS} workers, {SERVER_MAX_PENDING} pending, "
+                    f"keep-alive {SERVER_KEEPALIVE_SECONDS}s, {AVP_MAX_POOL_CONNECTIONS} AVP connections")
     logger.info(f"Policy Store ID: {POLICY_STORE_ID}")
+    logger.info(f"Policy engine: {POLICY_ENGINE}")
+    if avp_batcher is not None:
+        logger.info(f"AVP micro-batching: {AVP_BATCH_WINDOW_MS}ms window, max {avp_batcher.max_batch_size} checks")
+    if AVP_DEADLINE_MS > 0 or avp_caller.hedge:
+        budget = f"{AVP_DEADLINE_MS:g}ms budget" if AVP_DEADLINE_MS > 0 else "caller deadline only"
+        hedge = f", hedged after the p{AVP_HEDGE_QUANTILE * 100:g} latency" if avp_caller.hedge else ""
+        logger.info(f"AVP deadline: {budget}, {AVP_DEADLINE_MARGIN_MS:g}ms margin{hedge}")
+    if route_index is not None:
+        logger.info(f"Route table: {route_index.routes} routes from {ROUTE_TABLE_FILE}")
+    if permit_index is not None:
+        logger.info(f"Permit index: {permit_index.stats()['entries']} action/resource pairs "
+                    f"from {PERMIT_INDEX_FILE} (groups claim {PERMIT_INDEX_GROUP_CLAIM})")
+    if jwt_verifier is not None:
+        logger.info(f"JWT verification enabled (issuers: {JWT_ALLOWED_ISSUERS or 'any'})")
+    if decision_log.enabled:
+        logger.info(f"JSON decision log: ALLOW sample rate {decision_log.allow_sample_rate}, "
+                    f"{'queue ' + str(LOG_QUEUE_SIZE) if log_queue is not None else 'inline'}")
     logger.info("Health check endpoint: /health")
-
-    try:
-        server.serve_forever()
-    except KeyboardInterrupt:
-        logger.info("Shutting down...")
-        server.shutdown()
+    logger.info("Metrics endpoint: /metrics")
+
+    if SERVER_PROCESSES > 1:
+        shared = "shared" if isinstance(decision_cache, SharedDecisionCache) else "per-process"
+        logger.info(f"Pre-fork: {SERVER_PROCESSES} processes on port {HTTP_PORT}, {shared} decision cache")
+        Supervisor(SERVER_PROCESSES, _serve_worker).run()
+    else:
+        _serve_process()
 
 
 if __name__ == "__main__":
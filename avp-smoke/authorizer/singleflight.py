@@ -0,0 +1,75 @@
+"""
+Single-flight coalescing of identical in-flight authorization checks.
+
+When a page load fans out into many requests with the same token and
+paths, only the first check for a given question calls the policy engine;
+identical checks that arrive while it is in flight wait for its result
+(or its exception) instead of issuing their own call. A waiter waits no
+longer than its own timeout (what is left of its check's deadline), even
+if the call it joined started with a later one.
+"""
+
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+
+class SingleFlight:
+    """Run at most one call per key at a time and share its outcome."""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.timeouts = 0
+
+    def do(self, key, fn, timeout: float = None):
+        """
+        Return fn() for key, joining an identical call already in flight.
+
+        A joining call raises TimeoutError when the call in flight has no
+        outcome within timeout seconds (None waits for it).
+        """
+        if not self.enabled:
+            return fn()
+
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                future = Future()
+                self._calls[key] = future
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            try:
+                return future.result(timeout=None if timeout is None else max(timeout, 0))
+            except FutureTimeoutError:
+                with self._lock:
+                    self.timeouts += 1
+                raise TimeoutError("No result from the identical check in flight within the deadline")
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "timeouts": self.timeouts,
+            }
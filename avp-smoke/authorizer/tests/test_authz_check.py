@@ -0,0 +1,99 @@
+import base64
+import json
+import time
+
+import decision_cache
+from authz_check import Checker
+from decision_cache import DecisionCache
+from entity_builder import EntityBuilder
+from metrics import Metrics
+from token_cache import TokenCache
+
+
+def bearer(claims: dict) -> str:
+    encode = lambda d: base64.urlsafe_b64encode(json.dumps(d).encode()).rstrip(b"=").decode()
+    return f"Bearer {encode({'alg': 'none'})}.{encode(claims)}.sig"
+
+
+def allow(request, context, deadline=None):
+    return {"decision": "ALLOW"}, "AVP"
+
+
+def checker(authorize=allow, cache=None, **options) -> Checker:
+    return Checker(
+        authorize,
+        "store",
+        token_cache=TokenCache(),
+        entity_builder=EntityBuilder("store"),
+        decision_cache=cache or DecisionCache(),
+        metrics=Metrics(),
+        **options,
+    )
+
+
+def check(checker: Checker, claims: dict) -> tuple:
+    metrics = Metrics()
+    return checker.check("GET", "/orders", "api", bearer(claims), metrics.timer(), {}, time.time())
+
+
+def test_allow():
+    assert check(checker(), {"sub": "alice", "exp": time.time() + 60}) == (200, "", "alice")
+
+
+def test_expired_token_within_leeway():
+    claims = {"sub": "alice", "exp": int(time.time()) - 3}
+    assert check(checker(), claims)[:2] == (401, "Token expired")
+    assert check(checker(leeway=10), claims)[0] == 200
+    assert check(checker(leeway=10), {"sub": "bob", "exp": int(time.time()) - 60})[:2] == (401, "Token expired")
+
+
+class Clock:
+    """time stand-in for decision_cache (entry expiry only)."""
+
+    def __init__(self):
+        self.now = time.time()
+
+    def time(self) -> float:
+        return self.now
+
+
+class Engine:
+    """authorize() that answers ALLOW until it is told to fail."""
+
+    def __init__(self):
+        self.failing = False
+
+    def __call__(self, request, context, deadline=None):
+        if self.failing:
+            raise ConnectionError("AVP down")
+        return {"decision": "ALLOW"}, "AVP"
+
+
+def test_engine_failure_fails_closed_by_default(monkeypatch):
+    engine, cache = Engine(), DecisionCache(ttl_seconds=60)
+    check_path = checker(engine, cache)
+    claims = {"sub": "alice", "exp": time.time() + 3600}
+    assert check(check_path, claims)[0] == 200
+    engine.failing = True
+    assert check(check_path, claims)[0] == 200  # still cached
+    clock = Clock()
+    monkeypatch.setattr(decision_cache, "time", clock)
+    clock.now += 61
+    assert check(check_path, claims)[:2] == (500, "Authorization service error")
+
+
+def test_stale_decision_served_when_opted_in(monkeypatch):
+    engine, cache = Engine(), DecisionCache(ttl_seconds=60, max_stale_seconds=300)
+    check_path = checker(engine, cache)
+    claims = {"sub": "alice", "exp": time.time() + 3600}
+    assert check(check_path, claims)[0] == 200
+    engine.failing = True
+    clock = Clock()
+    monkeypatch.setattr(decision_cache, "time", clock)
+    clock.now += 61
+    record = {}
+    metrics = Metrics()
+    assert check_path.check("GET", "/orders", "api", bearer(claims), metrics.timer(), record, time.time())[0] == 200
+    assert record["source"] == "stale"
+    clock.now += 300
+    assert check(check_path, claims)[0] == 500
@@ -0,0 +1,155 @@
+import threading
+
+import pytest
+
+from avp_batcher import AuthzBatcher, _Pending
+
+
+class ValidationException(Exception):
+    pass
+
+
+class StubClient:
+    """is_authorized / batch_is_authorized answering ALLOW for every request."""
+
+    class exceptions:
+        ValidationException = ValidationException
+
+    def __init__(self, batch_error=None, results=None, release=None):
+        self.batch_error = batch_error
+        self.results = results
+        self.release = release
+        self.batch_calls = []
+        self.single_calls = []
+
+    def is_authorized(self, **request):
+        if self.release is not None:
+            self.release.wait(2)
+        self.single_calls.append(request)
+        if request["resource"]["entityId"] == "invalid":
+            raise ValidationException("invalid resource")
+        return {"decision": "ALLOW", "resource": request["resource"]["entityId"]}
+
+    def batch_is_authorized(self, **call):
+        self.batch_calls.append(call)
+        if self.batch_error is not None:
+            raise self.batch_error
+        if self.results is not None:
+            return {"results": self.results}
+        return {"results": [{"decision": "ALLOW", "resource": r["resource"]["entityId"]} for r in call["requests"]]}
+
+
+def request(principal="alice", resource="/orders", entities=()) -> dict:
+    return {
+        "policyStoreId": "store",
+        "principal": {"entityType": "App::User", "entityId": principal},
+        "action": {"actionType": "App::Action", "actionId": "GET"},
+        "resource": {"entityType": "App::Resource", "entityId": resource},
+        "entities": {"entityList": list(entities)},
+    }
+
+
+def entity(entity_id: str, **attributes) -> dict:
+    return {
+        "identifier": {"entityType": "App::Group", "entityId": entity_id},
+        "attributes": {k: {"string": v} for k, v in attributes.items()},
+    }
+
+
+def pending(*requests) -> list:
+    items = [_Pending(r) for r in requests]
+    for item in items:
+        item.future.set_running_or_notify_cancel()
+    return items
+
+
+def test_partition_by_principal_then_resource():
+    batcher = AuthzBatcher(StubClient())
+    items = pending(
+        request("alice", "/a"), request("alice", "/b"),
+        request("bob", "/c"), request("carol", "/c"), request("dave", "/d"),
+    )
+    batches = [[item.request["resource"]["entityId"] for item in group] for group, _ in batcher._partition(items)]
+    assert sorted(batches) == [["/a", "/b"], ["/c", "/c"], ["/d"]]
+
+
+def test_chunk_splits_at_max_size_and_entity_conflicts():
+    batcher = AuthzBatcher(StubClient(), max_batch_size=2)
+    items = pending(*(request("alice", f"/{i}", [entity("g", name="x")]) for i in range(3)))
+    assert [len(group) for group, _ in batcher._chunk(items)] == [2, 1]
+
+    batcher = AuthzBatcher(StubClient())
+    items = pending(
+        request("alice", "/a", [entity("g", name="x")]),
+        request("alice", "/b", [entity("g", name="x"), entity("h")]),
+        request("alice", "/c", [entity("g", name="y")]),
+    )
+    batches = batcher._chunk(items)
+    assert [len(group) for group, _ in batches] == [2, 1]
+    assert len(batches[0][1]) == 2  # g and h merged once
+
+
+def test_batch_results_fan_out():
+    client = StubClient()
+    batcher = AuthzBatcher(client)
+    items = pending(request("alice", "/a"), request("alice", "/b"))
+    batcher._dispatch(items, [])
+    assert [item.future.result(1)["resource"] for item in items] == ["/a", "/b"]
+    assert len(client.batch_calls) == 1
+    assert batcher.stats()["batches"] == 1
+
+
+def test_validation_error_retries_each_check():
+    client = StubClient(batch_error=ValidationException("one bad request"))
+    batcher = AuthzBatcher(client)
+    items = pending(request("alice", "/a"), request("alice", "invalid"))
+    batcher._dispatch(items, [])
+    assert items[0].future.result(1)["decision"] == "ALLOW"
+    with pytest.raises(ValidationException):
+        items[1].future.result(1)
+    assert len(client.single_calls) == 2
+    assert batcher.stats()["fallbacks"] == 1
+
+
+def test_wrong_result_count_fails_the_batch():
+    batcher = AuthzBatcher(StubClient(results=[{"decision": "ALLOW"}]))
+    items = pending(request("alice", "/a"), request("alice", "/b"))
+    batcher._dispatch(items, [])
+    for item in items:
+        with pytest.raises(RuntimeError, match="1 results for 2 requests"):
+            item.future.result(1)
+
+
+def test_concurrent_checks_share_one_batch():
+    client = StubClient()
+    batcher = AuthzBatcher(client, window_seconds=0.05)
+    results = []
+    threads = [
+        threading.Thread(target=lambda p=p: results.append(batcher.is_authorized(**request("alice", p))))
+        for p in ("/a", "/b", "/c")
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(r["resource"] for r in results) == ["/a", "/b", "/c"]
+    assert len(client.batch_calls) == 1
+
+
+def test_wait_is_bounded_by_the_timeout():
+    release = threading.Event()
+    batcher = AuthzBatcher(StubClient(release=release), window_seconds=0)
+    try:
+        with pytest.raises(TimeoutError):
+            batcher.is_authorized(timeout=0.05, **request())
+    finally:
+        release.set()
+
+
+def test_check_dropped_before_sending_is_not_sent():
+    client = StubClient()
+    batcher = AuthzBatcher(client, window_seconds=0.2)
+    with pytest.raises(TimeoutError):
+        batcher.is_authorized(timeout=0.01, **request())
+    batcher.is_authorized(**request(resource="/next"))
+    assert [r["resource"]["entityId"] for r in client.single_calls] == ["/next"]
@@ -0,0 +1,171 @@
+import pytest
+
+from cedar_engine import CedarError, LocalPolicyEngine, PolicySnapshot
+
+USER = {"entityType": "ApiAccess::User", "entityId": "alice"}
+RESOURCE = {"entityType": "ApiAccess::Resource", "entityId": "/orders"}
+
+
+def snapshot(*sources) -> PolicySnapshot:
+    return PolicySnapshot.from_sources([(f"p{i}.cedar", text) for i, text in enumerate(sources)])
+
+
+def evaluate(snap: PolicySnapshot, action: str = "GET", groups=("readers",), context=None) -> dict:
+    entities = [
+        {"identifier": USER, "attributes": {"sub": {"string": "alice"}},
+         "parents": [{"entityType": "ApiAccess::Group", "entityId": g} for g in groups]},
+        {"identifier": RESOURCE, "attributes": {"path": {"string": "/orders"}, "host": {"string": "api"}}},
+    ]
+    return snap.evaluate(
+        ("ApiAccess::User", "alice"), ("ApiAccess::Action", action), ("ApiAccess::Resource", "/orders"),
+        entities, context,
+    )
+
+
+def test_permit_in_group():
+    snap = snapshot('permit (principal in ApiAccess::Group::"readers", action, resource);')
+    assert evaluate(snap)["decision"] == "ALLOW"
+    assert evaluate(snap, groups=("writers",))["decision"] == "DENY"
+
+
+def test_forbid_overrides_permit():
+    snap = snapshot(
+        '@id("allow-all") permit (principal, action, resource);',
+        '@id("no-delete") forbid (principal, action == ApiAccess::Action::"DELETE", resource);',
+    )
+    assert evaluate(snap, "GET")["decision"] == "ALLOW"
+    response = evaluate(snap, "DELETE")
+    assert response["decision"] == "DENY"
+    assert response["determiningPolicies"] == [{"policyId": "no-delete"}]
+
+
+def test_no_matching_permit_denies():
+    snap = snapshot('permit (principal, action == ApiAccess::Action::"POST", resource);')
+    response = evaluate(snap, "GET")
+    assert response["decision"] == "DENY"
+    assert response["determiningPolicies"] == []
+
+
+def test_contains_any_on_context_claims():
+    snap = snapshot('''
+        permit (principal, action, resource)
+        when { context.token["custom:groups"].containsAny(["Gestor", "Admin"]) };
+    ''')
+    assert evaluate(snap, context={"token": {"custom:groups": ["Admin"]}})["decision"] == "ALLOW"
+    assert evaluate(snap, context={"token": {"custom:groups": ["nobody"]}})["decision"] == "DENY"
+
+
+def test_contains_and_contains_all():
+    snap = snapshot(
+        'permit (principal, action == ApiAccess::Action::"GET", resource) '
+        'when { ["/orders", "/items"].contains(resource.path) };',
+        'permit (principal, action == ApiAccess::Action::"POST", resource) '
+        'when { context.scopes.containsAll(["read", "write"]) };',
+    )
+    assert evaluate(snap, "GET")["decision"] == "ALLOW"
+    assert evaluate(snap, "POST", context={"scopes": ["read", "write", "x"]})["decision"] == "ALLOW"
+    assert evaluate(snap, "POST", context={"scopes": ["read"]})["decision"] == "DENY"
+
+
+def test_when_and_unless():
+    snap = snapshot('''
+        permit (principal, action, resource)
+        when { context.mfa == true }
+        unless { resource.host == "api" };
+    ''')
+    assert evaluate(snap, context={"mfa": True})["decision"] == "DENY"
+    snap = snapshot('''
+        permit (principal, action, resource)
+        when { context.mfa == true }
+        unless { resource.host == "admin" };
+    ''')
+    assert evaluate(snap, context={"mfa": True})["decision"] == "ALLOW"
+    assert evaluate(snap, context={"mfa": False})["decision"] == "DENY"
+
+
+
+def test_values_of_different_types_are_never_equal():
+    snap = snapshot('permit (principal, action, resource) when { context.mfa == true };')
+    assert evaluate(snap, context={"mfa": True})["decision"] == "ALLOW"
+    assert evaluate(snap, context={"mfa": 1})["decision"] == "DENY"
+    snap = snapshot('permit (principal, action, resource) when { context.level != 0 };')
+    assert evaluate(snap, context={"level": False})["decision"] == "ALLOW"
+    assert evaluate(snap, context={"level": 0})["decision"] == "DENY"
+    snap = snapshot('permit (principal, action, resource) when { context.flags.contains(true) };')
+    assert evaluate(snap, context={"flags": [1, 2]})["decision"] == "DENY"
+    assert evaluate(snap, context={"flags": [True]})["decision"] == "ALLOW"
+    snap = snapshot('permit (principal, action, resource) when { context.flags == [1, 2] };')
+    assert evaluate(snap, context={"flags": [True, 2]})["decision"] == "DENY"
+    assert evaluate(snap, context={"flags": [2, 1]})["decision"] == "ALLOW"
+
+def test_failing_policy_is_skipped():
+    snap = snapshot(
+        '@id("broken") permit (principal, action, resource) when { context.missing == 1 };',
+        '@id("broken-forbid") forbid (principal, action, resource) when { context.level > "high" };',
+        '@id("works") permit (principal in ApiAccess::Group::"readers", action, resource);',
+    )
+    response = evaluate(snap, context={"level": 1})
+    assert response["decision"] == "ALLOW"
+    assert response["determiningPolicies"] == [{"policyId": "works"}]
+    assert [e["errorDescription"].split(":")[0] for e in response["errors"]] == ["broken", "broken-forbid"]
+
+
+@pytest.mark.parametrize("text", [
+    'permit (principal is ApiAccess::User, action, resource);',
+    'permit (principal, action, resource) when { context.name.like("a*") };',
+    'permit (principal, action, resource) when { context.x == 1 }',
+    'permit (principal, action, resource) when { context.x ~ 1 };',
+    'allow (principal, action, resource);',
+])
+def test_unsupported_syntax_is_rejected(text):
+    with pytest.raises(CedarError):
+        snapshot(text)
+
+
+def test_duplicate_policy_ids_are_rejected():
+    with pytest.raises(CedarError):
+        snapshot('@id("a") permit (principal, action, resource);', '@id("a") forbid (principal, action, resource);')
+
+
+def test_cache_key_covers_what_the_policies_read():
+    groups_only = snapshot('permit (principal in ApiAccess::Group::"readers", action, resource);')
+    assert groups_only.cache_key({"token": {"sub": "a"}}, "a", "iss", "h") == (groups_only.version,)
+
+    claims = snapshot('''
+        permit (principal, action, resource)
+        when { context.token["custom:groups"].containsAny(["Gestor"]) };
+    ''')
+    gestor = claims.cache_key({"token": {"sub": "a", "custom:groups": ["Gestor", "x"]}}, "a", "", "h")
+    assert gestor == claims.cache_key({"token": {"sub": "b", "custom:groups": ["x", "Gestor"]}}, "b", "", "h")
+    assert gestor != claims.cache_key({"token": {"sub": "a", "custom:groups": ["nobody"]}}, "a", "", "h")
+    assert gestor != claims.cache_key({"token": {"sub": "a"}}, "a", "", "h")
+
+    subject = snapshot('permit (principal == ApiAccess::User::"alice", action, resource);')
+    assert subject.cache_key({}, "alice", "", "h") != subject.cache_key({}, "bob", "", "h")
+
+    whole = snapshot('permit (principal, action, resource) when { context has token };')
+    assert whole.cache_key({"token": {"a": 1}}, "s", "", "h") != whole.cache_key({"token": {"a": 2}}, "s", "", "h")
+
+
+def test_reload_changes_the_cache_key(tmp_path):
+    policy = tmp_path / "allow.cedar"
+    policy.write_text('permit (principal, action, resource);')
+    engine = LocalPolicyEngine([str(tmp_path)])
+    assert engine.load()
+    before = engine.cache_key({}, "s", "", "h")
+    policy.write_text('forbid (principal, action, resource);')
+    assert engine.load(force=True)
+    assert engine.cache_key({}, "s", "", "h") != before
+
+
+def test_same_file_name_in_two_policy_dirs(tmp_path):
+    for name in ("base", "generated"):
+        (tmp_path / name / "svc").mkdir(parents=True)
+        (tmp_path / name / "svc" / "policy.cedar").write_text('permit (principal, action, resource);')
+    (tmp_path / "base" / "top.cedar").write_text('forbid (principal, action, resource) when { false };')
+    engine = LocalPolicyEngine([str(tmp_path / "base"), str(tmp_path / "generated")])
+    assert engine.load()
+    ids = sorted(p.policy_id for p in engine.snapshot.policies)
+    assert ids == sorted([
+        "svc/policy.cedar#0", "top.cedar#0", str(tmp_path / "generated" / "svc" / "policy.cedar") + "#0",
+    ])
@@ -0,0 +1,104 @@
+import pytest
+
+import circuit_breaker
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker, "time", clock)
+    return clock
+
+
+def ok():
+    return "ok"
+
+
+def fail():
+    raise ConnectionError("AVP down")
+
+
+def trip(breaker: CircuitBreaker, failures: int):
+    for _ in range(failures):
+        with pytest.raises(ConnectionError):
+            breaker.call(fail)
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=10)
+    trip(breaker, 2)
+    assert breaker.call(ok) == "ok"  # a success resets the count
+    trip(breaker, 2)
+    assert breaker.state == CLOSED
+    trip(breaker, 1)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.call(ok)
+    assert breaker.stats()["trips"] == 1
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_half_open_probe_success_closes(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10)
+    trip(breaker, 1)
+    clock.now += 9.9
+    with pytest.raises(CircuitOpenError):
+        breaker.call(ok)
+    clock.now += 0.1
+    assert breaker.call(ok) == "ok"
+    assert breaker.state == CLOSED
+    assert breaker.stats()["consecutive_failures"] == 0
+
+
+def test_half_open_probe_failure_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=10)
+    trip(breaker, 2)
+    clock.now += 10
+    trip(breaker, 1)
+    assert breaker.state == OPEN
+    assert breaker.stats()["trips"] == 2
+    clock.now += 5
+    with pytest.raises(CircuitOpenError):
+        breaker.call(ok)
+
+
+def test_half_open_admits_one_probe_at_a_time(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10)
+    trip(breaker, 1)
+    clock.now += 10
+    states = []
+
+    def probe():
+        states.append(breaker.state)
+        with pytest.raises(CircuitOpenError, match="half-open"):
+            breaker.call(ok)
+        return "probe"
+    assert breaker.call(probe) == "probe"
+    assert states == [HALF_OPEN]
+    assert breaker.state == CLOSED
+
+
+def test_ignored_errors_do_not_count(clock):
+    breaker = CircuitBreaker(failure_threshold=1, is_failure=lambda e: not isinstance(e, ValueError))
+
+    def invalid():
+        raise ValueError("validation")
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            breaker.call(invalid)
+    assert breaker.state == CLOSED
+
+
+def test_disabled_breaker_never_opens(clock):
+    breaker = CircuitBreaker(failure_threshold=0)
+    trip(breaker, 10)
+    assert breaker.call(ok) == "ok"
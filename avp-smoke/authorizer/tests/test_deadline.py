@@ -0,0 +1,155 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import deadline
+from deadline import AvpCaller, Deadline, DeadlineExceeded, _Abandoned, _Call, check_deadline, parse_timeout_ms
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def caller():
+    caller = AvpCaller(max_workers=4, hedge=True, min_hedge_delay=0.02)
+    yield caller
+    caller._pool.shutdown(wait=False)
+
+
+def in_ms(ms: float) -> Deadline:
+    return Deadline(time.monotonic() + ms / 1000)
+
+
+def answer(**request):
+    return {"decision": "ALLOW", **request}
+
+
+def warm(caller: AvpCaller, seconds: float = 0.001):
+    """Enough recent latencies for a hedge delay and a median."""
+    for _ in range(deadline.MIN_SAMPLES):
+        caller._observe(seconds)
+
+
+def test_check_deadline_takes_the_earliest_limit(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(deadline, "time", clock)
+    assert check_deadline(clock.now) is None
+    assert check_deadline(clock.now, 0, None, margin_ms=20) is None
+    assert check_deadline(clock.now - 0.1, budget_ms=500).remaining() == pytest.approx(0.4)
+    assert check_deadline(clock.now, 500, remaining_ms=200, margin_ms=20).remaining() == pytest.approx(0.18)
+    assert check_deadline(clock.now, 100, remaining_ms=200).remaining() == pytest.approx(0.1)
+    expired = check_deadline(clock.now - 1, budget_ms=500)
+    assert expired.expired and not check_deadline(clock.now, 500).expired
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("250", 250.0), ("1.5", 1.5), (None, None), ("", None), ("abc", None), ("0", None), ("-5", None),
+])
+def test_parse_timeout_ms(value, expected):
+    assert parse_timeout_ms(value) == expected
+
+
+def test_without_deadline_or_hedging_the_call_runs_inline():
+    caller = AvpCaller(hedge=False)
+    threads = []
+
+    def fn(**request):
+        threads.append(threading.current_thread())
+        return answer(**request)
+    assert caller.call(fn, {"id": 1}) == {"decision": "ALLOW", "id": 1}
+    assert threads == [threading.current_thread()]
+    assert caller.stats()["calls"] == 0
+
+
+def test_deadline_exceeded(caller):
+    release = threading.Event()
+
+    def stuck(**request):
+        release.wait(5)
+        return answer(**request)
+    try:
+        started = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            caller.call(stuck, {}, in_ms(50))
+        assert time.monotonic() - started < 1
+    finally:
+        release.set()
+    with pytest.raises(DeadlineExceeded, match="before calling"):
+        caller.call(answer, {}, in_ms(-1))
+    assert caller.stats()["deadline_exceeded"] == 2
+
+
+def test_hedge_answers_when_the_first_call_is_stuck(caller):
+    warm(caller)
+    release = threading.Event()
+    calls = []
+
+    def first_stuck(**request):
+        calls.append(1)
+        if len(calls) == 1:
+            release.wait(5)
+            return {"decision": "DENY"}
+        return answer(**request)
+    try:
+        assert caller.call(first_stuck, {}, in_ms(2000)) == {"decision": "ALLOW"}
+    finally:
+        release.set()
+    stats = caller.stats()
+    assert (stats["hedged"], stats["hedge_wins"]) == (1, 1)
+    assert stats["hedge_delay_ms"] == 20.0
+
+
+def test_hedges_are_capped(caller):
+    warm(caller)
+    calls = []
+
+    def slow(**request):
+        calls.append(1)
+        time.sleep(0.06)
+        return answer(**request)
+    caller.call(slow, {}, in_ms(2000))
+    assert len(calls) == 2
+    time.sleep(0.1)  # the hedge's loser finishes too
+    calls.clear()
+    # One hedge in the last three calls is over MAX_HEDGE_RATIO
+    caller.call(slow, {}, in_ms(2000))
+    assert len(calls) == 1
+    assert caller.stats()["hedges_capped"] == 1
+
+
+def send(caller: AvpCaller, call, header: str = "attempt=1; max=3"):
+    deadline._local.call = call
+    try:
+        return caller._before_send(SimpleNamespace(headers={"amz-sdk-request": header.encode()}))
+    finally:
+        deadline._local.call = None
+
+
+def test_before_send_skips_retries_that_would_answer_too_late():
+    caller = AvpCaller()
+    warm(caller, 0.1)
+    assert send(caller, None, "attempt=2; max=3") is None  # not an AvpCaller call
+    assert send(caller, _Call(None), "attempt=2; max=3") is None
+    assert send(caller, _Call(in_ms(50))) is None  # first attempts always go
+    assert send(caller, _Call(in_ms(500)), "attempt=2; max=3") is None
+    with pytest.raises(DeadlineExceeded, match="Retry skipped"):
+        send(caller, _Call(in_ms(50)), "attempt=2; max=3")
+    assert caller.stats()["late_retries_skipped"] == 1
+
+
+def test_before_send_abandons_answered_and_expired_calls():
+    caller = AvpCaller()
+    answered = _Call(in_ms(500))
+    answered.done = True
+    with pytest.raises(_Abandoned):
+        send(caller, answered)
+    with pytest.raises(DeadlineExceeded, match="before sending"):
+        send(caller, _Call(in_ms(-1)))
+    assert caller.stats()["attempts_abandoned"] == 2
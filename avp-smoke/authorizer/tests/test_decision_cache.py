@@ -0,0 +1,97 @@
+import pytest
+
+import decision_cache
+from decision_cache import DecisionCache, decision_key
+
+
+class Clock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(decision_cache, "time", clock)
+    return clock
+
+
+def key(groups=("readers",), method="GET", path="/orders", store="store-1", policy_key=None) -> tuple:
+    return decision_key(groups, method, path, store, policy_key)
+
+
+def test_key_normalizes_groups_and_method():
+    assert key(("b", "a", "a"), "get") == key(("a", "b"), "GET")
+
+
+def test_entry_expires_after_ttl(clock):
+    cache = DecisionCache(ttl_seconds=60)
+    cache.put(key(), "ALLOW")
+    clock.now += 59
+    assert cache.get(key()) == "ALLOW"
+    clock.now += 1
+    assert cache.get(key()) is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_entry_never_outlives_the_token(clock):
+    cache = DecisionCache(ttl_seconds=60)
+    cache.put(key(), "ALLOW", token_exp=clock.now + 10)
+    clock.now += 9
+    assert cache.get(key()) == "ALLOW"
+    clock.now += 1
+    assert cache.get(key()) is None
+
+
+def test_lru_eviction_at_max_size(clock):
+    cache = DecisionCache(max_size=2, ttl_seconds=60)
+    cache.put(key(path="/a"), "ALLOW")
+    cache.put(key(path="/b"), "DENY")
+    assert cache.get(key(path="/a")) == "ALLOW"  # /b is now least recently used
+    cache.put(key(path="/c"), "ALLOW")
+    assert cache.get(key(path="/b")) is None
+    assert cache.get(key(path="/a")) == "ALLOW"
+    assert cache.get(key(path="/c")) == "ALLOW"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_keys_are_separated_by_store_and_policy_key(clock):
+    cache = DecisionCache(ttl_seconds=60)
+    cache.put(key(store="store-1", policy_key=(1, "a")), "ALLOW")
+    assert cache.get(key(store="store-2", policy_key=(1, "a"))) is None
+    assert cache.get(key(store="store-1", policy_key=(1, "b"))) is None
+    assert cache.get(key(store="store-1", policy_key=(2, "a"))) is None
+    assert cache.get(key(store="store-1")) is None
+    assert cache.get(key(store="store-1", policy_key=(1, "a"))) == "ALLOW"
+
+
+def test_stale_decision_is_served_up_to_max_stale(clock):
+    cache = DecisionCache(ttl_seconds=60, max_stale_seconds=30)
+    cache.put(key(), "ALLOW")
+    clock.now += 60
+    assert cache.get(key()) is None
+    assert cache.get_stale(key()) == "ALLOW"
+    clock.now += 29
+    assert cache.get_stale(key()) == "ALLOW"
+    clock.now += 1
+    assert cache.get_stale(key()) is None
+    assert cache.stats()["stale_hits"] == 2
+    assert cache.stats()["stale_misses"] == 1
+
+
+def test_no_stale_decisions_by_default(clock):
+    cache = DecisionCache(ttl_seconds=60)
+    cache.put(key(), "ALLOW")
+    assert cache.get_stale(key()) == "ALLOW"
+    clock.now += 60
+    assert cache.get_stale(key()) is None
+
+
+def test_disabled_cache_stores_nothing(clock):
+    cache = DecisionCache(max_size=0)
+    cache.put(key(), "ALLOW")
+    assert cache.get(key()) is None
+    assert cache.get_stale(key()) is None
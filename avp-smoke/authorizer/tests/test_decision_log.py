@@ -0,0 +1,60 @@
+import logging
+
+import pytest
+
+import decision_log
+from decision_log import DECISION_LOGGER, AsyncLogHandler, DecisionLog, configure
+
+
+class Capture(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record: logging.LogRecord):
+        self.records.append(record)
+
+
+@pytest.fixture
+def captured():
+    handler = Capture()
+    logger = logging.getLogger(DECISION_LOGGER)
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    yield handler.records
+    logger.removeHandler(handler)
+
+
+def test_sampled_allow_leaves_the_callers_fields_untouched(captured, monkeypatch):
+    monkeypatch.setattr(decision_log.random, "random", lambda: 0.1)
+    log = DecisionLog(True, allow_sample_rate=0.5)
+    fields = {"method": "GET", "path": "/orders"}
+    log.log(200, "", fields, 1.23456)
+    assert fields == {"method": "GET", "path": "/orders"}
+    record = captured[0].decision_record
+    assert record["decision"] == "ALLOW" and record["sample_rate"] == 0.5
+    assert record["duration_ms"] == 1.235
+
+
+def test_denials_are_never_sampled(captured, monkeypatch):
+    monkeypatch.setattr(decision_log.random, "random", lambda: 0.9)
+    log = DecisionLog(True, allow_sample_rate=0.5)
+    log.log(200, "", {}, 1.0)
+    log.log(403, "Access denied", {}, 1.0)
+    assert [r.decision_record["status"] for r in captured] == [403]
+    assert "sample_rate" not in captured[0].decision_record
+    assert log.stats() == {"records": 1, "sampled_out": 1}
+
+
+def test_configure_writes_inline_unless_a_queue_is_asked_for(monkeypatch):
+    root = logging.getLogger()
+    handler = logging.NullHandler()
+    monkeypatch.setattr(root, "handlers", [handler])
+    assert configure("text", 0) is None
+    assert root.handlers == [handler]
+    async_handler = configure("text", 100)
+    try:
+        assert isinstance(async_handler, AsyncLogHandler)
+        assert root.handlers == [async_handler]
+    finally:
+        async_handler.close()
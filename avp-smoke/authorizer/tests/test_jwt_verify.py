@@ -0,0 +1,172 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+
+import pytest
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+
+from jwt_verify import JwksCache, JwtError, JwtVerifier
+
+SECRET = "s3cret"
+
+
+def b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def segment(value) -> str:
+    return b64(json.dumps(value).encode())
+
+
+def hs256(claims: dict, secret: str = SECRET, header: dict = None) -> str:
+    signing_input = f"{segment(header or {'alg': 'HS256', 'typ': 'JWT'})}.{segment(claims)}"
+    mac = hmac.new(secret.encode(), signing_input.encode(), hashlib.sha256).digest()
+    return f"{signing_input}.{b64(mac)}"
+
+
+def rs256(claims: dict, key, kid: str) -> str:
+    signing_input = f"{segment({'alg': 'RS256', 'kid': kid})}.{segment(claims)}"
+    signature = key.sign(signing_input.encode(), padding.PKCS1v15(), hashes.SHA256())
+    return f"{signing_input}.{b64(signature)}"
+
+
+def jwk(key, kid: str) -> dict:
+    numbers = key.public_key().public_numbers()
+    as_b64 = lambda n: b64(n.to_bytes((n.bit_length() + 7) // 8, "big"))
+    return {"kty": "RSA", "kid": kid, "alg": "RS256", "use": "sig", "n": as_b64(numbers.n), "e": as_b64(numbers.e)}
+
+
+@pytest.fixture(scope="module")
+def rsa_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+@pytest.fixture
+def jwks_file(tmp_path, rsa_key):
+    path = tmp_path / "jwks.json"
+    path.write_text(json.dumps({"keys": [jwk(rsa_key, "k1")]}))
+    return path
+
+
+def test_hs256_valid():
+    claims = {"sub": "alice", "iss": "https://idp", "exp": int(time.time()) + 60}
+    assert JwtVerifier(hmac_secret=SECRET).verify(hs256(claims)) == claims
+
+
+def test_hs256_tampered():
+    verifier = JwtVerifier(hmac_secret=SECRET)
+    token = hs256({"sub": "alice", "groups": ["users"]})
+    header, _, signature = token.split(".")
+    forged = f"{header}.{segment({'sub': 'alice', 'groups': ['admins']})}.{signature}"
+    with pytest.raises(JwtError, match="Invalid signature"):
+        verifier.verify(forged)
+    with pytest.raises(JwtError, match="Invalid signature"):
+        verifier.verify(hs256({"sub": "alice"}, secret="other"))
+
+
+def test_alg_none_rejected():
+    token = f"{segment({'alg': 'none'})}.{segment({'sub': 'alice'})}."
+    with pytest.raises(JwtError, match="Algorithm not allowed"):
+        JwtVerifier(hmac_secret=SECRET).verify(token)
+
+
+def test_hs256_against_rs256_keys_rejected(jwks_file, rsa_key):
+    # Key confusion: HMAC keyed with the RSA public key an attacker can download
+    public_pem = rsa_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+    token = hs256({"sub": "alice"}, secret=public_pem, header={"alg": "HS256", "kid": "k1"})
+    jwks = JwksCache(f"file://{jwks_file}")
+    with pytest.raises(JwtError, match="Algorithm not allowed"):
+        JwtVerifier(jwks=jwks, algorithms=["RS256"]).verify(token)
+    with pytest.raises(JwtError, match="HS256 secret not configured"):
+        JwtVerifier(jwks=jwks).verify(token)
+
+
+def test_issuer_mismatch():
+    verifier = JwtVerifier(hmac_secret=SECRET, allowed_issuers=["https://idp"])
+    assert verifier.verify(hs256({"iss": "https://idp"}))
+    for claims in ({"iss": "https://evil"}, {}, {"iss": ["https://idp"]}):
+        with pytest.raises(JwtError, match="Issuer not allowed"):
+            verifier.verify(hs256(claims))
+
+
+def test_audience_mismatch():
+    verifier = JwtVerifier(hmac_secret=SECRET, allowed_audiences=["api"])
+    assert verifier.verify(hs256({"aud": "api"}))
+    assert verifier.verify(hs256({"aud": ["other", "api"]}))
+    for claims in ({"aud": "other"}, {}, {"aud": {"api": 1}}, {"aud": [["api"]]}):
+        with pytest.raises(JwtError, match="Audience not allowed"):
+            verifier.verify(hs256(claims))
+
+
+def test_rs256_through_file_jwks(jwks_file, rsa_key):
+    verifier = JwtVerifier(jwks=JwksCache(f"file://{jwks_file}"), allowed_issuers=["https://idp"])
+    claims = {"sub": "alice", "iss": "https://idp"}
+    assert verifier.verify(rs256(claims, rsa_key, "k1")) == claims
+
+    other = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    with pytest.raises(JwtError, match="Invalid signature"):
+        verifier.verify(rs256(claims, other, "k1"))
+
+
+def test_kid_miss_refetch_is_throttled(jwks_file, rsa_key):
+    jwks = JwksCache(f"file://{jwks_file}", min_refetch_interval=3600)
+    verifier = JwtVerifier(jwks=jwks)
+    verifier.verify(rs256({"sub": "alice"}, rsa_key, "k1"))
+    assert jwks.fetches == 1
+
+    # A flood of unknown kids costs at most one refetch per min_refetch_interval
+    for i in range(20):
+        with pytest.raises(JwtError, match="No RS256 key"):
+            verifier.verify(rs256({"sub": "alice"}, rsa_key, f"forged-{i}"))
+    assert jwks.kid_misses == 20
+    assert jwks.fetches == 1
+
+    # Once the interval has passed, an unknown kid refetches and finds a rotated key
+    rotated = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwks_file.write_text(json.dumps({"keys": [jwk(rsa_key, "k1"), jwk(rotated, "k2")]}))
+    jwks.min_refetch_interval = 0
+    assert verifier.verify(rs256({"sub": "bob"}, rotated, "k2")) == {"sub": "bob"}
+    assert jwks.fetches == 2
+
+
+@pytest.mark.parametrize("claims", [
+    {"nbf": "soon"}, {"nbf": [1]}, {"nbf": True}, {"exp": "never"}, {"exp": {"at": 1}},
+])
+def test_malformed_time_claims(claims):
+    with pytest.raises(JwtError, match="Malformed"):
+        JwtVerifier(hmac_secret=SECRET).verify(hs256(claims))
+
+
+def test_not_yet_valid():
+    verifier = JwtVerifier(hmac_secret=SECRET, leeway=5)
+    assert verifier.verify(hs256({"nbf": time.time() + 2}))
+    with pytest.raises(JwtError, match="not yet valid"):
+        verifier.verify(hs256({"nbf": time.time() + 60}))
+
+
+
+def test_expired_within_leeway():
+    verifier = JwtVerifier(hmac_secret=SECRET, leeway=5)
+    assert verifier.verify(hs256({"exp": time.time() - 2}))
+    with pytest.raises(JwtError, match="expired"):
+        verifier.verify(hs256({"exp": time.time() - 60}))
+    with pytest.raises(JwtError, match="expired"):
+        JwtVerifier(hmac_secret=SECRET).verify(hs256({"exp": time.time() - 2}))
+
+@pytest.mark.parametrize("token", [
+    "a.b",
+    f"{segment({'alg': ['HS256']})}.{segment({})}.sig",
+    f"{segment({'alg': 'RS256', 'kid': {'x': 1}})}.{segment({})}.sig",
+    f"{segment({'alg': 'HS256'})}.{segment({})}.é",
+    f"{segment({'alg': 'HS256'})}.é.sig",
+    f"{segment([1])}.{segment({})}.sig",
+    "!!!.e30.sig",
+])
+def test_malformed_tokens(token):
+    with pytest.raises(JwtError):
+        JwtVerifier(hmac_secret=SECRET, jwks=JwksCache("file:///nonexistent")).verify(token)
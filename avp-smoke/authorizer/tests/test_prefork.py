@@ -0,0 +1,163 @@
+import os
+import re
+import signal
+import time
+
+import pytest
+
+import decision_cache
+import prefork
+from decision_cache import SharedDecisionCache, decision_key
+from metrics import Metrics
+from prefork import MetricsExchange, Supervisor
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(decision_cache, "time", clock)
+    return clock
+
+
+def key(path: str) -> tuple:
+    return decision_key(("readers",), "GET", path, "store")
+
+
+def run_in_child(fn) -> int:
+    """Exit code of fn() run in a forked child (0 when it returns True)."""
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            code = 0 if fn() else 1
+        finally:
+            os._exit(code)
+    _, status = os.waitpid(pid, 0)
+    return os.waitstatus_to_exitcode(status)
+
+
+def test_slot_round_trip(clock):
+    cache = SharedDecisionCache(max_size=64, ttl_seconds=60)
+    cache.put(key("/a"), "ALLOW")
+    cache.put(key("/b"), "DENY")
+    cache.put(key("/c"), "MAYBE")  # only ALLOW/DENY have a slot code
+    assert cache.get(key("/a")) == "ALLOW"
+    assert cache.get(key("/b")) == "DENY"
+    assert cache.get(key("/c")) is None
+    cache.put(key("/a"), "DENY")
+    assert cache.get(key("/a")) == "DENY"
+    stats = cache.stats()
+    assert (stats["size"], stats["hits"], stats["misses"]) == (2, 3, 1)
+
+
+def test_full_set_replaces_the_entry_closest_to_expiry(clock):
+    # One bucket of two ways: every key lands in the same set
+    cache = SharedDecisionCache(max_size=2, ttl_seconds=60, ways=2)
+    cache.put(key("/soon"), "ALLOW", token_exp=clock.now + 10)
+    cache.put(key("/later"), "ALLOW", token_exp=clock.now + 50)
+    cache.put(key("/new"), "DENY")
+    assert cache.get(key("/soon")) is None
+    assert cache.get(key("/later")) == "ALLOW"
+    assert cache.get(key("/new")) == "DENY"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_expiry_and_stale_window(clock):
+    cache = SharedDecisionCache(max_size=64, ttl_seconds=60, max_stale_seconds=30)
+    cache.put(key("/a"), "ALLOW", token_exp=clock.now + 20)
+    clock.now += 20
+    assert cache.get(key("/a")) is None
+    assert cache.get_stale(key("/a")) == "ALLOW"
+    clock.now += 30
+    assert cache.get_stale(key("/a")) is None
+    assert cache.get(key("/a")) is None
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["size"] == 0
+
+
+def test_entries_are_shared_across_fork():
+    cache = SharedDecisionCache(max_size=64, ttl_seconds=60)
+    cache.put(key("/parent"), "ALLOW")
+
+    def child():
+        cache.put(key("/child"), "DENY")
+        return cache.get(key("/parent")) == "ALLOW"
+
+    assert run_in_child(child) == 0
+    assert cache.get(key("/child")) == "DENY"
+    # Counters live in the mapping too: the child's hit is counted
+    assert cache.stats()["hits"] == 2
+
+
+def test_metrics_exchange_merges_other_workers(tmp_path):
+    own, other = Metrics(), Metrics()
+    own.inc("decisions_total", "ALLOW", "cache")
+    other.inc("decisions_total", "ALLOW", "cache")
+    other.inc("decisions_total", "DENY", "AVP")
+    other.observe("avp", 0.02)
+    MetricsExchange(str(tmp_path), 1, other).write()
+    (tmp_path / "metrics-2.json").write_text("{truncated")  # a worker mid-write is skipped
+
+    exchange = MetricsExchange(str(tmp_path), 0, own)
+    exchange.write()
+    text = exchange.render_prometheus()
+    assert re.search(r'decisions_total\{decision="ALLOW",source="cache"\} 2\n', text)
+    assert re.search(r'decisions_total\{decision="DENY",source="AVP"\} 1\n', text)
+    assert re.search(r'stage_duration_seconds_count\{stage="avp"\} 1\n', text)
+
+
+def test_restarted_worker_continues_its_counters(tmp_path):
+    previous = Metrics()
+    previous.inc("decisions_total", "ALLOW", "AVP")
+    MetricsExchange(str(tmp_path), 0, previous).write()
+
+    restarted = Metrics()
+    exchange = MetricsExchange(str(tmp_path), 0, restarted)
+    exchange.start()
+    restarted.inc("decisions_total", "ALLOW", "AVP")
+    assert re.search(r'decisions_total\{decision="ALLOW",source="AVP"\} 2\n', exchange.render_prometheus())
+
+
+def test_supervisor_restarts_workers_and_stops_them(tmp_path, monkeypatch):
+    monkeypatch.setattr(prefork, "RESTART_BACKOFF_SECONDS", 0)
+
+    def run_worker(worker_id, state_dir):
+        starts = tmp_path / f"worker-{worker_id}"
+        with open(starts, "a") as f:
+            f.write(f"{os.getpid()}\n")
+        if worker_id == 0 and len(starts.read_text().split()) == 1:
+            raise RuntimeError("first start of worker 0 crashes")
+        while True:
+            time.sleep(0.01)
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            Supervisor(2, run_worker, grace_seconds=2).run()
+        finally:
+            os._exit(0)
+    try:
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            starts = [(tmp_path / f"worker-{i}") for i in range(2)]
+            if all(s.exists() for s in starts) and len(starts[0].read_text().split()) == 2:
+                break
+            time.sleep(0.01)
+        else:
+            pytest.fail("workers did not start and restart")
+    finally:
+        os.kill(pid, signal.SIGTERM)
+        _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    for path in tmp_path.glob("worker-*"):
+        for worker_pid in path.read_text().split():
+            with pytest.raises(ProcessLookupError):
+                os.kill(int(worker_pid), 0)
@@ -0,0 +1,38 @@
+from route_index import RouteIndex
+
+
+def _index(*routes) -> RouteIndex:
+    return RouteIndex.from_context({"parameters": {"cedar": {"namespace": "App"}, "routes": list(routes)}})
+
+
+def test_single_action_route_uses_its_action():
+    index = _index({"path": "/orders/{id}", "method": "GET", "app_component": "Orders", "policies": {"List": ["r"]}})
+    route = index.match("get", "/orders/7")
+    assert (route.template, route.action, route.resource_type) == ("/orders/{id}", "List", "App::Orders")
+    assert index.match("POST", "/orders/7") is None
+
+
+def test_multi_action_route_maps_each_method_to_its_action():
+    index = _index({"path": "/orders", "method": "*", "policies": {"Read": ["r"], "Update": ["w"]}})
+    assert index.match("GET", "/orders").action == "Read"
+    assert index.match("HEAD", "/orders").action == "Read"
+    assert index.match("PATCH", "/orders").action == "Update"
+    assert index.match("PUT", "/orders").action == "Update"
+    assert index.match("DELETE", "/orders") is None
+
+
+def test_multi_action_route_keeps_its_method():
+    index = _index({"path": "/orders", "method": "PATCH", "policies": {"Read": ["r"], "Update": ["w"]}})
+    assert index.match("PATCH", "/orders").action == "Update"
+    assert index.match("GET", "/orders") is None
+
+
+def test_literal_wins_over_param_and_catch_all():
+    index = _index(
+        {"path": "/files/{proxy+}", "method": "GET", "policies": {"Read": ["r"]}},
+        {"path": "/files/{id}", "method": "GET", "policies": {"Read": ["r"]}},
+        {"path": "/files/latest", "method": "GET", "policies": {"Read": ["r"]}},
+    )
+    assert index.match("GET", "/files/latest").template == "/files/latest"
+    assert index.match("GET", "/files/3").template == "/files/{id}"
+    assert index.match("GET", "/files/3/raw").template == "/files/{proxy+}"
@@ -0,0 +1,42 @@
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def _start_leader(flight: SingleFlight, release: threading.Event, results: list) -> threading.Thread:
+    def lead():
+        results.append(flight.do("key", lambda: release.wait(2) and "leader"))
+    thread = threading.Thread(target=lead)
+    thread.start()
+    while not flight.stats()["in_flight"]:
+        time.sleep(0.001)
+    return thread
+
+
+def test_waiter_shares_the_result():
+    flight, release, results = SingleFlight(), threading.Event(), []
+    leader = _start_leader(flight, release, results)
+    waiter = threading.Thread(target=lambda: results.append(flight.do("key", lambda: "own call")))
+    waiter.start()
+    time.sleep(0.02)
+    release.set()
+    leader.join()
+    waiter.join()
+    assert results == ["leader", "leader"]
+    assert flight.stats()["coalesced"] == 1
+
+
+def test_waiter_gives_up_at_its_timeout():
+    flight, release, results = SingleFlight(), threading.Event(), []
+    leader = _start_leader(flight, release, results)
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        flight.do("key", lambda: "own call", timeout=0.05)
+    assert time.monotonic() - start < 1
+    release.set()
+    leader.join()
+    assert results == ["leader"]
+    assert flight.stats()["timeouts"] == 1
@@ -0,0 +1,98 @@
+"""
+Parsed-token cache for the AVP authorizer.
+
+Clients reuse the same bearer token for hours, so the claims we need
+(subject, issuer, groups, exp) are parsed once per token and kept in a
+bounded LRU keyed by a digest of the raw token. Because the digest covers
+the signature segment, cached entries are only ever served for the exact
+token that was verified/decoded. Entries expire at the token's `exp`.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+
+class ParsedToken(NamedTuple):
+    """Claims used on the hot path; `claims` is the full payload (read-only)."""
+    subject: str
+    issuer: str
+    groups: tuple
+    exp: Optional[int]
+    claims: dict
+
+
+def parse_token(claims: dict) -> ParsedToken:
+    """Normalize a decoded JWT payload into a ParsedToken."""
+    groups = claims.get("groups", ())
+    if isinstance(groups, str):
+        groups = (groups,)
+    exp = claims.get("exp")
+    return ParsedToken(
+        subject=claims.get("sub", "unknown"),
+        issuer=claims.get("iss", ""),
+        groups=tuple(groups),
+        exp=int(exp) if exp else None,
+        claims=claims,
+    )
+
+
+class TokenCache:
+    """Thread-safe LRU of token digest -> ParsedToken, expiring at exp."""
+
+    def __init__(self, max_size: int = 10000, max_ttl_seconds: float = 300.0):
+        self.max_size = max_size
+        self.max_ttl_seconds = max_ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+    def get(self, key: bytes) -> Optional[ParsedToken]:
+        if self.max_size <= 0:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: bytes, parsed: ParsedToken):
+        if self.max_size <= 0:
+            return
+
+        expires_at = time.time() + self.max_ttl_seconds
+        if parsed.exp:
+            expires_at = min(expires_at, parsed.exp)
+            if expires_at <= time.time():
+                return
+
+        with self._lock:
+            self._entries[key] = (parsed, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
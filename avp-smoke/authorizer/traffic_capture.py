@@ -0,0 +1,131 @@
+"""
+Traffic capture of the in-cluster authorizer, for offline replay.
+
+With CAPTURE_DIR set, server.py writes one compact JSON line per check to
+capture-<pid>.jsonl in that directory (one file per pre-fork worker):
+
+    {"t":1714564800.123,"m":"GET","p":"/orders/123","h":"api.example.com",
+     "c":"9f2c0b...","g":["admin"],"cl":{"custom:groups":["admin"]},
+     "r":"/orders/{id}","d":"ALLOW","s":200,"src":"cache","ms":0.41,
+     "st":{"parse":0.004,"token":0.011,"cache":0.006}}
+
+t is the check start (epoch seconds), c a digest of the bearer token (same
+token, same digest; neither the token nor its claims can be recovered from
+it), g its groups, cl the claims the policies read (CAPTURE_CLAIMS, e.g.
+`custom:groups`; the replay mints them into its token so the policies see
+the same values), r the matched route template, d/s the decision and
+status, src where it came from (AVP, Local, cache, stale, route), ms the
+check duration and st the milliseconds per stage. Query strings, subjects
+and signatures are never written. Checks rejected for their token (missing,
+malformed, invalid or expired) are not captured: the replay mints a valid
+token per digest and could not reproduce them.
+
+Records go through a decision_log.AsyncLogHandler: the check only appends
+to a bounded queue and a full queue drops the record instead of blocking.
+The file rotates at max_bytes into gzip-compressed segments
+(capture-<pid>.jsonl.1.gz is the newest) and only max_files are kept.
+bench/replay.py streams a capture back against the authorizer.
+"""
+
+import gzip
+import json
+import logging
+import os
+import shutil
+import threading
+from logging.handlers import RotatingFileHandler
+
+from decision_log import AsyncLogHandler
+
+CAPTURE_LOGGER = "authz.capture"
+
+
+def _gzip_name(name: str) -> str:
+    return f"{name}.gz"
+
+
+def _gzip_rotate(source: str, dest: str):
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+class _CaptureFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(record.capture_record, separators=(",", ":"))
+
+
+class TrafficCapture:
+    """
+    Writes sanitized check records to a rotating capture file.
+
+    sample_rate keeps that share of tokens (by digest, all checks of a kept
+    token), so the replayed traffic has the same per-token cache locality.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 64 * 1024 * 1024, max_files: int = 5,
+                 sample_rate: float = 1.0, queue_size: int = 10000):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+        self.queue_size = queue_size
+        self.logger = logging.getLogger(CAPTURE_LOGGER)
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.handler = None
+        self._stats_lock = threading.Lock()
+        self.records = 0
+        self.sampled_out = 0
+
+    def start(self):
+        """Open this process's capture file (each pre-fork worker calls this)."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"capture-{os.getpid()}.jsonl")
+        file_handler = RotatingFileHandler(path, maxBytes=self.max_bytes, backupCount=max(self.max_files - 1, 0))
+        file_handler.namer = _gzip_name
+        file_handler.rotator = _gzip_rotate
+        file_handler.setFormatter(_CaptureFormatter())
+        self.handler = AsyncLogHandler([file_handler], max(self.queue_size, 1))
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+        self.logger.addHandler(self.handler)
+        return path
+
+    def record(self, fields: dict, status_code: int, start_time: float, duration_ms: float, stages: dict):
+        """Capture one check; fields are the decision log fields plus "token" (digest)."""
+        token = fields.get("token")
+        if "subject" not in fields or self.handler is None:
+            return
+        if self.sample_rate < 1.0 and int(token[:8], 16) >= self.sample_rate * 0x100000000:
+            with self._stats_lock:
+                self.sampled_out += 1
+            return
+        entry = {
+            "t": round(start_time, 3),
+            "m": fields.get("method"),
+            "p": fields.get("path"),
+            "h": fields.get("host"),
+            "c": token,
+            "g": fields.get("groups", ()),
+        }
+        if fields.get("claims"):
+            entry["cl"] = fields["claims"]
+        if "route" in fields:
+            entry["r"] = fields["route"]
+        entry["d"] = "ALLOW" if status_code == 200 else "DENY"
+        entry["s"] = status_code
+        entry["src"] = fields.get("source")
+        entry["ms"] = round(duration_ms, 3)
+        if stages:
+            entry["st"] = {stage: round(seconds * 1000, 3) for stage, seconds in stages.items()}
+        with self._stats_lock:
+            self.records += 1
+        self.logger.info("capture", extra={"capture_record": entry})
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = {"records": self.records, "sampled_out": self.sampled_out}
+        if self.handler is not None:
+            stats.update(self.handler.stats())
+        return stats
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: per-request allocations and CPU time of building the
+IsAuthorized request, before (inline dict tree, as the handlers used to do)
+and after (EntityBuilder with reused fragments).
+
+Usage:
+    python3 bench/bench_entities.py [--requests 20000] [--groups 1 10 50]
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "authorizer"))
+
+from entity_builder import CheckRequest, EntityBuilder  # noqa: E402
+
+POLICY_STORE_ID = "ps-bench"
+
+
+def legacy_build(subject, issuer, groups, method, path, host) -> dict:
+    """The original per-request construction from server.py/lambda_handler.py."""
+    entities = []
+    entities.append({
+        "identifier": {"entityType": "ApiAccess::User", "entityId": subject},
+        "attributes": {"sub": {"string": subject}, "iss": {"string": issuer}},
+        "parents": [{"entityType": "ApiAccess::Group", "entityId": g} for g in groups]
+    })
+    for group in groups:
+        entities.append({
+            "identifier": {"entityType": "ApiAccess::Group", "entityId": group},
+            "attributes": {"name": {"string": group}}
+        })
+    entities.append({
+        "identifier": {"entityType": "ApiAccess::Resource", "entityId": f"resource:{path}"},
+        "attributes": {"path": {"string": path}, "method": {"string": method}, "host": {"string": host}}
+    })
+    return dict(
+        policyStoreId=POLICY_STORE_ID,
+        principal={"entityType": "ApiAccess::User", "entityId": subject},
+        action={"actionType": "ApiAccess::Action", "actionId": method},
+        resource={"entityType": "ApiAccess::Resource", "entityId": f"resource:{path}"},
+        entities={"entityList": entities}
+    )
+
+
+def workload(n_requests: int, n_groups: int, n_users: int = 50, n_paths: int = 20) -> list:
+    """Synthetic checks: a few users (each reusing its token) over a few paths."""
+    groups = tuple(f"AWS_PlataformaUpstream_Role{i}_Desa" for i in range(n_groups))
+    return [
+        CheckRequest(
+            method="GET" if i % 3 else "POST",
+            path=f"/wells-manager/route-{i % n_paths}",
+            host="api.example.com",
+            subject=f"user-{i % n_users}",
+            issuer="https://testing.secure.istio.io",
+            groups=groups,
+        )
+        for i in range(n_requests)
+    ]
+
+
+def run_legacy(checks):
+    return [legacy_build(c.subject, c.issuer, c.groups, c.method, c.path, c.host) for c in checks]
+
+
+def run_builder(checks):
+    builder = EntityBuilder(POLICY_STORE_ID)
+    return [builder.build(c) for c in checks]
+
+
+def measure(fn, checks) -> tuple:
+    """Return (µs per request, bytes allocated per request, blocks per request)."""
+    start = time.perf_counter()
+    fn(checks)
+    cpu_us = (time.perf_counter() - start) * 1e6 / len(checks)
+
+    tracemalloc.start()
+    blocks_before = sys.getallocatedblocks()
+    base, _ = tracemalloc.get_traced_memory()
+    results = fn(checks)
+    current, _ = tracemalloc.get_traced_memory()
+    blocks = sys.getallocatedblocks() - blocks_before
+    tracemalloc.stop()
+    del results
+    return cpu_us, (current - base) / len(checks), blocks / len(checks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--groups", type=int, nargs="+", default=[1, 10, 50])
+    args = parser.parse_args()
+
+    print(f"{'groups':>6} {'variant':>8} {'us/req':>8} {'bytes/req':>10} {'blocks/req':>10}")
+    for n_groups in args.groups:
+        checks = workload(args.requests, n_groups)
+        for name, fn in (("legacy", run_legacy), ("builder", run_builder)):
+            cpu_us, alloc_bytes, blocks = measure(fn, checks)
+            print(f"{n_groups:>6} {name:>8} {cpu_us:>8.2f} {alloc_bytes:>10.0f} {blocks:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
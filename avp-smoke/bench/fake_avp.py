@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Amazon Verified Permissions API (offline benchmarks).
+
+Speaks the AWS JSON 1.0 protocol botocore uses for IsAuthorized and
+BatchIsAuthorized, so the authorizer runs unchanged against it by setting
+AWS_ENDPOINT_URL_VERIFIEDPERMISSIONS=http://127.0.0.1:<port>. It also keeps
+an in-memory policy store (ListPolicies, CreatePolicy, UpdatePolicy,
+DeletePolicy) for avp/generate-cedars.py --upload; its policies don't affect
+the decisions.
+
+Latency and errors are injected per API call: a fixed latency plus uniform
+jitter, a fraction of slow calls (a long tail, as from a slow AVP host), and
+a fraction of calls answered with ThrottlingException (HTTP 400, retried by
+botocore) or InternalServerException (HTTP 500). Decisions are a
+stable function of (principal, action, resource) so the decision cache sees
+the same answers a real policy store would give.
+
+Usage:
+    python3 bench/fake_avp.py [--port 18080] [--latency-ms 15] [--jitter-ms 5]
+                              [--slow-rate 0.02] [--slow-ms 500]
+                              [--deny-rate 0.1] [--throttle-rate 0.01] [--error-rate 0]
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TARGET_PREFIX = "VerifiedPermissions."
+
+
+class FakeAvpConfig:
+    def __init__(self, latency_ms: float = 15.0, jitter_ms: float = 5.0, deny_rate: float = 0.0,
+                 throttle_rate: float = 0.0, error_rate: float = 0.0, slow_rate: float = 0.0,
+                 slow_ms: float = 500.0, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.deny_rate = deny_rate
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+
+
+def _decide(request: dict, deny_rate: float) -> dict:
+    key = json.dumps(
+        [request.get("principal"), request.get("action"), request.get("resource")], sort_keys=True
+    ).encode()
+    bucket = int.from_bytes(hashlib.blake2b(key, digest_size=4).digest(), "big") / 2**32
+    if bucket < deny_rate:
+        return {"decision": "DENY", "determiningPolicies": [], "errors": []}
+    return {"decision": "ALLOW", "determiningPolicies": [{"policyId": "fake-allow"}], "errors": []}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: dict, error_type: str = None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/x-amz-json-1.0")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("x-amzn-RequestId", f"fake-{time.monotonic_ns()}")
+        if error_type:
+            self.send_header("x-amzn-ErrorType", error_type)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _error(self, status: int, error_type: str, message: str):
+        self._send(status, {"__type": error_type, "message": message}, error_type)
+
+    def do_POST(self):
+        server = self.server
+        config = server.config
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        operation = self.headers.get("X-Amz-Target", "")[len(TARGET_PREFIX):]
+
+        with server.lock:
+            server.calls[operation] = server.calls.get(operation, 0) + 1
+            roll = config.random.random()
+            delay = config.latency_ms + config.random.uniform(-config.jitter_ms, config.jitter_ms)
+            if config.random.random() < config.slow_rate:
+                delay += config.slow_ms
+                server.injected["slow"] = server.injected.get("slow", 0) + 1
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+        if roll < config.throttle_rate:
+            server.count("throttled")
+            return self._error(400, "ThrottlingException", "Rate exceeded")
+        if roll < config.throttle_rate + config.error_rate:
+            server.count("errors")
+            return self._error(500, "InternalServerException", "Injected failure")
+
+        if operation in _POLICY_OPERATIONS:
+            return _POLICY_OPERATIONS[operation](self, server, body)
+        if operation == "IsAuthorized":
+            return self._send(200, _decide(body, config.deny_rate))
+        if operation == "BatchIsAuthorized":
+            results = [dict(_decide(item, config.deny_rate), request=item) for item in body.get("requests", [])]
+            return self._send(200, {"results": results})
+        return self._error(400, "ValidationException", f"Unsupported operation: {operation}")
+
+
+def _timestamp() -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+def _policy_item(server, policy_id: str) -> dict:
+    policy = server.policies[policy_id]
+    return {
+        "policyStoreId": policy["policyStoreId"],
+        "policyId": policy_id,
+        "policyType": "STATIC",
+        "definition": {"static": {"description": policy["description"]}},
+        "createdDate": policy["createdDate"],
+        "lastUpdatedDate": policy["lastUpdatedDate"],
+    }
+
+
+def _static_definition(handler, body: dict):
+    static = body.get("definition", {}).get("static", {})
+    statement = static.get("statement", "").lstrip()
+    if not statement.startswith(("permit", "forbid", "@")):
+        handler._error(400, "ValidationException", "Invalid Cedar policy statement")
+        return None
+    return static
+
+
+def _list_policies(handler, server, body: dict):
+    with server.lock:
+        ids = sorted(p for p, policy in server.policies.items() if policy["policyStoreId"] == body.get("policyStoreId"))
+        start = int(body.get("nextToken") or 0)
+        page = ids[start:start + int(body.get("maxResults") or 50)]
+        items = [_policy_item(server, policy_id) for policy_id in page]
+    response = {"policies": items}
+    if start + len(page) < len(ids):
+        response["nextToken"] = str(start + len(page))
+    return handler._send(200, response)
+
+
+def _create_policy(handler, server, body: dict):
+    static = _static_definition(handler, body)
+    if static is None:
+        return None
+    with server.lock:
+        token = (body.get("policyStoreId"), body.get("clientToken"))
+        policy_id = server.client_tokens.get(token) if token[1] else None
+        if policy_id is None or policy_id not in server.policies:
+            policy_id = uuid.uuid4().hex[:22]
+            server.client_tokens[token] = policy_id
+            server.policies[policy_id] = {
+                "policyStoreId": body.get("policyStoreId"), "statement": static["statement"],
+                "description": static.get("description", ""), "createdDate": _timestamp(),
+                "lastUpdatedDate": _timestamp(),
+            }
+        item = _policy_item(server, policy_id)
+    del item["definition"]
+    return handler._send(200, item)
+
+
+def _update_policy(handler, server, body: dict):
+    static = _static_definition(handler, body)
+    if static is None:
+        return None
+    with server.lock:
+        policy = server.policies.get(body.get("policyId"))
+        if policy is None:
+            return handler._error(404, "ResourceNotFoundException", "Policy not found")
+        policy.update(statement=static["statement"], description=static.get("description", ""),
+                      lastUpdatedDate=_timestamp())
+        item = _policy_item(server, body["policyId"])
+    del item["definition"]
+    return handler._send(200, item)
+
+
+def _delete_policy(handler, server, body: dict):
+    with server.lock:
+        if server.policies.pop(body.get("policyId"), None) is None:
+            return handler._error(404, "ResourceNotFoundException", "Policy not found")
+    return handler._send(200, {})
+
+
+_POLICY_OPERATIONS = {
+    "ListPolicies": _list_policies,
+    "CreatePolicy": _create_policy,
+    "UpdatePolicy": _update_policy,
+    "DeletePolicy": _delete_policy,
+}
+
+
+class FakeAvpServer(ThreadingHTTPServer):
+    """Threaded fake AVP endpoint listening on 127.0.0.1."""
+
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, port: int = 0, config: FakeAvpConfig = None):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.config = config or FakeAvpConfig()
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.injected = {}
+        self.policies = {}
+        self.client_tokens = {}
+
+    @property
+    def endpoint_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, name: str):
+        with self.lock:
+            self.injected[name] = self.injected.get(name, 0) + 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"calls": dict(self.calls), "injected": dict(self.injected), "policies": len(self.policies)}
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency-ms", type=float, default=15.0, help="fixed AVP latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=5.0, help="uniform jitter added to the latency")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fraction of calls slowed by --slow-ms")
+    parser.add_argument("--slow-ms", type=float, default=500.0, help="extra latency of a slow call")
+    parser.add_argument("--deny-rate", type=float, default=0.0, help="fraction of questions answered DENY")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of calls throttled")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls failing with HTTP 500")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def config_from_args(args) -> FakeAvpConfig:
+    return FakeAvpConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        deny_rate=args.deny_rate,
+        throttle_rate=args.throttle_rate,
+        error_rate=args.error_rate,
+        slow_rate=args.slow_rate,
+        slow_ms=args.slow_ms,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=18080)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = FakeAvpServer(args.port, config_from_args(args))
+    print(f"Fake AVP listening on {server.endpoint_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(server.stats()))
+
+
+if __name__ == "__main__":
+    main()
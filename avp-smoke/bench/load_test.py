@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Offline load test of the authorizer against the local fake AVP endpoint.
+
+Modes:
+- server:     runs authorizer/server.py as a subprocess and drives it over
+              HTTP from --concurrency client threads (ext-authz headers)
+- lambda-alb: calls lambda_handler.handler in-process with ALB events
+- lambda-url: same, with Lambda Function URL events
+
+Each Lambda mode loads a fresh copy of lambda_handler (its import time is
+reported as init_ms) and runs events one at a time, like a single execution
+environment. Every mode gets its own fake AVP (bench/fake_avp.py) so caches
+and injected errors do not leak between modes. Reports throughput,
+p50/p95/p99/max latency, status codes and the authorizer's mean time per
+stage (from /metrics or the Lambda metrics summary).
+
+Usage:
+    python3 bench/load_test.py [--modes server lambda-alb lambda-url]
+        [--requests 5000] [--concurrency 16] [--users 200] [--paths 20]
+        [--latency-ms 15] [--throttle-rate 0.01] [--env DECISION_CACHE_SIZE=0]
+        [--json results.json]
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import http.client
+import importlib.util
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import fake_avp
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+AUTHORIZER_DIR = os.path.join(BENCH_DIR, "..", "authorizer")
+MODES = ("server", "lambda-alb", "lambda-url")
+JWT_SECRET = "bench-secret"
+
+BASE_ENV = {
+    "POLICY_STORE_ID": "ps-bench",
+    "AWS_REGION": "us-east-1",
+    "AWS_ACCESS_KEY_ID": "bench",
+    "AWS_SECRET_ACCESS_KEY": "bench",
+    "LOG_LEVEL": "WARNING",
+    "JWT_HMAC_SECRET": JWT_SECRET,
+    "METRICS_SUMMARY_SECONDS": "0",
+}
+
+
+# ============================================================================
+# Workload
+# ============================================================================
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def mint_token(subject: str, groups: list, ttl: int = 3600, claims: dict = None) -> str:
+    """HS256 token accepted with and without JWT_VERIFY=true; claims are added to the payload."""
+    header = _b64(json.dumps({"alg": "HS256", "typ": "JWT"}).encode())
+    payload = _b64(json.dumps({
+        "sub": subject,
+        "iss": "https://bench.local",
+        "groups": groups,
+        **(claims or {}),
+        "exp": int(time.time()) + ttl,
+    }).encode())
+    signature = hmac.new(JWT_SECRET.encode(), f"{header}.{payload}".encode(), hashlib.sha256).digest()
+    return f"{header}.{payload}.{_b64(signature)}"
+
+
+def build_workload(args) -> list:
+    """(token, method, path, host) checks over users x paths x methods."""
+    rng = random.Random(args.seed)
+    tokens = [
+        mint_token(f"user-{u}", [f"group-{(u + g) % args.group_pool}" for g in range(args.groups)])
+        for u in range(args.users)
+    ]
+    methods = ("GET", "GET", "GET", "POST", "PUT", "DELETE")
+    return [
+        (rng.choice(tokens), rng.choice(methods), f"/bench/route-{rng.randrange(args.paths)}", "api.bench.local")
+        for _ in range(args.requests + args.warmup)
+    ]
+
+
+# ============================================================================
+# Helpers
+# ============================================================================
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url: str, timeout: float = 20.0, process: subprocess.Popen = None):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"{url}: process exited with code {process.returncode}")
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except urllib.error.HTTPError:
+            return  # listening, just not a GET endpoint
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def start_fake_avp(args) -> tuple:
+    port = free_port()
+    command = [
+        sys.executable, os.path.join(BENCH_DIR, "fake_avp.py"), "--port", str(port),
+        "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+        "--deny-rate", str(args.deny_rate), "--throttle-rate", str(args.throttle_rate),
+        "--error-rate", str(args.error_rate), "--slow-rate", str(args.slow_rate),
+        "--slow-ms", str(args.slow_ms), "--seed", str(args.seed),
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    wait_for(url, process=process)
+    return process, url
+
+
+def stop(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def summarize(latencies: list, statuses: dict, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    n = len(latencies)
+
+    def pct(q):
+        return round(latencies[min(n - 1, int(n * q))], 3) if n else 0.0
+
+    return {
+        "requests": n,
+        "errors": sum(v for k, v in statuses.items() if k == "error" or (k.isdigit() and int(k) >= 500)),
+        "throughput_rps": round(n / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "max_ms": round(latencies[-1], 3) if n else 0.0,
+        "statuses": dict(sorted(statuses.items())),
+    }
+
+
+def stage_means_from_prometheus(text: str) -> dict:
+    sums = dict(re.findall(r'_stage_duration_seconds_sum\{stage="(\w+)"\} ([\d.e+-]+)', text))
+    counts = dict(re.findall(r'_stage_duration_seconds_count\{stage="(\w+)"\} (\d+)', text))
+    return {
+        stage: round(float(sums[stage]) / int(count) * 1000, 3)
+        for stage, count in counts.items() if int(count)
+    }
+
+
+# ============================================================================
+# Modes
+# ============================================================================
+
+def start_server(env: dict) -> tuple:
+    """Run server.py with env on a free port; returns (process, port, log file)."""
+    port = free_port()
+    env = dict(os.environ, **env, HTTP_PORT=str(port))
+    log = tempfile.NamedTemporaryFile(prefix="authorizer-", suffix=".log", delete=False)
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(AUTHORIZER_DIR, "server.py")],
+        env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    try:
+        wait_for(f"http://127.0.0.1:{port}/health", process=process)
+    except RuntimeError:
+        log.flush()
+        with open(log.name) as f:
+            sys.stderr.write(f.read()[-4000:])
+        stop_server(process, log)
+        raise
+    return process, port, log
+
+
+def stop_server(process: subprocess.Popen, log):
+    stop(process)
+    log.close()
+    os.unlink(log.name)
+
+
+def load_lambda(env: dict, name: str) -> tuple:
+    """A fresh copy of lambda_handler (new clients, empty caches); returns (module, init ms)."""
+    os.environ.update(env)
+    if AUTHORIZER_DIR not in sys.path:
+        sys.path.insert(0, AUTHORIZER_DIR)
+    init_start = time.perf_counter()
+    spec = importlib.util.spec_from_file_location(name, os.path.join(AUTHORIZER_DIR, "lambda_handler.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module, (time.perf_counter() - init_start) * 1000
+
+
+def run_server(args, workload: list, env: dict) -> dict:
+    process, port, log = start_server(env)
+    try:
+        lock = threading.Lock()
+        latencies = []
+        statuses = {}
+
+        def worker(checks: list, position: list, record: bool):
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            local_latencies = []
+            local_statuses = {}
+            while True:
+                with lock:
+                    index = position[0]
+                    if index >= len(checks):
+                        break
+                    position[0] += 1
+                token, method, path, host = checks[index]
+                headers = {
+                    "authorization": f"Bearer {token}",
+                    "x-original-method": method,
+                    "x-original-uri": path,
+                    "x-original-host": host,
+                }
+                start = time.perf_counter()
+                try:
+                    conn.request("GET", "/", headers=headers)
+                    response = conn.getresponse()
+                    response.read()
+                    status = str(response.status)
+                except (OSError, http.client.HTTPException):
+                    conn.close()
+                    status = "error"
+                local_latencies.append((time.perf_counter() - start) * 1000)
+                local_statuses[status] = local_statuses.get(status, 0) + 1
+            conn.close()
+            if record:
+                with lock:
+                    latencies.extend(local_latencies)
+                    for status, count in local_statuses.items():
+                        statuses[status] = statuses.get(status, 0) + count
+
+        def run_batch(checks: list, record: bool) -> float:
+            position = [0]
+            threads = [
+                threading.Thread(target=worker, args=(checks, position, record))
+                for _ in range(args.concurrency)
+            ]
+            start = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            return time.perf_counter() - start
+
+        # Warm-up checks run first and are not recorded
+        run_batch(workload[:args.warmup], record=False)
+        elapsed = run_batch(workload[args.warmup:], record=True)
+
+        result = summarize(latencies, statuses, elapsed)
+        result["concurrency"] = args.concurrency
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            result["stage_mean_ms"] = stage_means_from_prometheus(response.read().decode())
+        return result
+    finally:
+        stop_server(process, log)
+
+
+def alb_event(token: str, method: str, path: str, host: str) -> dict:
+    return {
+        "requestContext": {"elb": {"targetGroupArn": "arn:aws:elasticloadbalancing:us-east-1:000000000000:targetgroup/bench/0"}},
+        "httpMethod": "GET",
+        "path": "/",
+        "headers": {
+            "authorization": f"Bearer {token}",
+            "x-original-method": method,
+            "x-original-uri": path,
+            "x-original-host": host,
+        },
+        "isBase64Encoded": False,
+    }
+
+
+def function_url_event(token: str, method: str, path: str, host: str) -> dict:
+    return {
+        "version": "2.0",
+        "rawPath": "/",
+        "headers": {
+            "authorization": f"Bearer {token}",
+            "x-original-method": method,
+            "x-original-uri": path,
+            "x-original-host": host,
+        },
+        "requestContext": {"http": {"method": "GET", "path": "/"}},
+        "isBase64Encoded": False,
+    }
+
+
+def run_lambda(args, workload: list, env: dict, make_event) -> dict:
+    # A fresh module per mode: new clients and empty caches, like a cold start
+    module, init_ms = load_lambda(env, f"lambda_handler_{make_event.__name__}")
+
+    events = [make_event(*check) for check in workload]
+    for event in events[:args.warmup]:
+        module.handler(event, None)
+
+    latencies = []
+    statuses = {}
+    start = time.perf_counter()
+    for event in events[args.warmup:]:
+        t0 = time.perf_counter()
+        try:
+            status = str(module.handler(event, None)["statusCode"])
+        except Exception:
+            status = "error"
+        latencies.append((time.perf_counter() - t0) * 1000)
+        statuses[status] = statuses.get(status, 0) + 1
+    elapsed = time.perf_counter() - start
+
+    result = summarize(latencies, statuses, elapsed)
+    result["init_ms"] = round(init_ms, 1)
+    if hasattr(module, "metrics"):
+        stages = module.metrics.summary()["stages"]
+        result["stage_mean_ms"] = {s: v["mean_ms"] for s, v in stages.items() if v["count"]}
+    return result
+
+
+# ============================================================================
+# Main
+# ============================================================================
+
+def print_table(results: dict):
+    print(f"{'mode':<11} {'requests':>8} {'errors':>6} {'rps':>9} {'p50_ms':>8} {'p95_ms':>8} {'p99_ms':>8} {'max_ms':>8}")
+    for mode, r in results.items():
+        print(f"{mode:<11} {r['requests']:>8} {r['errors']:>6} {r['throughput_rps']:>9.1f} "
+              f"{r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['max_ms']:>8.2f}")
+    for mode, r in results.items():
+        extra = f", init {r['init_ms']}ms" if "init_ms" in r else ""
+        stages = " ".join(f"{k}={v}" for k, v in r.get("stage_mean_ms", {}).items())
+        print(f"  {mode}: statuses {r['statuses']}{extra}")
+        if stages:
+            print(f"  {mode}: mean ms per stage {stages}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--requests", type=int, default=5000, help="recorded checks per mode")
+    parser.add_argument("--warmup", type=int, default=200, help="unrecorded checks run first")
+    parser.add_argument("--concurrency", type=int, default=16, help="client threads (server mode)")
+    parser.add_argument("--users", type=int, default=200, help="distinct tokens")
+    parser.add_argument("--paths", type=int, default=20, help="distinct paths")
+    parser.add_argument("--groups", type=int, default=3, help="groups per token")
+    parser.add_argument("--group-pool", type=int, default=10, help="distinct groups")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="authorizer environment override (repeatable)")
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON")
+    fake_avp.add_arguments(parser)
+    args = parser.parse_args()
+
+    overrides = dict(item.split("=", 1) for item in args.env)
+    workload = build_workload(args)
+
+    results = {}
+    for mode in args.modes:
+        avp_process, avp_url = start_fake_avp(args)
+        env = dict(BASE_ENV, AWS_ENDPOINT_URL_VERIFIEDPERMISSIONS=avp_url, **overrides)
+        try:
+            if mode == "server":
+                results[mode] = run_server(args, workload, env)
+            elif mode == "lambda-alb":
+                results[mode] = run_lambda(args, workload, env, alb_event)
+            else:
+                results[mode] = run_lambda(args, workload, env, function_url_event)
+        finally:
+            stop(avp_process)
+
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,482 @@
+#!/usr/bin/env python3
+"""
+Replay traffic captured by the authorizer (CAPTURE_DIR) offline.
+
+Targets:
+- server: runs authorizer/server.py against the fake AVP (or --url, an
+          authorizer that is already running) and sends the checks over
+          HTTP from --concurrency client threads
+- lambda: calls lambda_handler.handler in-process with ALB events
+- local:  evaluates each check with the local Cedar engine only
+          (--policies/--schema, --routes for the route templates)
+
+Checks keep their captured pace scaled by --speed (1 = original, 10 = ten
+times faster, 0 = as fast as possible). Every token digest in the capture
+becomes one minted HS256 token with the captured groups and the captured
+claims the policies read (`cl`, CAPTURE_CLAIMS), so the token and decision
+caches see the same reuse as the captured traffic and the policies the same
+claim values. Reports latency
+(p50/p95/p99/max), how far the replay fell behind its schedule, the decision
+sources (cache hit rate) captured vs replayed, and decision parity: every
+replayed status against the captured one (captured 5xx are not compared).
+
+Parity means something when the target decides with the policies the
+capture was taken with: the local target, POLICY_ENGINE=local with the
+same policy files, or a --url authorizer on the same policy store. Against
+the fake AVP the decisions are synthetic.
+
+Usage:
+    python3 bench/replay.py CAPTURE [CAPTURE ...] [--target server|lambda|local]
+        [--speed 1] [--concurrency 16] [--url http://127.0.0.1:9191]
+        [--policies policies] [--schema schema.json] [--routes routes.json]
+        [--env POLICY_ENGINE=local] [--json results.json]
+"""
+
+import argparse
+import glob
+import gzip
+import heapq
+import http.client
+import itertools
+import json
+import os
+import queue
+import re
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+import fake_avp
+from load_test import (
+    AUTHORIZER_DIR, BASE_ENV, alb_event, load_lambda, mint_token, start_fake_avp, start_server,
+    stage_means_from_prometheus, stop, stop_server, summarize
+)
+
+TARGETS = ("server", "lambda", "local")
+MAX_MISMATCH_SAMPLES = 10
+# Longest a capture file can be out of start-time order (checks end within it)
+REORDER_WINDOW_S = 60.0
+
+
+# ============================================================================
+# Capture
+# ============================================================================
+
+def _segment(filename: str) -> int:
+    """Rotation index of a capture file: 0 for the live file, N for .N.gz."""
+    match = re.search(r"\.jsonl\.(\d+)\.gz$", filename)
+    return int(match.group(1)) if match else 0
+
+
+def capture_files(paths: list) -> list:
+    """
+    Capture streams of each path, each a list of files oldest first: a
+    directory contributes one stream per worker (its capture-<pid>.jsonl
+    and rotated segments), any other path is a stream of its own.
+    """
+    streams = []
+    for path in paths:
+        if not os.path.isdir(path):
+            streams.append([path])
+            continue
+        workers = {}
+        for filename in glob.glob(os.path.join(path, "capture-*.jsonl*")):
+            workers.setdefault(re.sub(r"\.\d+\.gz$", "", filename), []).append(filename)
+        for base in sorted(workers):
+            streams.append(sorted(workers[base], key=_segment, reverse=True))
+    return streams
+
+
+def _stream_records(filenames: list):
+    for filename in filenames:
+        opener = gzip.open if filename.endswith(".gz") else open
+        with opener(filename, "rt") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+
+def _reorder(records, window: float):
+    """
+    Records by start time, from a stream ordered up to window seconds.
+
+    A worker writes each record when its check ends, so a slow check lands
+    after checks that started later; holding window seconds of records is
+    enough to put them back in order.
+    """
+    pending = []
+    for seq, record in enumerate(records):
+        heapq.heappush(pending, (record["t"], seq, record))
+        while pending[0][0] < record["t"] - window:
+            yield heapq.heappop(pending)[2]
+    while pending:
+        yield heapq.heappop(pending)[2]
+
+
+def read_capture(paths: list):
+    """Records of the capture files ordered by check start time, streamed (one merge over the workers)."""
+    return heapq.merge(
+        *(_reorder(_stream_records(files), REORDER_WINDOW_S) for files in capture_files(paths)),
+        key=lambda r: r["t"]
+    )
+
+
+class Tokens:
+    """One minted token per captured token digest."""
+
+    def __init__(self):
+        self._tokens = {}
+
+    @staticmethod
+    def subject(record: dict) -> str:
+        return f"capture-{record['c'][:12]}"
+
+    def get(self, record: dict) -> str:
+        token = self._tokens.get(record["c"])
+        if token is None:
+            token = self._tokens[record["c"]] = mint_token(
+                self.subject(record), list(record["g"]), claims=record.get("cl")
+            )
+        return token
+
+
+def schedule(records, speed: float):
+    """(record, offset) pairs, offset the seconds after the replay start at which the record is sent."""
+    t0 = None
+    for record in records:
+        if t0 is None:
+            t0 = record["t"]
+        yield record, (record["t"] - t0) / speed if speed > 0 else 0.0
+
+
+def cache_hit_rate(sources: dict) -> float:
+    total = sum(sources.values())
+    return round(sources.get("cache", 0) / total, 4) if total else 0.0
+
+
+class Tally:
+    """
+    Captured and replayed figures, added up check by check as the capture
+    streams through the replay. Only the latencies are kept per check (for
+    the percentiles); the records themselves are dropped once counted.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.captured_ms = []
+        self.captured_sources = {}
+        self.stage_sums, self.stage_counts = {}, {}
+        self.first_t = self.last_t = None
+        self.statuses = {}
+        self.latencies = []
+        self.lags = []
+        self.compared = self.matches = 0
+        self.mismatches = {}
+        self.samples = []
+
+    @property
+    def requests(self) -> int:
+        return len(self.latencies)
+
+    def add(self, record: dict, status: str, latency_ms: float, lag_ms: float):
+        with self._lock:
+            self.captured_ms.append(record.get("ms", 0.0))
+            source = record.get("src") or "none"
+            self.captured_sources[source] = self.captured_sources.get(source, 0) + 1
+            for stage, ms in record.get("st", {}).items():
+                self.stage_sums[stage] = self.stage_sums.get(stage, 0.0) + ms
+                self.stage_counts[stage] = self.stage_counts.get(stage, 0) + 1
+            t = record["t"]
+            self.first_t = t if self.first_t is None else min(self.first_t, t)
+            self.last_t = t if self.last_t is None else max(self.last_t, t)
+
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            self.latencies.append(latency_ms)
+            self.lags.append(lag_ms)
+
+            # Parity: replayed status against the captured one, for checks the capture answered
+            if record["s"] >= 500:
+                return
+            self.compared += 1
+            if status == str(record["s"]):
+                self.matches += 1
+                return
+            key = f"{record['s']}->{status}"
+            self.mismatches[key] = self.mismatches.get(key, 0) + 1
+            if len(self.samples) < MAX_MISMATCH_SAMPLES:
+                self.samples.append(f"{record['m']} {record['p']} groups={list(record['g'])} {key}")
+
+    def parity(self) -> dict:
+        return {
+            "compared": self.compared,
+            "matches": self.matches,
+            "match_rate": round(self.matches / self.compared, 4) if self.compared else 1.0,
+            "mismatches": dict(sorted(self.mismatches.items())),
+            "samples": list(self.samples),
+        }
+
+    def captured(self) -> dict:
+        durations = sorted(self.captured_ms)
+        n = len(durations)
+        sources = dict(sorted(self.captured_sources.items()))
+        return {
+            "requests": n,
+            "duration_s": round(self.last_t - self.first_t, 3) if n else 0.0,
+            "p50_ms": round(durations[min(n - 1, int(n * 0.50))], 3) if n else 0.0,
+            "p99_ms": round(durations[min(n - 1, int(n * 0.99))], 3) if n else 0.0,
+            "sources": sources,
+            "cache_hit_rate": cache_hit_rate(sources),
+            "stage_mean_ms": {
+                stage: round(self.stage_sums[stage] / self.stage_counts[stage], 3) for stage in self.stage_sums
+            },
+        }
+
+    def report(self, elapsed: float, sources: dict) -> dict:
+        result = summarize(self.latencies, self.statuses, elapsed)
+        lags = sorted(self.lags)
+        result["lag_p99_ms"] = round(lags[min(len(lags) - 1, int(len(lags) * 0.99))], 3) if lags else 0.0
+        result["lag_max_ms"] = round(lags[-1], 3) if lags else 0.0
+        result["sources"] = dict(sorted(sources.items()))
+        result["cache_hit_rate"] = cache_hit_rate(sources)
+        result["parity"] = self.parity()
+        return result
+
+
+# ============================================================================
+# Targets
+# ============================================================================
+
+def prometheus_sources(text: str) -> dict:
+    counts = {}
+    for source, value in re.findall(r'_decisions_total\{decision="\w+",source="(\w+)"\} (\d+)', text):
+        counts[source] = counts.get(source, 0) + int(value)
+    return counts
+
+
+def scrape(base_url: str) -> str:
+    with urllib.request.urlopen(f"{base_url}/metrics", timeout=10) as response:
+        return response.read().decode()
+
+
+def replay_http(args, records, base_url: str, tally: Tally) -> float:
+    """Send the records to an authorizer over HTTP, adding each to tally; returns the elapsed seconds."""
+    url = urllib.parse.urlsplit(base_url)
+    tokens = Tokens()
+    tokens_lock = threading.Lock()
+    # Bounded, so the capture is read only as fast as its checks are sent
+    pending = queue.Queue(args.concurrency * 4)
+
+    def worker():
+        conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+        while True:
+            item = pending.get()
+            if item is None:
+                break
+            record, offset = item
+            with tokens_lock:
+                token = tokens.get(record)
+            headers = {
+                "authorization": f"Bearer {token}",
+                "x-original-method": record["m"],
+                "x-original-uri": record["p"],
+                "x-original-host": record.get("h") or "",
+            }
+            sent = time.perf_counter()
+            lag = (sent - start - offset) * 1000
+            try:
+                conn.request("GET", "/", headers=headers)
+                response = conn.getresponse()
+                response.read()
+                status = str(response.status)
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                status = "error"
+            tally.add(record, status, (time.perf_counter() - sent) * 1000, lag)
+        conn.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    try:
+        for record, offset in schedule(records, args.speed):
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pending.put((record, offset))
+    finally:
+        for _ in threads:
+            pending.put(None)
+        for t in threads:
+            t.join()
+    return time.perf_counter() - start
+
+
+def replay_inline(args, records, check, tally: Tally) -> float:
+    """Run check(record) for each record in this thread, on schedule; returns the elapsed seconds."""
+    start = time.perf_counter()
+    for record, offset in schedule(records, args.speed):
+        delay = start + offset - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        sent = time.perf_counter()
+        lag = (sent - start - offset) * 1000
+        try:
+            status = str(check(record))
+        except Exception:
+            status = "error"
+        tally.add(record, status, (time.perf_counter() - sent) * 1000, lag)
+    return time.perf_counter() - start
+
+
+def run_server(args, records, env: dict, tally: Tally) -> dict:
+    if args.url:
+        base_url = args.url.rstrip("/")
+        before = prometheus_sources(scrape(base_url))
+        elapsed = replay_http(args, records, base_url, tally)
+        after = prometheus_sources(scrape(base_url))
+        return tally.report(elapsed, {s: after[s] - before.get(s, 0) for s in after if after[s] - before.get(s, 0)})
+
+    process, port, log = start_server(env)
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        elapsed = replay_http(args, records, base_url, tally)
+        text = scrape(base_url)
+        result = tally.report(elapsed, prometheus_sources(text))
+        result["stage_mean_ms"] = stage_means_from_prometheus(text)
+        return result
+    finally:
+        stop_server(process, log)
+
+
+def run_lambda(args, records, env: dict, tally: Tally) -> dict:
+    module, init_ms = load_lambda(env, "lambda_handler_replay")
+    tokens = Tokens()
+
+    def check(record):
+        event = alb_event(tokens.get(record), record["m"], record["p"], record.get("h") or "")
+        return module.handler(event, None)["statusCode"]
+
+    elapsed = replay_inline(args, records, check, tally)
+    result = tally.report(elapsed, prometheus_sources(module.metrics.render_prometheus()))
+    result["init_ms"] = round(init_ms, 1)
+    stages = module.metrics.summary()["stages"]
+    result["stage_mean_ms"] = {s: v["mean_ms"] for s, v in stages.items() if v["count"]}
+    return result
+
+
+def run_local(args, records, env: dict, tally: Tally) -> dict:
+    if AUTHORIZER_DIR not in sys.path:
+        sys.path.insert(0, AUTHORIZER_DIR)
+    from cedar_engine import LocalPolicyEngine
+    from entity_builder import CheckRequest, EntityBuilder
+    from route_index import RouteIndex
+
+    engine = LocalPolicyEngine([args.policies], schema_file=args.schema)
+    engine.load()
+    builder = EntityBuilder(env["POLICY_STORE_ID"])
+    routes = RouteIndex.load(args.routes) if args.routes else None
+
+    def check(record):
+        groups = tuple(record["g"])
+        route = routes.match(record["m"], record["p"]) if routes is not None else None
+        if routes is not None and route is None:
+            return 403
+        subject = Tokens.subject(record)
+        request = builder.build(CheckRequest(
+            record["m"], record["p"], record.get("h") or "", subject, "https://bench.local", groups, route
+        ))
+        claims = {"sub": subject, "iss": "https://bench.local", "groups": list(groups), **record.get("cl", {})}
+        response = engine.is_authorized(**request, context={"token": claims})
+        return 200 if response.get("decision") == "ALLOW" else 403
+
+    elapsed = replay_inline(args, records, check, tally)
+    return tally.report(elapsed, {"Local": tally.requests})
+
+
+# ============================================================================
+# Report
+# ============================================================================
+
+def print_report(captured: dict, result: dict):
+    print(f"captured  {captured['requests']} checks over {captured['duration_s']}s, "
+          f"p50 {captured['p50_ms']}ms p99 {captured['p99_ms']}ms, "
+          f"cache hit rate {captured['cache_hit_rate']}, sources {captured['sources']}")
+    if captured["stage_mean_ms"]:
+        print("          mean ms per stage " + " ".join(f"{k}={v}" for k, v in captured["stage_mean_ms"].items()))
+    print(f"replayed  {result['requests']} checks in {result['throughput_rps']} rps, "
+          f"p50 {result['p50_ms']}ms p95 {result['p95_ms']}ms p99 {result['p99_ms']}ms max {result['max_ms']}ms, "
+          f"lag p99 {result['lag_p99_ms']}ms max {result['lag_max_ms']}ms")
+    print(f"          cache hit rate {result['cache_hit_rate']}, sources {result['sources']}, "
+          f"statuses {result['statuses']}")
+    if "stage_mean_ms" in result:
+        print("          mean ms per stage " + " ".join(f"{k}={v}" for k, v in result["stage_mean_ms"].items()))
+    p = result["parity"]
+    print(f"parity    {p['matches']}/{p['compared']} ({p['match_rate']:.2%}) mismatches {p['mismatches']}")
+    for sample in p["samples"]:
+        print(f"          {sample}")
+
+
+# ============================================================================
+# Main
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("capture", nargs="+", help="capture files or CAPTURE_DIR directories")
+    parser.add_argument("--target", choices=TARGETS, default="server")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="replay speed relative to the capture (0 = as fast as possible)")
+    parser.add_argument("--limit", type=int, default=0, help="replay only the first N checks")
+    parser.add_argument("--concurrency", type=int, default=16, help="client threads (server target)")
+    parser.add_argument("--url", help="authorizer already running (server target; no fake AVP)")
+    parser.add_argument("--policies", default=os.path.join(AUTHORIZER_DIR, "..", "policies"),
+                        help="policy directory (local target)")
+    parser.add_argument("--schema", default=os.path.join(AUTHORIZER_DIR, "..", "schema.json"),
+                        help="Cedar schema (local target)")
+    parser.add_argument("--routes", help="NP_CONTEXT route table (local target)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="authorizer environment override (repeatable)")
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON")
+    fake_avp.add_arguments(parser)
+    args = parser.parse_args()
+
+    records = read_capture(args.capture)
+    first = next(records, None)
+    if first is None:
+        parser.error("no capture records found")
+    records = itertools.islice(itertools.chain([first], records), args.limit or None)
+
+    overrides = dict(item.split("=", 1) for item in args.env)
+    env = dict(BASE_ENV, **overrides)
+    avp_process = None
+    if args.target != "local" and not args.url:
+        avp_process, avp_url = start_fake_avp(args)
+        env["AWS_ENDPOINT_URL_VERIFIEDPERMISSIONS"] = avp_url
+    tally = Tally()
+    try:
+        if args.target == "server":
+            result = run_server(args, records, env, tally)
+        elif args.target == "lambda":
+            result = run_lambda(args, records, env, tally)
+        else:
+            result = run_local(args, records, env, tally)
+    finally:
+        if avp_process is not None:
+            stop(avp_process)
+
+    captured = tally.captured()
+    print_report(captured, result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "captured": captured, "replayed": result}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
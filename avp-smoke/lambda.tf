@@ -10,6 +10,9 @@
 locals {
   # Lambda is needed for both lambda and lambda-proxy modes
   use_lambda_function = contains(["lambda", "lambda-proxy"], var.authorizer_mode)
+
+  # With provisioned concurrency, callers invoke the "live" alias instead of $LATEST
+  lambda_use_alias = local.use_lambda_function && var.lambda_provisioned_concurrency > 0
 }
 
 # ============================================================================
@@ -128,6 +131,89 @@ data "archive_file" "lambda_authorizer" {
     content  = file("${path.module}/authorizer/lambda_handler.py")
     filename = "lambda_handler.py"
   }
+
+  source {
+    content  = file("${path.module}/authorizer/authz_check.py")
+    filename = "authz_check.py"
+  }
+
+  source {
+    content  = file("${path.module}/authorizer/entity_builder.py")
+    filename = "entity_builder.py"
+  }
+
+  source {
+    content  = file("${path.module}/authorizer/decision_cache.py")
+    filename = "decision_cache.py"
+  }
+
+  source {
+    content  = file("${path.module}/authorizer/token_cache.py")
+    filename = "token_cache.py"
+  }
+
+  source {
+    content  = file("${path.module}/authorizer/jwt_verify.py")
+    filename = "jwt_verify.py"
+  }
+
+  source {
+    content  = file("${path.module}/authorizer/cedar_engine.py")
+    filename = "cedar_engine.py"
+  }
+
+  source {
+    content  = file("${path.module}/authorizer/metrics.py")
+    filename = "metrics.py"
+  }
+
+  source {
+    content  = file("${path.module}/authorizer/route_index.py")
+    filename = "route_index.py"
+  }
+
+  source {
+    content  = file("${path.module}/authorizer/circuit_breaker.py")
+    filename = "circuit_breaker.py"
+  }
+
+  source {
+    content  = file("${path.module}/authorizer/decision_log.py")
+    filename = "decision_log.py"
+  }
+
+  source {
+    content  = file("${path.module}/authorizer/permit_index.py")
+    filename = "permit_index.py"
+  }
+
+  source {
+    content  = file("${path.module}/authorizer/deadline.py")
+    filename = "deadline.py"
+  }
+
+  # Route table for ROUTE_TABLE_FILE (optional)
+  dynamic "source" {
+    for_each = var.route_table_file != "" ? [var.route_table_file] : []
+    content {
+      content  = file(source.value)
+      filename = "routes.json"
+    }
+  }
+
+  # Policies and schema for POLICY_ENGINE=local|shadow
+  dynamic "source" {
+    for_each = fileset("${path.module}/policies", "*.cedar")
+    content {
+      content  = file("${path.module}/policies/${source.value}")
+      filename = "policies/${source.value}"
+    }
+  }
+
+  source {
+    content  = file("${path.module}/schema.json")
+    filename = "policies/schema.json"
+  }
 }
 
 # ============================================================================
@@ -148,6 +234,7 @@ resource "aws_lambda_function" "authorizer" {
 
   memory_size = var.lambda_memory_size
   timeout     = var.lambda_timeout
+  publish     = local.lambda_use_alias
 
   reserved_concurrent_executions = var.lambda_reserved_concurrency >= 0 ? var.lambda_reserved_concurrency : null
 
@@ -159,8 +246,27 @@ resource "aws_lambda_function" "authorizer" {
 
   environment {
     variables = {
-      POLICY_STORE_ID = aws_verifiedpermissions_policy_store.main.id
-      LOG_LEVEL       = var.log_level
+      POLICY_STORE_ID           = aws_verifiedpermissions_policy_store.main.id
+      LOG_LEVEL                 = var.log_level
+      LOG_FORMAT                = var.log_format
+      LOG_ALLOW_SAMPLE_RATE     = tostring(var.log_allow_sample_rate)
+      DECISION_CACHE_SIZE       = tostring(var.decision_cache_size)
+      DECISION_CACHE_TTL        = tostring(var.decision_cache_ttl)
+      DECISION_CACHE_MAX_STALE  = tostring(var.decision_cache_max_stale)
+      CIRCUIT_FAILURE_THRESHOLD = tostring(var.circuit_failure_threshold)
+      CIRCUIT_RESET_SECONDS     = tostring(var.circuit_reset_seconds)
+      AVP_HEDGE                 = tostring(var.avp_hedge)
+      POLICY_ENGINE             = var.policy_engine
+      JWT_VERIFY                = tostring(var.jwt_verify)
+      JWT_HMAC_SECRET           = var.jwt_hmac_secret
+      JWT_JWKS_URL              = var.jwt_jwks_url
+      JWT_ALLOWED_ISSUERS       = join(",", var.jwt_allowed_issuers)
+      JWT_ALLOWED_AUDIENCES     = join(",", var.jwt_allowed_audiences)
+      LOCAL_POLICY_DIRS         = "/var/task/policies"
+      LOCAL_SCHEMA_FILE         = "/var/task/policies/schema.json"
+      ROUTE_TABLE_FILE          = var.route_table_file != "" ? "/var/task/routes.json" : ""
+      PERMIT_INDEX_FILE         = var.route_table_file != "" && var.permit_index ? "/var/task/routes.json" : ""
+      WARMUP_GROUP_CLAIMS       = join(",", var.lambda_warmup_group_claims)
     }
   }
 
@@ -173,6 +279,62 @@ resource "aws_lambda_function" "authorizer" {
   tags = local.common_tags
 }
 
+# ============================================================================
+# Provisioned Concurrency (optional) - environments initialized ahead of traffic
+# ============================================================================
+
+resource "aws_lambda_alias" "authorizer_live" {
+  count = local.lambda_use_alias ? 1 : 0
+
+  name             = "live"
+  function_name    = aws_lambda_function.authorizer[0].function_name
+  function_version = aws_lambda_function.authorizer[0].version
+}
+
+resource "aws_lambda_provisioned_concurrency_config" "authorizer" {
+  count = local.lambda_use_alias ? 1 : 0
+
+  function_name                     = aws_lambda_function.authorizer[0].function_name
+  qualifier                         = aws_lambda_alias.authorizer_live[0].name
+  provisioned_concurrent_executions = var.lambda_provisioned_concurrency
+}
+
+# ============================================================================
+# Warm-up Schedule (optional) - keeps an environment warm and its caches filled
+# ============================================================================
+
+resource "aws_cloudwatch_event_rule" "lambda_warmup" {
+  count = local.use_lambda_function && var.lambda_warmup_schedule != "" ? 1 : 0
+
+  name                = "${local.name_prefix}-avp-authorizer-warmup"
+  description         = "Warm-up invocations for the AVP Lambda authorizer"
+  schedule_expression = var.lambda_warmup_schedule
+
+  tags = local.common_tags
+}
+
+resource "aws_cloudwatch_event_target" "lambda_warmup" {
+  count = local.use_lambda_function && var.lambda_warmup_schedule != "" ? 1 : 0
+
+  rule  = aws_cloudwatch_event_rule.lambda_warmup[0].name
+  arn   = local.lambda_use_alias ? aws_lambda_alias.authorizer_live[0].arn : aws_lambda_function.authorizer[0].arn
+  input = jsonencode({
+    warmup = true
+    checks = var.lambda_warmup_checks
+  })
+}
+
+resource "aws_lambda_permission" "lambda_warmup" {
+  count = local.use_lambda_function && var.lambda_warmup_schedule != "" ? 1 : 0
+
+  statement_id  = "AllowWarmupFromEventBridge"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.authorizer[0].function_name
+  qualifier     = local.lambda_use_alias ? aws_lambda_alias.authorizer_live[0].name : null
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.lambda_warmup[0].arn
+}
+
 # ============================================================================
 # Lambda Function URL
 # ============================================================================
@@ -181,6 +343,7 @@ resource "aws_lambda_function_url" "authorizer" {
   count = var.authorizer_mode == "lambda-proxy" ? 1 : 0
 
   function_name      = aws_lambda_function.authorizer[0].function_name
+  qualifier          = local.lambda_use_alias ? aws_lambda_alias.authorizer_live[0].name : null
   authorization_type = "NONE" # Istio handles authentication via headers; only used in lambda-proxy mode
 
   cors {
@@ -127,6 +127,7 @@ resource "aws_lambda_permission" "alb" {
   statement_id  = "AllowExecutionFromALB"
   action        = "lambda:InvokeFunction"
   function_name = aws_lambda_function.authorizer[0].function_name
+  qualifier     = local.lambda_use_alias ? aws_lambda_alias.authorizer_live[0].name : null
   principal     = "elasticloadbalancing.amazonaws.com"
   source_arn    = aws_lb_target_group.lambda_authorizer[0].arn
 }
@@ -139,7 +140,7 @@ resource "aws_lb_target_group_attachment" "lambda_authorizer" {
   count = var.authorizer_mode == "lambda" ? 1 : 0
 
   target_group_arn = aws_lb_target_group.lambda_authorizer[0].arn
-  target_id        = aws_lambda_function.authorizer[0].arn
+  target_id        = local.lambda_use_alias ? aws_lambda_alias.authorizer_live[0].arn : aws_lambda_function.authorizer[0].arn
 
   depends_on = [aws_lambda_permission.alb]
 }
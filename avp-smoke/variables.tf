@@ -113,18 +113,180 @@ variable "authorizer_mode" {
   }
 }
 
+variable "authorizer_protocol" {
+  description = "ext_authz protocol between Envoy and the authorizer pod: \"http\" or \"grpc\" (ext_authz v3, long-lived multiplexed connections). Only 'in-cluster' mode; Lambda modes are always HTTP"
+  type        = string
+  default     = "http"
+
+  validation {
+    condition     = contains(["http", "grpc"], var.authorizer_protocol)
+    error_message = "authorizer_protocol must be 'http' or 'grpc'"
+  }
+}
+
 variable "authorizer_replicas" {
   description = "Number of authorizer pod replicas (used for 'in-cluster' mode and nginx proxy in 'lambda-proxy' mode)"
   type        = number
   default     = 2
 }
 
+variable "authorizer_workers" {
+  description = "Worker threads per authorizer pod serving ext-authz checks concurrently ('in-cluster' mode, 0 = single-threaded)"
+  type        = number
+  default     = 16
+}
+
+variable "authorizer_processes" {
+  description = "Pre-fork worker processes per authorizer pod sharing the port with SO_REUSEPORT and a shared-memory decision cache ('in-cluster' mode). Each process uses one core: the pod CPU limit becomes this many cores"
+  type        = number
+  default     = 1
+
+  validation {
+    condition     = var.authorizer_processes >= 1
+    error_message = "authorizer_processes must be at least 1"
+  }
+}
+
+variable "avp_batch_window_ms" {
+  description = "Window in ms to group concurrent checks into one BatchIsAuthorized call ('in-cluster' mode, 0 disables)"
+  type        = number
+  default     = 0
+}
+
+variable "ext_authz_timeout_ms" {
+  description = "How long Envoy waits for an in-cluster authorizer check ('in-cluster' mode). The authorizer uses it as its per-check deadline (AVP_DEADLINE_MS), AVP retries included, so it answers before Envoy gives up"
+  type        = number
+  default     = 2000
+
+  validation {
+    condition     = var.ext_authz_timeout_ms >= 100
+    error_message = "ext_authz_timeout_ms must be at least 100."
+  }
+}
+
+variable "avp_hedge" {
+  description = "Send a second IsAuthorized when the first has no answer after the p95 latency of recent calls and take the first answer (about 5% more AVP calls, shorter tail)"
+  type        = bool
+  default     = false
+}
+
 variable "log_level" {
   description = "Log level for authorizer (DEBUG, INFO, WARNING, ERROR)"
   type        = string
   default     = "INFO"
 }
 
+variable "log_format" {
+  description = "Authorizer log format: 'text' (several lines per check) or 'json' (one JSON decision record per check)"
+  type        = string
+  default     = "text"
+
+  validation {
+    condition     = contains(["text", "json"], var.log_format)
+    error_message = "log_format must be 'text' or 'json'."
+  }
+}
+
+variable "log_allow_sample_rate" {
+  description = "Share (0-1) of ALLOW decision records logged with log_format = 'json'; denials and errors are always logged"
+  type        = number
+  default     = 1
+
+  validation {
+    condition     = var.log_allow_sample_rate >= 0 && var.log_allow_sample_rate <= 1
+    error_message = "log_allow_sample_rate must be between 0 and 1."
+  }
+}
+
+variable "jwt_verify" {
+  description = "Verify JWT signatures (HS256/RS256/ES256) and issuer in the authorizer instead of only decoding claims"
+  type        = bool
+  default     = false
+}
+
+variable "jwt_hmac_secret" {
+  description = "Shared secret for HS256 tokens (empty disables HS256)"
+  type        = string
+  default     = ""
+  sensitive   = true
+}
+
+variable "jwt_jwks_url" {
+  description = "JWKS URL with the RS256/ES256 signing keys (empty disables them)"
+  type        = string
+  default     = ""
+}
+
+variable "jwt_allowed_issuers" {
+  description = "Allowed token issuers (iss); empty accepts any issuer"
+  type        = list(string)
+  default     = []
+}
+
+variable "jwt_allowed_audiences" {
+  description = "Allowed token audiences (aud must list one of them); empty accepts any audience"
+  type        = list(string)
+  default     = []
+}
+
+variable "policy_engine" {
+  description = <<-EOT
+    Policy engine used by the authorizer:
+    - "avp" (default): every check calls Amazon Verified Permissions.
+    - "local": evaluates the Cedar policies in policies/ in-process (AVP only while no snapshot is loaded).
+    - "shadow": AVP decides, the local engine also evaluates each check and logs mismatches.
+  EOT
+  type        = string
+  default     = "avp"
+
+  validation {
+    condition     = contains(["avp", "local", "shadow"], var.policy_engine)
+    error_message = "policy_engine must be 'avp', 'local', or 'shadow'"
+  }
+}
+
+variable "decision_cache_size" {
+  description = "Max entries in the authorizer decision cache, keyed by group set + method + path (0 disables)"
+  type        = number
+  default     = 10000
+}
+
+variable "decision_cache_ttl" {
+  description = "TTL in seconds for cached authorizer decisions (never beyond the token exp)"
+  type        = number
+  default     = 60
+}
+
+variable "decision_cache_max_stale" {
+  description = "Seconds past expiry a cached decision may still be served while AVP fails or the circuit breaker is open (0 disables; a stale ALLOW fails open)"
+  type        = number
+  default     = 0
+}
+
+variable "circuit_failure_threshold" {
+  description = "Consecutive AVP failures (errors, throttling, timeouts) that open the circuit breaker (0 disables)"
+  type        = number
+  default     = 5
+}
+
+variable "circuit_reset_seconds" {
+  description = "Seconds the circuit breaker stays open before letting a probe call through to AVP"
+  type        = number
+  default     = 10
+}
+
+variable "route_table_file" {
+  description = "Path to an NP_CONTEXT JSON whose routes map request paths to route templates; unmatched paths are denied without calling AVP (empty disables)"
+  type        = string
+  default     = ""
+}
+
+variable "permit_index" {
+  description = "Deny routed checks locally when no policy generated from route_table_file's routes/policies lists any of the token's groups (requires a policy store with only those generated policies)"
+  type        = bool
+  default     = false
+}
+
 # ============================================================================
 # Lambda Configuration (used when authorizer_mode = 'lambda' or 'lambda-proxy')
 # ============================================================================
@@ -158,6 +320,34 @@ variable "lambda_reserved_concurrency" {
   default     = -1
 }
 
+variable "lambda_provisioned_concurrency" {
+  description = "Provisioned concurrent executions on the 'live' alias (0 disables; ALB and Function URL then invoke the alias)"
+  type        = number
+  default     = 0
+}
+
+variable "lambda_warmup_schedule" {
+  description = "EventBridge schedule expression for warm-up invocations, e.g. \"rate(5 minutes)\" (empty disables)"
+  type        = string
+  default     = ""
+}
+
+variable "lambda_warmup_checks" {
+  description = "Checks answered into the decision cache on each warm-up invocation"
+  type = list(object({
+    groups = list(string)
+    method = string
+    path   = string
+  }))
+  default = []
+}
+
+variable "lambda_warmup_group_claims" {
+  description = "Token claims that carry the groups of each lambda_warmup_checks entry, as in the real tokens (the generated policies read custom:groups)"
+  type        = list(string)
+  default     = ["groups", "custom:groups"]
+}
+
 # ============================================================================
 # Tags
 # ============================================================================
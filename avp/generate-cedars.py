@@ -1,7 +1,64 @@
 #!/usr/bin/env python3
+"""
+Genera políticas Cedar a partir de un NP_CONTEXT.
+
+Uso:
+    NP_CONTEXT="$(cat example-json.json)" CEDAR_OUTPUT_DIR=cedar python3 generate-cedars.py
+
+Modo batch (un NP_CONTEXT por línea, cada servicio en CEDAR_OUTPUT_DIR/<slug>):
+    python3 generate-cedars.py --batch services.jsonl --workers 4 [--bundle]
+    cat services.jsonl | python3 generate-cedars.py --batch -
+
+Sincronización con un policy store de Verified Permissions (requiere boto3;
+AWS_ENDPOINT_URL_VERIFIEDPERMISSIONS apunta a otro endpoint, p.ej. el AVP
+local de avp-smoke/bench/fake_avp.py):
+    NP_CONTEXT="$(cat example-json.json)" python3 generate-cedars.py --upload <policy-store-id> [--dry-run]
+    python3 generate-cedars.py --batch services.jsonl --upload <policy-store-id> --upload-rate 20
+
+Con CEDAR_CONSOLIDATE=true (opcional, default false) las políticas del mismo
+componente y acción con los mismos grupos se unen en una sola. Son menos
+políticas, pero la unida tiene `resource` sin restricción en el scope y la
+lista de recursos en el `when`: aplica a todos los recursos de la acción, AVP
+no puede descartarla por scope y la validación contra el schema es más débil.
+"""
+import argparse
+import hashlib
 import json
 import os
+import random
+import re
 import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from multiprocessing import Pool
+
+MANIFEST_FILE = 'manifest.json'
+MANIFEST_VERSION = 2
+BUNDLE_FILE = 'policies.cedar'
+
+# Registros por tanda en modo batch: acota la memoria sin importar el tamaño del archivo
+BATCH_WINDOW_PER_WORKER = 16
+
+# Prefijo de la descripción que marca las políticas subidas por este script
+UPLOAD_TAG = 'generate-cedars'
+# Largo máximo de la descripción de una política en Verified Permissions
+MAX_DESCRIPTION = 150
+# Reintentos de una llamada throttleada o con error transitorio, con backoff exponencial
+UPLOAD_MAX_RETRIES = 8
+UPLOAD_BACKOFF_BASE = 0.1
+UPLOAD_BACKOFF_MAX = 5.0
+RETRYABLE_ERRORS = {
+    'ThrottlingException', 'TooManyRequestsException', 'InternalServerException', 'ServiceUnavailableException',
+    'EndpointConnectionError', 'ConnectTimeoutError', 'ReadTimeoutError', 'ConnectionClosedError',
+}
+# Cada cuánto se imprime el progreso del upload
+PROGRESS_SECONDS = 1.0
+
+_UPLOAD_TAG_RE = re.compile(
+    rf'^{UPLOAD_TAG}:(?P<owner>[^/\s]+)/(?P<stem>policy-[0-9a-f]{{16}}) sha256:(?P<digest>[0-9a-f]{{16}})$'
+)
 
 
 def generate_cedar_policy(namespace: str, app_component: str, resource_uid: str,
@@ -21,19 +78,68 @@ def generate_cedar_policy(namespace: str, app_component: str, resource_uid: str,
 '''
 
 
-def main():
-    # Leer JSON desde variable de entorno
-    np_context = os.environ.get('NP_CONTEXT')
-    if not np_context:
-        print("Error: NP_CONTEXT environment variable not set", file=sys.stderr)
-        sys.exit(1)
+def generate_consolidated_policy(namespace: str, app_component: str, resource_uids: list[str],
+                                 action: str, groups: list[str]) -> str:
+    """
+    Genera una política Cedar para varios recursos del mismo componente.
+
+    Se usa contains y no `resource in [...]` para mantener la igualdad
+    exacta de `resource ==`: `in` también matchearía descendientes.
+    """
+    resources_formatted = ',\n    '.join(
+        f'{namespace}::{app_component}::"{uid}"' for uid in resource_uids
+    )
+    groups_formatted = ',\n    '.join(f'"{g}"' for g in groups)
+
+    return f'''permit (
+  principal,
+  action == {namespace}::Action::"{action}",
+  resource
+) when {{
+  [
+    {resources_formatted}
+  ].contains(resource) &&
+  context.token["custom:groups"].containsAny([
+    {groups_formatted}
+  ])
+}};
+'''
+
+
+def _identity_filename(identity: list) -> str:
+    digest = hashlib.sha256(json.dumps(identity, ensure_ascii=False).encode('utf-8')).hexdigest()
+    return f"policy-{digest[:16]}.cedar"
+
+
+def policy_filename(namespace: str, app_component: str, path: str, action: str) -> str:
+    """
+    Nombre estable de la política, derivado de su identidad y no del orden.
+
+    Agregar o quitar una ruta no renombra las demás: el mismo
+    (namespace, componente, path, acción) siempre va al mismo archivo.
+    """
+    return _identity_filename([namespace, app_component, path, action])
+
+
+def consolidated_filename(namespace: str, app_component: str, action: str, groups: list[str]) -> str:
+    """Nombre estable de una política consolidada: no depende de sus paths."""
+    return _identity_filename(['consolidated', namespace, app_component, action, groups])
 
-    try:
-        context = json.loads(np_context)
-    except json.JSONDecodeError as e:
-        print(f"Error: Invalid JSON in NP_CONTEXT: {e}", file=sys.stderr)
-        sys.exit(1)
 
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def build_policies(context: dict, consolidate: bool = False) -> tuple[dict, int]:
+    """
+    Genera las políticas del contexto: ({filename: (metadata, contenido)}, merged).
+
+    Rutas con la misma identidad (p.ej. el mismo path en dos scopes) se unen
+    en una sola política con la unión de grupos, equivalente a las dos
+    políticas por separado porque la condición es containsAny. Con
+    consolidate se aplica además consolidate_entries; merged es la cantidad
+    de políticas que dejaron de existir por esa pasada.
+    """
     # Extraer configuración de Cedar
     parameters = context.get('parameters', {})
     cedar_config = parameters.get('cedar', {})
@@ -42,11 +148,7 @@ def main():
     namespace = cedar_config.get('namespace', 'DefaultNamespace')
     group_prefix = cedar_config.get('group_prefix', '')
 
-    # Directorio de salida
-    output_dir = os.environ.get('CEDAR_OUTPUT_DIR', 'cedar')
-    os.makedirs(output_dir, exist_ok=True)
-
-    policy_counter = 0
+    entries = {}
 
     # Iterar sobre rutas
     for route in routes:
@@ -57,29 +159,694 @@ def main():
 
         # Iterar sobre políticas (action -> roles)
         for action, roles in policies.items():
-            policy_counter += 1
-
             # Generar grupos de Azure AD
             groups = [f"{group_prefix}{role}_{scope}" for role in roles]
 
-            # Generar política Cedar
+            filename = policy_filename(namespace, app_component, path, action)
+            entry = entries.get(filename)
+            if entry is None:
+                entries[filename] = {
+                    'namespace': namespace,
+                    'app_component': app_component,
+                    'paths': [path],
+                    'action': action,
+                    'groups': groups
+                }
+            else:
+                entry['groups'] += [g for g in groups if g not in entry['groups']]
+
+    merged = 0
+    if consolidate:
+        entries, merged = consolidate_entries(entries)
+
+    result = {}
+    for filename, entry in entries.items():
+        # Generar política Cedar
+        if len(entry['paths']) == 1:
             cedar_policy = generate_cedar_policy(
-                namespace=namespace,
-                app_component=app_component,
-                resource_uid=path,
-                action=action,
-                groups=groups
+                namespace=entry['namespace'],
+                app_component=entry['app_component'],
+                resource_uid=entry['paths'][0],
+                action=entry['action'],
+                groups=entry['groups']
             )
+        else:
+            cedar_policy = generate_consolidated_policy(
+                namespace=entry['namespace'],
+                app_component=entry['app_component'],
+                resource_uids=entry['paths'],
+                action=entry['action'],
+                groups=entry['groups']
+            )
+        # groups permite al authorizer armar su permit index desde el manifest
+        metadata = {k: entry[k] for k in ('namespace', 'app_component', 'paths', 'action', 'groups')}
+        metadata['sha256'] = content_hash(cedar_policy)
+        result[filename] = (metadata, cedar_policy)
+    return result, merged
+
+
+def consolidate_entries(entries: dict) -> tuple[dict, int]:
+    """
+    Une las políticas de un mismo componente y acción con el mismo conjunto
+    de grupos en una sola política sobre todos sus recursos.
+
+    El conjunto de grupos se compara sin orden ni duplicados (containsAny no
+    depende de ninguno de los dos) y la política unida los lista ordenados.
+    Las políticas sin pares quedan igual, con su nombre de archivo original.
+    Devuelve (entries, cantidad de políticas eliminadas por la unión).
+    """
+    buckets = {}
+    for filename, entry in entries.items():
+        key = (entry['namespace'], entry['app_component'], entry['action'], tuple(sorted(set(entry['groups']))))
+        buckets.setdefault(key, []).append((filename, entry))
+
+    result = {}
+    merged = 0
+    for (namespace, app_component, action, groups), members in buckets.items():
+        if len(members) == 1:
+            filename, entry = members[0]
+            result[filename] = entry
+            continue
+        merged += len(members) - 1
+        filename = consolidated_filename(namespace, app_component, action, list(groups))
+        result[filename] = {
+            'namespace': namespace,
+            'app_component': app_component,
+            'paths': sorted(path for _, entry in members for path in entry['paths']),
+            'action': action,
+            'groups': list(groups)
+        }
+    return result, merged
+
+
+def load_manifest(output_dir: str) -> dict:
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest.get('policies', {})
+
+
+def write_atomic(filename: str, content: str):
+    tmp = f"{filename}.tmp"
+    with open(tmp, 'w') as f:
+        f.write(content)
+    os.replace(tmp, filename)
+
+
+def file_hash(filename: str) -> str | None:
+    try:
+        with open(filename, encoding='utf-8') as f:
+            return content_hash(f.read())
+    except OSError:
+        return None
+
+
+def sync_output_dir(output_dir: str, policies: dict, delete_stale: bool = False) -> dict:
+    """
+    Escribe solo las políticas nuevas o modificadas y actualiza el manifest.
+
+    Una política se considera igual si el archivo existe y el manifest
+    anterior tiene el mismo hash (sin manifest se compara el archivo). Son
+    stale los policy-*.cedar del directorio que ya no se generan (incluye los
+    policy-NNN.cedar de la numeración anterior); se reportan y, con
+    delete_stale, se borran.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    previous = load_manifest(output_dir)
+    report = {'created': [], 'updated': [], 'unchanged': [], 'stale': [], 'deleted': []}
+
+    for filename, (metadata, cedar_policy) in sorted(policies.items()):
+        full_path = os.path.join(output_dir, filename)
+        existed = os.path.exists(full_path)
+        old = previous.get(filename)
+        if existed and (old.get('sha256') if old else file_hash(full_path)) == metadata['sha256']:
+            report['unchanged'].append(filename)
+            continue
+
+        # Guardar archivo
+        write_atomic(full_path, cedar_policy)
+        report['updated' if existed else 'created'].append(filename)
+
+    _collect_stale_files(output_dir, policies, delete_stale, report)
+    write_manifest(output_dir, policies)
+    return report
+
+
+def _collect_stale_files(output_dir: str, policies: dict, delete_stale: bool, report: dict):
+    for filename in sorted(os.listdir(output_dir)):
+        if filename.startswith('policy-') and filename.endswith('.cedar') and filename not in policies:
+            report['stale'].append(filename)
+            if delete_stale:
+                os.remove(os.path.join(output_dir, filename))
+                report['deleted'].append(filename)
+
+
+def write_manifest(output_dir: str, policies: dict, **extra):
+    manifest = {
+        'version': MANIFEST_VERSION,
+        **extra,
+        'policies': {filename: metadata for filename, (metadata, _) in sorted(policies.items())}
+    }
+    content = json.dumps(manifest, indent=2, ensure_ascii=False) + '\n'
+    # Una corrida sin cambios no reescribe nada, tampoco el manifest
+    filename = os.path.join(output_dir, MANIFEST_FILE)
+    if file_hash(filename) != content_hash(content):
+        write_atomic(filename, content)
+
+
+def sync_bundle(output_dir: str, policies: dict, delete_stale: bool = False) -> dict:
+    """
+    Escribe todas las políticas en un solo archivo (BUNDLE_FILE) con un
+    @id por política, en vez de un archivo por política.
+
+    El bundle se reescribe entero solo si alguna política cambió; el reporte
+    usa los mismos criterios que sync_output_dir comparando contra el
+    manifest. Las políticas que ya no se generan salen del bundle, por eso
+    se reportan como stale y deleted.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    previous = load_manifest(output_dir)
+    bundle_path = os.path.join(output_dir, BUNDLE_FILE)
+    report = {'created': [], 'updated': [], 'unchanged': [], 'stale': [], 'deleted': []}
+
+    for filename, (metadata, _) in sorted(policies.items()):
+        old = previous.get(filename)
+        if old is None:
+            report['created'].append(filename)
+        elif old.get('sha256') != metadata['sha256']:
+            report['updated'].append(filename)
+        else:
+            report['unchanged'].append(filename)
+    removed = sorted(set(previous) - set(policies))
+    report['stale'] += removed
+    report['deleted'] += removed
+
+    if report['created'] or report['updated'] or removed or not os.path.exists(bundle_path):
+        write_atomic(bundle_path, '\n'.join(
+            f'@id("{os.path.splitext(filename)[0]}")\n{cedar_policy}'
+            for filename, (_, cedar_policy) in sorted(policies.items())
+        ))
+    _collect_stale_files(output_dir, policies, delete_stale, report)
+    write_manifest(output_dir, policies, bundle=BUNDLE_FILE)
+    return report
+
+
+def generate_service(context: dict, output_dir: str, delete_stale: bool = False,
+                     consolidate: bool = False, bundle: bool = False) -> tuple[dict, int, dict]:
+    """Genera y sincroniza las políticas de un contexto: (policies, merged, report)."""
+    policies, merged = build_policies(context, consolidate=consolidate)
+    sync = sync_bundle if bundle else sync_output_dir
+    return policies, merged, sync(output_dir, policies, delete_stale=delete_stale)
+
+
+def policy_description(owner: str, filename: str, sha256: str) -> str:
+    """Descripción de una política subida: dueño, nombre de archivo y hash del contenido."""
+    return f"{UPLOAD_TAG}:{owner}/{os.path.splitext(filename)[0]} sha256:{sha256[:16]}"
+
+
+def upload_owner(name: str) -> str:
+    """Dueño válido para policy_description(): sin espacios ni '/' y que entre en MAX_DESCRIPTION."""
+    max_length = MAX_DESCRIPTION - len(policy_description('', 'policy-0000000000000000.cedar', '0' * 16))
+    return re.sub(r'[\s/]+', '_', name)[:max_length] or 'default'
+
+
+def _error_code(error: Exception) -> str:
+    """Código de error de AWS de un ClientError, si no el nombre de la excepción."""
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict):
+        code = response.get('Error', {}).get('Code')
+        if code:
+            return code
+    return type(error).__name__
+
+
+class RateLimiter:
+    """Token bucket compartido por los threads del upload (rate <= 0: sin límite)."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.capacity = max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def avp_client(max_pool_connections: int):
+    """Cliente de Verified Permissions sin reintentos propios (PolicyStoreSync los hace con backoff)."""
+    import boto3
+    from botocore.config import Config
+
+    config = Config(
+        region_name=os.environ.get('AWS_REGION') or None,
+        retries={'total_max_attempts': 1},
+        max_pool_connections=max_pool_connections
+    )
+    return boto3.client('verifiedpermissions', config=config)
+
+
+class PolicyStoreSync:
+    """
+    Sincroniza las políticas generadas con un policy store de Verified Permissions.
+
+    Cada política se sube con policy_description() como descripción: dueño
+    (el servicio), nombre de archivo y hash del contenido. ListPolicies no
+    devuelve el statement, así que el diff es por esa descripción: sin
+    política con ese nombre se crea, con otro hash se actualiza, y las
+    políticas del dueño que ya no se generan se borran. Las políticas sin
+    la marca (escritas a mano u otras herramientas) nunca se tocan.
+
+    Las operaciones corren en un pool de `workers` threads, a lo sumo `rate`
+    llamadas por segundo entre todos, y las throttleadas o con errores
+    transitorios se reintentan con backoff exponencial con jitter. Primero
+    se crean y actualizan y recién después se borra, así una política que
+    se consolida en otra nunca deja un hueco sin permit.
+    """
+
+    def __init__(self, client, policy_store_id: str, workers: int = 8, rate: float = 20.0, dry_run: bool = False):
+        self.client = client
+        self.policy_store_id = policy_store_id
+        self.workers = max(1, workers)
+        self.limiter = RateLimiter(rate)
+        self.dry_run = dry_run
+        self._existing = None
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+
+    def _call(self, operation: str, **kwargs) -> dict:
+        method = getattr(self.client, operation)
+        for attempt in range(UPLOAD_MAX_RETRIES + 1):
+            self.limiter.acquire()
+            with self._lock:
+                self.calls += 1
+            try:
+                return method(**kwargs)
+            except Exception as e:
+                if _error_code(e) not in RETRYABLE_ERRORS or attempt == UPLOAD_MAX_RETRIES:
+                    raise
+            with self._lock:
+                self.retries += 1
+            time.sleep(random.uniform(0, min(UPLOAD_BACKOFF_MAX, UPLOAD_BACKOFF_BASE * 2 ** attempt)))
+
+    def existing(self) -> dict:
+        """{dueño: {nombre: [(policyId, hash)]}} de las políticas marcadas del store (se lista una vez)."""
+        if self._existing is None:
+            existing = {}
+            kwargs = {'policyStoreId': self.policy_store_id, 'filter': {'policyType': 'STATIC'}, 'maxResults': 50}
+            while True:
+                page = self._call('list_policies', **kwargs)
+                for item in page.get('policies', []):
+                    description = item.get('definition', {}).get('static', {}).get('description', '')
+                    match = _UPLOAD_TAG_RE.match(description)
+                    if match:
+                        existing.setdefault(match['owner'], {}).setdefault(match['stem'], []).append(
+                            (item['policyId'], match['digest'])
+                        )
+                if not page.get('nextToken'):
+                    break
+                kwargs['nextToken'] = page['nextToken']
+            self._existing = existing
+        return self._existing
+
+    def plan(self, owner: str, policies: dict) -> tuple[list, list]:
+        """
+        Operaciones para que el store tenga exactamente `policies` para owner.
+
+        Devuelve ([(acción, filename, policyId, descripción, statement)], sin cambios).
+        Las copias de una misma política (p.ej. de un upload interrumpido) se borran.
+        """
+        current = self.existing().get(owner, {})
+        operations, unchanged = [], []
+        for filename, (metadata, cedar_policy) in sorted(policies.items()):
+            description = policy_description(owner, filename, metadata['sha256'])
+            found = current.get(os.path.splitext(filename)[0], [])
+            if not found:
+                operations.append(('create', filename, None, description, cedar_policy))
+                continue
+            (policy_id, digest), copies = found[0], found[1:]
+            operations += [('delete', filename, copy_id, None, None) for copy_id, _ in copies]
+            if digest == metadata['sha256'][:16]:
+                unchanged.append(filename)
+            else:
+                operations.append(('update', filename, policy_id, description, cedar_policy))
+        for stem, found in sorted(current.items()):
+            if f"{stem}.cedar" not in policies:
+                operations += [('delete', f"{stem}.cedar", policy_id, None, None) for policy_id, _ in found]
+        return operations, unchanged
+
+    def _apply(self, operation: tuple) -> tuple:
+        """Ejecuta una operación; devuelve (nombre, policyId, hash) de lo que queda en el store o None."""
+        action, filename, policy_id, description, statement = operation
+        stem = os.path.splitext(filename)[0]
+        if action == 'delete':
+            self._call('delete_policy', policyStoreId=self.policy_store_id, policyId=policy_id)
+            return None
+        definition = {'static': {'description': description, 'statement': statement}}
+        digest = description.rsplit(':', 1)[1]
+        if action == 'update':
+            try:
+                self._call('update_policy', policyStoreId=self.policy_store_id, policyId=policy_id,
+                           definition=definition)
+                return stem, policy_id, digest
+            except Exception as e:
+                if _error_code(e) != 'ValidationException':
+                    raise
+            # UpdatePolicy no cambia principal ni recurso de una política estática: se reemplaza
+            created = self._create(definition)
+            self._call('delete_policy', policyStoreId=self.policy_store_id, policyId=policy_id)
+            return stem, created, digest
+        return stem, self._create(definition), digest
+
+    def _create(self, definition: dict) -> str:
+        # Mismo clientToken en los reintentos: un create que llegó pero cuya respuesta se perdió no se duplica
+        response = self._call('create_policy', policyStoreId=self.policy_store_id,
+                              clientToken=str(uuid.uuid4()), definition=definition)
+        return response['policyId']
+
+    def sync(self, owner: str, policies: dict, progress=None) -> dict:
+        """
+        Sincroniza las políticas de owner; devuelve el reporte
+        {created, updated, deleted, unchanged, failed: [filename...], seconds}.
+        progress(done, total) se llama a lo sumo cada PROGRESS_SECONDS.
+        """
+        started = time.perf_counter()
+        operations, unchanged = self.plan(owner, policies)
+        report = {'created': [], 'updated': [], 'deleted': [], 'unchanged': unchanged, 'failed': []}
+        if self.dry_run:
+            for action, filename, *_ in operations:
+                report[f"{action}d"].append(filename)
+            report['seconds'] = time.perf_counter() - started
+            return report
+
+        current = self._existing.setdefault(owner, {})
+        done, last_progress = 0, started
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            # Primero altas y cambios, después bajas
+            for phase in (('create', 'update'), ('delete',)):
+                futures = {pool.submit(self._apply, op): op for op in operations if op[0] in phase}
+                for future in as_completed(futures):
+                    action, filename, policy_id, *_ = futures[future]
+                    stem = os.path.splitext(filename)[0]
+                    done += 1
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        report['failed'].append(filename)
+                        print(f"Error: {action} {owner}/{filename}: {_error_code(e)}: {e}", file=sys.stderr)
+                    else:
+                        report[f"{action}d"].append(filename)
+                        remaining = [entry for entry in current.get(stem, []) if entry[0] != policy_id]
+                        if result is not None:
+                            remaining = [(result[1], result[2])] + remaining
+                        if remaining:
+                            current[stem] = remaining
+                        else:
+                            current.pop(stem, None)
+                    now = time.perf_counter()
+                    if progress is not None and now - last_progress >= PROGRESS_SECONDS:
+                        last_progress = now
+                        progress(done, len(operations))
+        report['seconds'] = time.perf_counter() - started
+        return report
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'calls': self.calls, 'retries': self.retries}
+
+
+def print_upload_report(owner: str, report: dict, sync: PolicyStoreSync):
+    """Una línea por servicio con lo que hizo el upload (o haría, con --dry-run)."""
+    operations = len(report['created']) + len(report['updated']) + len(report['deleted'])
+    verb = "would " if sync.dry_run else ""
+    rate = operations / report['seconds'] if report['seconds'] > 0 and not sync.dry_run else 0
+    print(f"Upload {owner}: {verb}create {len(report['created'])}, {verb}update {len(report['updated'])}, "
+          f"{verb}delete {len(report['deleted'])}, unchanged {len(report['unchanged'])}, "
+          f"failed {len(report['failed'])} in {report['seconds']:.2f}s"
+          + (f" ({rate:.1f} ops/s)" if rate else ""))
+
+
+def upload_progress(owner: str, sync: PolicyStoreSync):
+    started = time.perf_counter()
+
+    def progress(done: int, total: int):
+        elapsed = time.perf_counter() - started
+        stats = sync.stats()
+        print(f"  {owner}: {done}/{total} operations, {done / elapsed:.1f} ops/s, "
+              f"{stats['calls']} calls, {stats['retries']} retries", flush=True)
+    return progress
+
+
+def service_name(context: dict, lineno: int) -> str:
+    """Nombre del directorio de un servicio en modo batch."""
+    name = str(context.get('slug') or context.get('name') or context.get('id') or f"service-{lineno}")
+    return name.replace(os.sep, '_').lstrip('.') or f"service-{lineno}"
+
+
+# Configuración por proceso del modo batch (se inicializa en cada worker del pool)
+_batch = {}
+
+
+def _init_batch(config: dict):
+    _batch.clear()
+    _batch.update(config)
+
+
+def _process_record(item: tuple) -> dict:
+    lineno, service, context, error = item
+    result = {'line': lineno, 'service': service, 'error': error}
+    if error:
+        return result
+    try:
+        policies, merged, report = generate_service(
+            context,
+            os.path.join(_batch['output_dir'], service),
+            delete_stale=_batch['delete_stale'],
+            consolidate=_batch['consolidate'],
+            bundle=_batch['bundle']
+        )
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+        return result
+    result['policies'] = len(policies)
+    result['merged'] = merged
+    result.update({key: len(files) for key, files in report.items()})
+    if _batch.get('upload'):
+        # El upload lo hace el proceso principal, con un solo rate limit hacia AVP
+        result['upload'] = policies
+    return result
+
+
+def _read_records(stream):
+    """Lee los NP_CONTEXT de a una línea: (lineno, servicio, contexto, error)."""
+    for lineno, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            context = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield lineno, None, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(context, dict):
+            yield lineno, None, None, "Invalid JSON: expected an object"
+            continue
+        yield lineno, service_name(context, lineno), context, None
+
+
+def _windows(records, size: int):
+    """
+    Agrupa los registros en tandas de hasta size sin repetir servicio: dos
+    registros del mismo servicio nunca escriben su directorio en paralelo y
+    el último del archivo es el que queda.
+    """
+    window, services = [], set()
+    for record in records:
+        service = record[1]
+        if len(window) >= size or (service is not None and service in services):
+            yield window
+            window, services = [], set()
+        window.append(record)
+        if service is not None:
+            services.add(service)
+    if window:
+        yield window
+
+
+def run_batch(stream, config: dict, workers: int, store_sync: PolicyStoreSync = None) -> int:
+    """
+    Procesa un stream JSONL de NP_CONTEXT; devuelve la cantidad de errores.
+
+    Con store_sync las políticas de cada servicio se sincronizan además con
+    el policy store, con el servicio como dueño.
+    """
+    started = time.perf_counter()
+    totals = {'services': 0, 'policies': 0, 'merged': 0, 'created': 0, 'updated': 0,
+              'unchanged': 0, 'stale': 0, 'deleted': 0}
+    upload_totals = {'created': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0, 'failed': 0}
+    errors = 0
+
+    def report(result: dict):
+        nonlocal errors
+        if result['error']:
+            errors += 1
+            print(f"Error: line {result['line']} ({result['service'] or '-'}): {result['error']}", file=sys.stderr)
+            return
+        totals['services'] += 1
+        for key in totals.keys() - {'services'}:
+            totals[key] += result[key]
+        print(f"{result['service']}: {result['policies']} policies "
+              f"(created {result['created']}, updated {result['updated']}, "
+              f"unchanged {result['unchanged']}, stale {result['stale']}, "
+              f"deleted {result['deleted']}, merged {result['merged']})")
+        if store_sync is not None:
+            owner = upload_owner(result['service'])
+            upload = store_sync.sync(owner, result['upload'], upload_progress(owner, store_sync))
+            print_upload_report(owner, upload, store_sync)
+            for key in upload_totals:
+                upload_totals[key] += len(upload[key])
+            if upload['failed']:
+                errors += 1
+
+    windows = _windows(_read_records(stream), max(1, workers) * BATCH_WINDOW_PER_WORKER)
+    if workers > 1:
+        with Pool(workers, initializer=_init_batch, initargs=(config,)) as pool:
+            for window in windows:
+                for result in pool.imap_unordered(_process_record, window):
+                    report(result)
+    else:
+        _init_batch(config)
+        for window in windows:
+            for item in window:
+                report(_process_record(item))
+
+    elapsed = time.perf_counter() - started
+    print(f"\nServices: {totals['services']}, errors: {errors}, policies: {totals['policies']} "
+          f"(created {totals['created']}, updated {totals['updated']}, unchanged {totals['unchanged']}, "
+          f"stale {totals['stale']}, deleted {totals['deleted']}, merged {totals['merged']}) "
+          f"in {elapsed:.2f}s")
+    if store_sync is not None:
+        stats = store_sync.stats()
+        print(f"Upload: created {upload_totals['created']}, updated {upload_totals['updated']}, "
+              f"deleted {upload_totals['deleted']}, unchanged {upload_totals['unchanged']}, "
+              f"failed {upload_totals['failed']} ({stats['calls']} API calls, {stats['retries']} retries)")
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera políticas Cedar a partir de NP_CONTEXT")
+    parser.add_argument('--batch', metavar='FILE',
+                        help="JSONL con un NP_CONTEXT por línea ('-' para stdin)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="procesos del modo batch (default: CPUs)")
+    parser.add_argument('--bundle', action='store_true',
+                        help=f"escribir un solo {BUNDLE_FILE} por servicio en vez de un archivo por política")
+    parser.add_argument('--upload', metavar='POLICY_STORE_ID',
+                        help="sincronizar las políticas generadas con ese policy store de Verified Permissions")
+    parser.add_argument('--owner',
+                        help="dueño de las políticas subidas (default: slug/name/id del NP_CONTEXT; "
+                             "en batch es cada servicio)")
+    parser.add_argument('--upload-workers', type=int, default=8,
+                        help="threads que suben políticas en paralelo (default: 8)")
+    parser.add_argument('--upload-rate', type=float, default=20.0,
+                        help="llamadas por segundo a Verified Permissions (default: 20, 0 = sin límite)")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="con --upload, mostrar qué se crearía, actualizaría y borraría sin cambiar el store")
+    args = parser.parse_args()
+
+    # Directorio de salida
+    output_dir = os.environ.get('CEDAR_OUTPUT_DIR', 'cedar')
+    # Borrar políticas que ya no se generan (por defecto solo se reportan)
+    delete_stale = os.environ.get('CEDAR_DELETE_STALE', 'false').lower() == 'true'
+    # Unir políticas equivalentes del mismo componente (opcional, ver docstring)
+    consolidate = os.environ.get('CEDAR_CONSOLIDATE', 'false').lower() == 'true'
+
+    store_sync = None
+    if args.upload:
+        store_sync = PolicyStoreSync(
+            avp_client(max(args.upload_workers, 10)), args.upload,
+            workers=args.upload_workers, rate=args.upload_rate, dry_run=args.dry_run
+        )
+
+    if args.batch:
+        config = {
+            'output_dir': output_dir,
+            'delete_stale': delete_stale,
+            'consolidate': consolidate,
+            'bundle': args.bundle,
+            'upload': store_sync is not None
+        }
+        if args.batch == '-':
+            errors = run_batch(sys.stdin, config, args.workers, store_sync)
+        else:
+            with open(args.batch) as stream:
+                errors = run_batch(stream, config, args.workers, store_sync)
+        sys.exit(1 if errors else 0)
+
+    # Leer JSON desde variable de entorno
+    np_context = os.environ.get('NP_CONTEXT')
+    if not np_context:
+        print("Error: NP_CONTEXT environment variable not set", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        context = json.loads(np_context)
+    except json.JSONDecodeError as e:
+        print(f"Error: Invalid JSON in NP_CONTEXT: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    policies, merged, report = generate_service(
+        context, output_dir, delete_stale=delete_stale, consolidate=consolidate, bundle=args.bundle
+    )
 
-            # Guardar archivo
-            filename = f"{output_dir}/policy-{policy_counter:03d}.cedar"
-            with open(filename, 'w') as f:
-                f.write(cedar_policy)
+    if args.bundle:
+        print(f"Bundle: {output_dir}/{BUNDLE_FILE}")
+    for filename in report['created']:
+        print(f"Created: {output_dir}/{filename}")
+    for filename in report['updated']:
+        print(f"Updated: {output_dir}/{filename}")
+    for filename in report['stale']:
+        status = "Deleted" if filename in report['deleted'] else "Stale"
+        print(f"{status}: {output_dir}/{filename}")
 
-            print(f"Generated: {filename}")
+    print(f"\nTotal policies generated: {len(policies)}")
+    if consolidate:
+        print(f"Consolidated: {merged} policies merged")
+    print(f"Created: {len(report['created'])}, updated: {len(report['updated'])}, "
+          f"unchanged: {len(report['unchanged'])}, stale: {len(report['stale'])}, "
+          f"deleted: {len(report['deleted'])}")
 
-    print(f"\nTotal policies generated: {policy_counter}")
+    if store_sync is not None:
+        owner = upload_owner(args.owner or service_name(context, 0))
+        upload = store_sync.sync(owner, policies, upload_progress(owner, store_sync))
+        print()
+        if args.dry_run:
+            for key, verb in (('created', 'Would create'), ('updated', 'Would update'), ('deleted', 'Would delete')):
+                for filename in upload[key]:
+                    print(f"{verb}: {args.upload}/{owner}/{filename}")
+        print_upload_report(owner, upload, store_sync)
+        stats = store_sync.stats()
+        print(f"{stats['calls']} API calls, {stats['retries']} retries")
+        if upload['failed']:
+            sys.exit(1)
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,27 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+AVP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SMOKE_DIR = os.path.join(os.path.dirname(AVP_DIR), "avp-smoke")
+
+# cedar_engine (authorizer) and fake_avp (bench) are flat modules imported by name
+sys.path.insert(0, os.path.join(SMOKE_DIR, "authorizer"))
+sys.path.insert(0, os.path.join(SMOKE_DIR, "bench"))
+
+
+def _load_generator():
+    # generate-cedars.py is a script, not an importable module name
+    spec = importlib.util.spec_from_file_location("generate_cedars", os.path.join(AVP_DIR, "generate-cedars.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module  # the batch Pool pickles its functions by module name
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="session")
+def gen():
+    return sys.modules.get("generate_cedars") or _load_generator()
+
@@ -0,0 +1,13 @@
+"""NP_CONTEXT documents for the generator tests."""
+
+
+def context(*routes, namespace="App", group_prefix="AWS_", slug=None) -> dict:
+    """NP_CONTEXT with these routes ({path, scope, app_component, policies})."""
+    document = {"parameters": {"cedar": {"namespace": namespace, "group_prefix": group_prefix}, "routes": list(routes)}}
+    if slug:
+        document["slug"] = slug
+    return document
+
+
+def route(path: str, policies: dict, scope="Desa", app_component="Orders", method="GET") -> dict:
+    return {"path": path, "scope": scope, "app_component": app_component, "method": method, "policies": policies}
@@ -0,0 +1,58 @@
+import io
+import json
+
+import pytest
+
+from contexts import context, route
+
+READ = route("/orders", {"Read": ["Visita"]})
+UPDATE = route("/orders", {"Update": ["Gestor"]}, method="PATCH")
+
+
+def jsonl(*lines) -> io.StringIO:
+    return io.StringIO("\n".join(line if isinstance(line, str) else json.dumps(line) for line in lines) + "\n")
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_lines_are_processed_independently(gen, tmp_path, capsys, workers):
+    config = {"output_dir": str(tmp_path), "delete_stale": False, "consolidate": False,
+              "bundle": False, "upload": False}
+    stream = jsonl(
+        context(READ, slug="orders"),
+        "{not json",
+        "[1, 2]",
+        "",
+        {"slug": "broken", "parameters": {"routes": [None]}},
+        context(READ, UPDATE, slug="billing"),
+    )
+
+    errors = gen.run_batch(stream, config, workers)
+
+    out, err = capsys.readouterr()
+    assert errors == 3
+    assert "Error: line 2 (-): Invalid JSON" in err
+    assert "Error: line 3 (-): Invalid JSON: expected an object" in err
+    assert "Error: line 5 (broken): AttributeError" in err
+    assert "orders: 1 policies (created 1," in out
+    assert "billing: 2 policies (created 2," in out
+    assert "Services: 2, errors: 3, policies: 3" in out
+    assert len(list((tmp_path / "orders").glob("policy-*.cedar"))) == 1
+    assert len(list((tmp_path / "billing").glob("policy-*.cedar"))) == 2
+    assert not (tmp_path / "broken").exists()
+
+
+def test_last_line_of_a_service_wins(gen, tmp_path, capsys):
+    config = {"output_dir": str(tmp_path), "delete_stale": True, "consolidate": False,
+              "bundle": False, "upload": False}
+    stream = jsonl(context(READ, UPDATE, slug="orders"), context(READ, slug="orders"))
+
+    assert gen.run_batch(stream, config, 2) == 0
+    out, _ = capsys.readouterr()
+    assert "orders: 2 policies" in out and "orders: 1 policies" in out
+    assert len(list((tmp_path / "orders").glob("policy-*.cedar"))) == 1
+
+
+def test_windows_never_repeat_a_service(gen):
+    records = [(n, service, {}, None) for n, service in enumerate(["a", "b", "a", None, None, "c", "d"], 1)]
+    windows = [[record[1] for record in window] for window in gen._windows(iter(records), 3)]
+    assert windows == [["a", "b"], ["a", None, None], ["c", "d"]]
@@ -0,0 +1,62 @@
+import itertools
+import json
+
+import pytest
+
+from cedar_engine import PolicySnapshot
+from contexts import context, route
+
+ROUTES = [
+    route("/orders", {"Read": ["Visita", "Gestor"]}),
+    route("/orders/{id}", {"Read": ["Gestor", "Visita"]}),
+    route("/orders/{id}", {"Update": ["Gestor"]}, method="PATCH"),
+    route("/orders/{id}/items", {"Update": ["Gestor"]}, method="PATCH"),
+    route("/reports", {"Read": ["Gestor"]}),
+    route("/orders", {"Read": ["Visita", "Gestor"]}, app_component="Billing"),
+]
+PATHS = ["/orders", "/orders/{id}", "/orders/{id}/items", "/reports", "/unknown"]
+COMPONENTS = ["Orders", "Billing"]
+ACTIONS = ["Read", "Update", "Delete"]
+GROUPS = [[], ["AWS_Visita_Desa"], ["AWS_Gestor_Desa"], ["AWS_Gestor_Prod"], ["AWS_Visita_Desa", "other"]]
+
+
+def generate(gen, tmp_path, monkeypatch, consolidate) -> PolicySnapshot:
+    """Run generate-cedars.py as the CLI does, with or without CEDAR_CONSOLIDATE."""
+    output_dir = tmp_path / f"consolidate-{consolidate}"
+    monkeypatch.setattr("sys.argv", ["generate-cedars.py"])
+    monkeypatch.setenv("NP_CONTEXT", json.dumps(context(*ROUTES)))
+    monkeypatch.setenv("CEDAR_OUTPUT_DIR", str(output_dir))
+    if consolidate is None:
+        monkeypatch.delenv("CEDAR_CONSOLIDATE", raising=False)
+    else:
+        monkeypatch.setenv("CEDAR_CONSOLIDATE", consolidate)
+    gen.main()
+    return PolicySnapshot.from_sources([(p.name, p.read_text()) for p in sorted(output_dir.glob("policy-*.cedar"))])
+
+
+def decisions(snapshot: PolicySnapshot) -> dict:
+    result = {}
+    for component, path, action, groups in itertools.product(COMPONENTS, PATHS, ACTIONS, GROUPS):
+        response = snapshot.evaluate(
+            ("App::User", "alice"), ("App::Action", action), (f"App::{component}", path),
+            [], {"token": {"custom:groups": groups}},
+        )
+        assert not response["errors"]
+        result[(component, path, action, tuple(groups))] = response["decision"]
+    return result
+
+
+def test_consolidation_is_opt_in(gen, tmp_path, monkeypatch):
+    assert len(generate(gen, tmp_path, monkeypatch, None).policies) == len(ROUTES)
+    assert len(generate(gen, tmp_path, monkeypatch, "false").policies) == len(ROUTES)
+    assert len(generate(gen, tmp_path, monkeypatch, "true").policies) == len(ROUTES) - 2
+
+
+@pytest.mark.parametrize("consolidate", [None, "true"])
+def test_consolidated_policies_grant_exactly_the_same(gen, tmp_path, monkeypatch, consolidate):
+    per_route, _ = gen.build_policies(context(*ROUTES))
+    expected = decisions(PolicySnapshot.from_sources(
+        [(filename, text) for filename, (_, text) in per_route.items()]
+    ))
+    assert "ALLOW" in expected.values() and "DENY" in expected.values()
+    assert decisions(generate(gen, tmp_path, monkeypatch, consolidate)) == expected
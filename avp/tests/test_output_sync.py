@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+from contexts import context, route
+
+READ = route("/orders", {"Read": ["Visita", "Gestor"]})
+UPDATE = route("/orders", {"Update": ["Gestor"]}, method="PATCH")
+
+
+@pytest.fixture
+def writes(gen, monkeypatch) -> list:
+    """File names written through write_atomic."""
+    written = []
+    write_atomic = gen.write_atomic
+
+    def recording(filename, content):
+        written.append(filename.rsplit("/", 1)[-1])
+        write_atomic(filename, content)
+    monkeypatch.setattr(gen, "write_atomic", recording)
+    return written
+
+
+def manifest(output_dir) -> dict:
+    return json.loads((output_dir / "manifest.json").read_text())
+
+
+@pytest.mark.parametrize("bundle", [False, True])
+def test_unchanged_rerun_writes_nothing(gen, tmp_path, writes, bundle):
+    policies, _, report = gen.generate_service(context(READ, UPDATE), str(tmp_path), bundle=bundle)
+    assert len(report["created"]) == 2
+    assert writes
+    writes.clear()
+
+    _, _, report = gen.generate_service(context(READ, UPDATE), str(tmp_path), bundle=bundle)
+    assert report["unchanged"] == sorted(policies)
+    assert not report["created"] and not report["updated"] and not report["stale"]
+    assert writes == []
+
+
+def test_changed_policy_replaces_its_file(gen, tmp_path, writes):
+    gen.generate_service(context(READ, UPDATE), str(tmp_path))
+    writes.clear()
+    changed = route("/orders", {"Read": ["Visita"]})
+
+    policies, _, report = gen.generate_service(context(changed, UPDATE), str(tmp_path))
+    filename = gen.policy_filename("App", "Orders", "/orders", "Read")
+    assert report["updated"] == [filename]
+    assert len(report["unchanged"]) == 1
+    assert sorted(writes) == sorted([filename, "manifest.json"])
+    assert (tmp_path / filename).read_text() == policies[filename][1]
+    assert '"AWS_Gestor_Desa"' not in (tmp_path / filename).read_text()
+    assert manifest(tmp_path)["policies"][filename]["sha256"] == policies[filename][0]["sha256"]
+
+
+def test_removed_policy_is_deleted_with_its_manifest_entry(gen, tmp_path):
+    gen.generate_service(context(READ, UPDATE), str(tmp_path))
+    removed = gen.policy_filename("App", "Orders", "/orders", "Update")
+
+    _, _, report = gen.generate_service(context(READ), str(tmp_path))
+    assert report["stale"] == [removed] and report["deleted"] == []
+    assert (tmp_path / removed).exists()
+    assert removed not in manifest(tmp_path)["policies"]
+
+    gen.generate_service(context(READ, UPDATE), str(tmp_path))
+    _, _, report = gen.generate_service(context(READ), str(tmp_path), delete_stale=True)
+    assert report["deleted"] == [removed]
+    assert not (tmp_path / removed).exists()
+    assert removed not in manifest(tmp_path)["policies"]
+    assert manifest(tmp_path)["version"] == gen.MANIFEST_VERSION
+
+
+def test_bundle_drops_removed_policy(gen, tmp_path):
+    gen.generate_service(context(READ, UPDATE), str(tmp_path), bundle=True)
+    _, _, report = gen.generate_service(context(READ), str(tmp_path), bundle=True)
+    removed = gen.policy_filename("App", "Orders", "/orders", "Update")
+    assert report["deleted"] == [removed]
+    bundle = (tmp_path / gen.BUNDLE_FILE).read_text()
+    assert bundle.count("@id(") == 1 and "Update" not in bundle
+    assert list(manifest(tmp_path)["policies"]) == [gen.policy_filename("App", "Orders", "/orders", "Read")]
@@ -0,0 +1,111 @@
+import itertools
+import json
+
+import pytest
+
+import permit_index
+from cedar_engine import PolicySnapshot
+from contexts import context, route
+from permit_index import PermitIndex
+
+ROUTES = [
+    route("/orders", {"Read": ["Visita", "Gestor"]}),
+    route("/orders/{id}", {"Read": ["Gestor", "Visita"]}),
+    route("/orders/{id}", {"Update": ["Gestor"]}, method="PATCH"),
+    route("/orders/{id}/items", {"Update": ["Gestor"]}, method="PATCH"),
+    route("/reports", {"Read": ["Gestor"]}, scope="Prod"),
+]
+RESOURCES = [("App::Orders", path) for path in ["/orders", "/orders/{id}", "/orders/{id}/items", "/reports", "/*"]]
+ACTIONS = ["Read", "Update", "Delete"]
+GROUPS = [[], ["AWS_Visita_Desa"], ["AWS_Gestor_Desa"], ["AWS_Gestor_Prod"], ["other", "AWS_Visita_Desa"]]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+def generate(gen, tmp_path, monkeypatch, consolidate: str):
+    output_dir = tmp_path / f"consolidate-{consolidate}"
+    monkeypatch.setattr("sys.argv", ["generate-cedars.py"])
+    monkeypatch.setenv("NP_CONTEXT", json.dumps(context(*ROUTES)))
+    monkeypatch.setenv("CEDAR_OUTPUT_DIR", str(output_dir))
+    monkeypatch.setenv("CEDAR_CONSOLIDATE", consolidate)
+    gen.main()
+    return output_dir
+
+
+def index(filename) -> PermitIndex:
+    permits = PermitIndex(str(filename))
+    assert permits.load()
+    return permits
+
+
+def test_could_permit_matches_groups_per_action_and_template(tmp_path):
+    filename = tmp_path / "context.json"
+    filename.write_text(json.dumps(context(*ROUTES)))
+    permits = index(filename)
+    assert permits.could_permit("Read", "App::Orders", "/orders/{id}", {"custom:groups": ["AWS_Visita_Desa"]})
+    assert permits.could_permit("Read", "App::Orders", "/reports", {"custom:groups": "AWS_Gestor_Prod"})
+    assert not permits.could_permit("Update", "App::Orders", "/orders/{id}", {"custom:groups": ["AWS_Visita_Desa"]})
+    assert not permits.could_permit("Read", "App::Orders", "/reports", {"custom:groups": ["AWS_Gestor_Desa"]})
+    assert not permits.could_permit("Read", "App::Orders", "/orders/123", {"custom:groups": ["AWS_Visita_Desa"]})
+    assert not permits.could_permit("Delete", "App::Orders", "/orders", {"custom:groups": ["AWS_Gestor_Desa"]})
+    assert not permits.could_permit("Read", "App::Billing", "/orders", {"custom:groups": ["AWS_Visita_Desa"]})
+    assert not permits.could_permit("Read", "App::Orders", "/orders", {})
+    assert permits.stats()["passed"] == 2 and permits.stats()["denied"] == 6
+
+
+@pytest.mark.parametrize("consolidate", ["false", "true"])
+def test_manifest_index_agrees_with_the_generated_policies(gen, tmp_path, monkeypatch, consolidate):
+    output_dir = generate(gen, tmp_path, monkeypatch, consolidate)
+    manifest = json.loads((output_dir / "manifest.json").read_text())
+    widest = max(len(policy["paths"]) for policy in manifest["policies"].values())
+    assert widest == (2 if consolidate == "true" else 1)
+    permits = index(output_dir / "manifest.json")
+    snapshot = PolicySnapshot.from_sources([(p.name, p.read_text()) for p in output_dir.glob("policy-*.cedar")])
+    decisions = set()
+    for (resource_type, path), action, groups in itertools.product(RESOURCES, ACTIONS, GROUPS):
+        claims = {"custom:groups": groups}
+        decision = snapshot.evaluate(
+            ("App::User", "alice"), ("App::Action", action), (resource_type, path), [], {"token": claims}
+        )["decision"]
+        # Exact, not just safe: the index denies every check the policies deny
+        assert permits.could_permit(action, resource_type, path, claims) == (decision == "ALLOW")
+        decisions.add(decision)
+    assert decisions == {"ALLOW", "DENY"}
+
+
+def test_not_loaded_lets_every_check_through(tmp_path):
+    permits = PermitIndex(str(tmp_path / "missing.json"))
+    assert not permits.load()
+    assert permits.could_permit("Delete", "App::Orders", "/orders", {})
+    assert permits.stats()["ready"] is False
+
+
+def test_maybe_reload_polls_at_the_interval_and_keeps_the_index_on_errors(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(permit_index, "time", clock)
+    filename = tmp_path / "context.json"
+    filename.write_text(json.dumps(context(ROUTES[0])))
+    permits = PermitIndex(str(filename), reload_interval=5)
+    permits.load()
+    visita = {"custom:groups": ["AWS_Visita_Desa"]}
+    assert not permits.could_permit("Read", "App::Orders", "/reports", visita)
+
+    filename.write_text(json.dumps(context(ROUTES[0], route("/reports", {"Read": ["Visita"]}))))
+    clock.now += 4
+    permits.maybe_reload()
+    assert not permits.could_permit("Read", "App::Orders", "/reports", visita)
+    clock.now += 1
+    permits.maybe_reload()
+    assert permits.could_permit("Read", "App::Orders", "/reports", visita)
+
+    filename.write_text("{truncated")
+    clock.now += 5
+    permits.maybe_reload()
+    assert permits.could_permit("Read", "App::Orders", "/reports", visita)
+    assert permits.stats()["reloads"] == 2 and permits.stats()["reload_errors"] == 1
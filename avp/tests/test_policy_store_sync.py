@@ -0,0 +1,85 @@
+import threading
+
+import pytest
+
+from contexts import context, route
+from fake_avp import FakeAvpConfig, FakeAvpServer
+
+STORE = "store-1"
+READ = route("/orders", {"Read": ["Visita"]})
+UPDATE = route("/orders", {"Update": ["Gestor"]}, method="PATCH")
+REPORTS = route("/reports", {"Read": ["Gestor"]})
+
+
+@pytest.fixture
+def fake_avp():
+    server = FakeAvpServer(0, FakeAvpConfig(latency_ms=0, jitter_ms=0))
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(gen, fake_avp, monkeypatch):
+    monkeypatch.setenv("AWS_ENDPOINT_URL_VERIFIEDPERMISSIONS", fake_avp.endpoint_url)
+    monkeypatch.setenv("AWS_REGION", "us-east-1")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    monkeypatch.delenv("AWS_PROFILE", raising=False)
+    return gen.avp_client(4)
+
+
+def sync(gen, client, *routes, **options) -> dict:
+    """Sync the routes as service "orders" with a fresh PolicyStoreSync (lists the store again)."""
+    policies, _ = gen.build_policies(context(*routes))
+    return gen.PolicyStoreSync(client, STORE, workers=4, rate=1000, **options).sync("orders", policies)
+
+
+def statements(fake_avp) -> list:
+    return sorted(policy["statement"] for policy in fake_avp.policies.values())
+
+
+def test_sync_creates_updates_and_deletes_only_what_changed(gen, client, fake_avp):
+    report = sync(gen, client, READ, UPDATE)
+    assert (len(report["created"]), report["updated"], report["deleted"], report["failed"]) == (2, [], [], [])
+    created = statements(fake_avp)
+
+    rerun = sync(gen, client, READ, UPDATE)
+    assert rerun["created"] == rerun["updated"] == rerun["deleted"] == []
+    assert sorted(rerun["unchanged"]) == sorted(report["created"])
+    assert statements(fake_avp) == created
+
+    changed = sync(gen, client, route("/orders", {"Read": ["Visita", "Gestor"]}), REPORTS)
+    assert (len(changed["created"]), len(changed["updated"]), len(changed["deleted"])) == (1, 1, 1)
+    assert changed["failed"] == []
+    policies, _ = gen.build_policies(context(route("/orders", {"Read": ["Visita", "Gestor"]}), REPORTS))
+    assert statements(fake_avp) == sorted(text for _, text in policies.values())
+
+
+def test_policies_not_written_by_the_generator_are_left_alone(gen, client, fake_avp):
+    client.create_policy(policyStoreId=STORE, definition={"static": {
+        "description": "hand written", "statement": "permit(principal, action, resource);"
+    }})
+    sync(gen, client, READ)
+    assert sync(gen, client)["deleted"] and len(fake_avp.policies) == 1
+
+
+def test_dry_run_only_plans(gen, client, fake_avp):
+    report = sync(gen, client, READ, UPDATE, dry_run=True)
+    assert len(report["created"]) == 2
+    assert fake_avp.policies == {}
+
+
+def test_throttled_calls_are_retried_with_backoff(gen, client, fake_avp, monkeypatch):
+    monkeypatch.setattr(gen, "UPLOAD_BACKOFF_BASE", 0.001)
+    fake_avp.config = FakeAvpConfig(latency_ms=0, jitter_ms=0, throttle_rate=0.3, seed=7)
+    store_sync = gen.PolicyStoreSync(client, STORE, workers=4, rate=1000)
+    policies, _ = gen.build_policies(context(READ, UPDATE, REPORTS))
+
+    report = store_sync.sync("orders", policies)
+
+    assert len(report["created"]) == 3 and report["failed"] == []
+    assert store_sync.stats()["retries"] == fake_avp.stats()["injected"]["throttled"] > 0
+    assert len(fake_avp.policies) == 3
@@ -0,0 +1,38 @@
+import argparse
+import json
+
+import replay
+
+
+def record(t, status=200, **fields) -> dict:
+    return dict({"t": t, "m": "GET", "p": "/orders", "h": "api", "c": "ab" * 16, "g": ["Visita"],
+                 "s": status, "src": "AVP", "ms": 1.0}, **fields)
+
+
+def test_read_capture_merges_workers_by_start_time(tmp_path):
+    # Each worker writes a check when it ends: a slow one lands after later starts
+    (tmp_path / "capture-1.jsonl").write_text("".join(json.dumps(record(t)) + "\n" for t in [1.0, 4.0, 2.0]))
+    (tmp_path / "capture-2.jsonl").write_text("".join(json.dumps(record(t)) + "\n" for t in [3.0, 5.0]))
+    assert [r["t"] for r in replay.read_capture([str(tmp_path)])] == [1.0, 2.0, 3.0, 4.0, 5.0]
+
+
+def test_replay_consumes_the_capture_as_it_goes():
+    consumed = []
+
+    def records():
+        for t, status in [(1.0, 200), (2.0, 403), (3.0, 503), (4.0, 200)]:
+            consumed.append(t)
+            yield record(t, status)
+
+    def check(r):
+        assert consumed[-1] == r["t"]  # nothing read ahead of the check being replayed
+        return 200
+
+    tally = replay.Tally()
+    replay.replay_inline(argparse.Namespace(speed=0), records(), check, tally)
+    assert tally.requests == 4
+    assert tally.parity() == {
+        "compared": 3, "matches": 2, "match_rate": 0.6667, "mismatches": {"403->200": 1},
+        "samples": ["GET /orders groups=['Visita'] 403->200"],
+    }
+    assert tally.captured()["duration_s"] == 3.0
@@ -1,135 +1,310 @@
 #!/usr/bin/env python3
-  """
-  Generador de JWT para pruebas de seguridad AVP
-  """
-
-  import json
-  import base64
-  import hmac
-  import hashlib
-  import time
-  from datetime import datetime
-
-  # Configuración
-  SECRET = "test-secret-key-for-smoke-testing"
-  ISSUER = "https://testing.secure.istio.io"
-
-  def base64url_encode(data: bytes | str) -> str:
-      """Codifica en base64url sin padding."""
-      if isinstance(data, str):
-          data = data.encode('utf-8')
-      return base64.urlsafe_b64encode(data).rstrip(b'=').decode('utf-8')
-
-  def create_jwt(payload: dict, secret: str) -> str:
-      """Crea un JWT firmado con HS256."""
-      header = {"alg": "HS256", "typ": "JWT"}
-      header_b64 = base64url_encode(json.dumps(header, separators=(',', ':')))
-      payload_b64 = base64url_encode(json.dumps(payload, separators=(',', ':')))
-
-      message = f"{header_b64}.{payload_b64}"
-      signature = hmac.new(
-          secret.encode('utf-8'),
-          message.encode('utf-8'),
-          hashlib.sha256
-      ).digest()
-      signature_b64 = base64url_encode(signature)
-
-      return f"{message}.{signature_b64}"
-
-  def generate_tokens():
-      """Genera los tokens de prueba."""
-      now = int(time.time())
-
-      tokens = {
-          "TOKEN_EXPIRED": {
-              "description": "Token expirado - debe dar 401",
-              "payload": {
-                  "sub": "test-user-expired",
-                  "iss": ISSUER,
-                  "iat": now - 7200,
-                  "exp": now - 3600  # Expiró hace 1 hora
-              }
-          },
-          "TOKEN_VALID_NO_GROUP": {
-              "description": "Token válido sin grupo smoke-testers - GET=200, POST=403",
-              "payload": {
-                  "sub": "test-user-no-group",
-                  "iss": ISSUER,
-                  "iat": now,
-                  "exp": now + 86400,  # Válido por 24h
-                  "groups": ["other-group"]
-              }
-          },
-          "TOKEN_VALID_SMOKE": {
-              "description": "Token válido con grupo smoke-testers - GET=200, POST=204",
-              "payload": {
-                  "sub": "test-user-smoke",
-                  "iss": ISSUER,
-                  "iat": now,
-                  "exp": now + 86400,  # Válido por 24h
-                  "groups": ["smoke-testers"]
-              }
-          },
-          "TOKEN_VALID_MULTI_GROUP": {
-              "description": "Token válido con múltiples grupos",
-              "payload": {
-                  "sub": "test-user-multi",
-                  "iss": ISSUER,
-                  "iat": now,
-                  "exp": now + 86400,
-                  "groups": ["smoke-testers", "admin", "developers"]
-              }
-          }
-      }
-
-      print(f"# JWT Tokens generados: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-      print(f"# Issuer: {ISSUER}")
-      print(f"# Secret: {SECRET}")
-      print()
-
-      for name, config in tokens.items():
-          token = create_jwt(config["payload"], SECRET)
-          print(f"# {config['description']}")
-          print(f'{name}="{token}"')
-          print()
-
-      # Ejemplo de uso con curl
-      print("# " + "=" * 60)
-      print("# EJEMPLOS DE USO")
-      print("# " + "=" * 60)
-      print("""
-  # Cargar tokens:
-  # source tokens.sh
-
-  # Test sin token:
-  # curl -s -o /dev/null -w "%{http_code}" https://hello-security.idp.poc.nullapps.io/smoke/
-
-  # Test con token:
-  # curl -s -o /dev/null -w "%{http_code}" -H "Authorization: Bearer $TOKEN_VALID_SMOKE" https://hello-security.idp.poc.nullapps.io/smoke/
-  """)
-
-  if __name__ == "__main__":
-      generate_tokens()
-
-  Guárdalo y ejecútalo:
-
-  python3 generate_jwt.py > tokens.sh
-  source tokens.sh
-
-  O si prefieres una versión más corta para ejecutar directamente:
-
-  python3 -c "
-  import json, base64, hmac, hashlib, time
-
-  def b64(d): return base64.urlsafe_b64encode(d if isinstance(d,bytes) else d.encode()).rstrip(b'=').decode()
-  def jwt(p, s='test-secret-key-for-smoke-testing'):
-      h = b64(json.dumps({'alg':'HS256','typ':'JWT'},separators=(',',':')))
-      p = b64(json.dumps(p,separators=(',',':')))
-      return f'{h}.{p}.{b64(hmac.new(s.encode(),(h+\".\"+p).encode(),hashlib.sha256).digest())}'
-
-  now = int(time.time())
-  print(f'TOKEN_EXPIRED=\"{jwt({\"sub\":\"expired\",\"iss\":\"https://testing.secure.istio.io\",\"iat\":now-7200,\"exp\":now-3600})}\"')
-  print(f'TOKEN_VALID_NO_GROUP=\"{jwt({\"sub\":\"no-group\",\"iss\":\"https://testing.secure.istio.io\",\"iat\":now,\"exp\":now+86400,\"groups\":[\"other-group\"]})}\"')
-  print(f'TOKEN_VALID_SMOKE=\"{jwt({\"sub\":\"smoke\",\"iss\":\"https://testing.secure.istio.io\",\"iat\":now,\"exp\":now+86400,\"groups\":[\"smoke-testers\"]})}\"')
-  "
+"""
+Generador de JWT para pruebas de seguridad AVP
 
+Uso:
+    python3 jwt.py > tokens.sh
+    source tokens.sh
+
+Modo bulk (tokens para pruebas de carga, uno por linea):
+    python3 jwt.py --bulk 200000 --subjects 5000 --context avp/example-json.json \\
+        --output tokens.jsonl --workers 4
+
+La poblacion de grupos sale de los roles de `routes[].policies` de un JSON
+estilo NP_CONTEXT (--context o la variable NP_CONTEXT), con el mismo nombre
+de grupo que usa avp/generate-cedars.py: {group_prefix}{rol}_{scope}.
+Los grupos van en cada claim de --group-claim: por defecto `groups` (entidades
+del authorizer y politicas de avp-smoke) y `custom:groups` (el claim que leen
+las politicas generadas y el permit index).
+"""
+
+import argparse
+import json
+import base64
+import hmac
+import hashlib
+import os
+import random
+import sys
+import time
+from datetime import datetime
+from multiprocessing import Pool
+
+# Configuración
+SECRET = "test-secret-key-for-smoke-testing"
+ISSUER = "https://testing.secure.istio.io"
+
+# Grupos cuando no hay NP_CONTEXT (los de las politicas de avp-smoke)
+DEFAULT_GROUPS = ["smoke-testers", "admin", "developers"]
+
+BULK_CHUNK_SIZE = 5000
+
+# Claims con los grupos en modo bulk (--group-claim los reemplaza)
+DEFAULT_GROUP_CLAIMS = ["groups", "custom:groups"]
+
+# json.dumps con separators crea un encoder por llamada; en bulk se reutiliza uno
+_compact_json = json.JSONEncoder(separators=(',', ':')).encode
+
+def base64url_encode(data: bytes | str) -> str:
+    """Codifica en base64url sin padding."""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('utf-8')
+
+def create_jwt(payload: dict, secret: str) -> str:
+    """Crea un JWT firmado con HS256."""
+    header = {"alg": "HS256", "typ": "JWT"}
+    header_b64 = base64url_encode(json.dumps(header, separators=(',', ':')))
+    payload_b64 = base64url_encode(json.dumps(payload, separators=(',', ':')))
+
+    message = f"{header_b64}.{payload_b64}"
+    signature = hmac.new(
+        secret.encode('utf-8'),
+        message.encode('utf-8'),
+        hashlib.sha256
+    ).digest()
+    signature_b64 = base64url_encode(signature)
+
+    return f"{message}.{signature_b64}"
+
+class TokenMinter:
+    """Firma tokens HS256 en serie: header codificado una vez y estado HMAC copiado."""
+
+    def __init__(self, secret: str):
+        header = {"alg": "HS256", "typ": "JWT"}
+        self._prefix = base64url_encode(json.dumps(header, separators=(',', ':'))) + "."
+        self._mac = hmac.new(secret.encode('utf-8'), digestmod=hashlib.sha256)
+
+    def mint(self, payload: dict) -> str:
+        message = self._prefix + base64url_encode(_compact_json(payload))
+        mac = self._mac.copy()
+        mac.update(message.encode('ascii'))
+        return f"{message}.{base64url_encode(mac.digest())}"
+
+def route_groups(context: dict) -> list:
+    """
+    Devuelve [(grupo, peso)] a partir de los roles de las rutas.
+
+    El peso es la cantidad de policies de rutas que mencionan el grupo, asi
+    los roles mas usados aparecen en mas tokens.
+    """
+    parameters = context.get('parameters', context)
+    group_prefix = parameters.get('cedar', {}).get('group_prefix', '')
+    weights = {}
+    for route in parameters.get('routes', []):
+        scope = route.get('scope', '')
+        for roles in route.get('policies', {}).values():
+            for role in roles:
+                group = f"{group_prefix}{role}_{scope}"
+                weights[group] = weights.get(group, 0) + 1
+    return sorted(weights.items())
+
+def load_population_groups(context_path: str | None) -> list:
+    """Grupos con peso desde --context, NP_CONTEXT o DEFAULT_GROUPS."""
+    if context_path:
+        with open(context_path) as f:
+            groups = route_groups(json.load(f))
+    elif os.environ.get('NP_CONTEXT'):
+        groups = route_groups(json.loads(os.environ['NP_CONTEXT']))
+    else:
+        groups = []
+    return groups or [(group, 1) for group in DEFAULT_GROUPS]
+
+# Estado por proceso del modo bulk (se inicializa en cada worker del pool)
+_bulk = {}
+
+def _init_bulk(config: dict):
+    _bulk.clear()
+    _bulk.update(config)
+    _bulk['minter'] = TokenMinter(config['secret'])
+    _bulk['subject_groups'] = {}
+
+def _subject_groups(subject_index: int) -> list:
+    """Grupos fijos por subject (deterministicos por seed, en cualquier worker)."""
+    groups = _bulk['subject_groups'].get(subject_index)
+    if groups is None:
+        rng = random.Random(f"{_bulk['seed']}:{subject_index}")
+        if rng.random() < _bulk['no_group_ratio']:
+            groups = ["other-group"]
+        else:
+            k = rng.randint(_bulk['min_groups'], _bulk['max_groups'])
+            names, weights = _bulk['groups']
+            groups = sorted(set(rng.choices(names, weights=weights, k=k)))
+        _bulk['subject_groups'][subject_index] = groups
+    return groups
+
+def _mint_chunk(bounds: tuple) -> str:
+    """Firma los tokens [start, end) y los devuelve como un bloque de lineas."""
+    start, end = bounds
+    minter = _bulk['minter']
+    now = _bulk['now']
+    rng = random.Random(f"{_bulk['seed']}:chunk:{start}")
+    jsonl = _bulk['format'] == 'jsonl'
+    lines = []
+    for index in range(start, end):
+        subject_index = index % _bulk['subjects']
+        subject = f"load-user-{subject_index}"
+        groups = _subject_groups(subject_index)
+        if rng.random() < _bulk['expired_ratio']:
+            exp = now - rng.randint(60, 3600)
+        else:
+            exp = now + rng.randint(_bulk['exp_min'], _bulk['exp_max'])
+        payload = {
+            "sub": subject,
+            "iss": _bulk['issuer'],
+            "iat": now,
+            "exp": exp,
+            "jti": f"{_bulk['seed']}-{index}"
+        }
+        for claim in _bulk['group_claims']:
+            payload[claim] = groups
+        token = minter.mint(payload)
+        if jsonl:
+            lines.append(_compact_json({"token": token, "sub": subject, "groups": groups, "exp": exp}))
+        else:
+            lines.append(token)
+    return "\n".join(lines) + "\n"
+
+def generate_bulk(args):
+    """Genera args.bulk tokens distintos y los escribe a args.output."""
+    population = load_population_groups(args.context)
+    config = {
+        'secret': args.secret,
+        'issuer': args.issuer,
+        'now': int(time.time()),
+        'seed': args.seed,
+        'subjects': max(1, min(args.subjects, args.bulk)),
+        'groups': ([g for g, _ in population], [w for _, w in population]),
+        'min_groups': args.min_groups,
+        'max_groups': max(args.min_groups, args.max_groups),
+        'no_group_ratio': args.no_group_ratio,
+        'expired_ratio': args.expired_ratio,
+        'exp_min': args.exp_min,
+        'exp_max': max(args.exp_min, args.exp_max),
+        'format': args.format,
+        'group_claims': args.group_claim or DEFAULT_GROUP_CLAIMS
+    }
+    chunks = [(start, min(start + BULK_CHUNK_SIZE, args.bulk)) for start in range(0, args.bulk, BULK_CHUNK_SIZE)]
+
+    started = time.perf_counter()
+    out = open(args.output, 'w') if args.output != '-' else sys.stdout
+    try:
+        if args.workers > 1:
+            with Pool(args.workers, initializer=_init_bulk, initargs=(config,)) as pool:
+                for block in pool.imap(_mint_chunk, chunks):
+                    out.write(block)
+        else:
+            _init_bulk(config)
+            for chunk in chunks:
+                out.write(_mint_chunk(chunk))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"{args.bulk} tokens ({config['subjects']} subjects, {len(population)} grupos) "
+          f"en {elapsed:.2f}s ({args.bulk / elapsed:.0f} tokens/s)", file=sys.stderr)
+
+def generate_tokens():
+    """Genera los tokens de prueba."""
+    now = int(time.time())
+
+    tokens = {
+        "TOKEN_EXPIRED": {
+            "description": "Token expirado - debe dar 401",
+            "payload": {
+                "sub": "test-user-expired",
+                "iss": ISSUER,
+                "iat": now - 7200,
+                "exp": now - 3600  # Expiró hace 1 hora
+            }
+        },
+        "TOKEN_VALID_NO_GROUP": {
+            "description": "Token válido sin grupo smoke-testers - GET=200, POST=403",
+            "payload": {
+                "sub": "test-user-no-group",
+                "iss": ISSUER,
+                "iat": now,
+                "exp": now + 86400,  # Válido por 24h
+                "groups": ["other-group"]
+            }
+        },
+        "TOKEN_VALID_SMOKE": {
+            "description": "Token válido con grupo smoke-testers - GET=200, POST=204",
+            "payload": {
+                "sub": "test-user-smoke",
+                "iss": ISSUER,
+                "iat": now,
+                "exp": now + 86400,  # Válido por 24h
+                "groups": ["smoke-testers"]
+            }
+        },
+        "TOKEN_VALID_MULTI_GROUP": {
+            "description": "Token válido con múltiples grupos",
+            "payload": {
+                "sub": "test-user-multi",
+                "iss": ISSUER,
+                "iat": now,
+                "exp": now + 86400,
+                "groups": ["smoke-testers", "admin", "developers"]
+            }
+        }
+    }
+
+    print(f"# JWT Tokens generados: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"# Issuer: {ISSUER}")
+    print(f"# Secret: {SECRET}")
+    print()
+
+    for name, config in tokens.items():
+        token = create_jwt(config["payload"], SECRET)
+        print(f"# {config['description']}")
+        print(f'{name}="{token}"')
+        print()
+
+    # Ejemplo de uso con curl
+    print("# " + "=" * 60)
+    print("# EJEMPLOS DE USO")
+    print("# " + "=" * 60)
+    print("""
+# Cargar tokens:
+# source tokens.sh
+
+# Test sin token:
+# curl -s -o /dev/null -w "%{http_code}" https://hello-security.idp.poc.nullapps.io/smoke/
+
+# Test con token:
+# curl -s -o /dev/null -w "%{http_code}" -H "Authorization: Bearer $TOKEN_VALID_SMOKE" https://hello-security.idp.poc.nullapps.io/smoke/
+""")
+
+def main():
+    parser = argparse.ArgumentParser(description="Generador de JWT para pruebas de seguridad AVP")
+    parser.add_argument('--bulk', type=int, metavar='N', help="generar N tokens para pruebas de carga")
+    parser.add_argument('--output', default='-', help="archivo de salida del modo bulk (default: stdout)")
+    parser.add_argument('--format', choices=['jsonl', 'lines'], default='jsonl',
+                        help="jsonl: {token, sub, groups, exp} por linea; lines: solo el token")
+    parser.add_argument('--subjects', type=int, default=1000, help="cantidad de usuarios distintos")
+    parser.add_argument('--context', help="JSON estilo NP_CONTEXT con routes (default: $NP_CONTEXT)")
+    parser.add_argument('--min-groups', type=int, default=1, help="grupos minimos por usuario")
+    parser.add_argument('--max-groups', type=int, default=3, help="grupos maximos por usuario")
+    parser.add_argument('--no-group-ratio', type=float, default=0.0,
+                        help="fraccion de usuarios sin grupos de las rutas (esperan 403)")
+    parser.add_argument('--expired-ratio', type=float, default=0.0,
+                        help="fraccion de tokens ya expirados (esperan 401)")
+    parser.add_argument('--exp-min', type=int, default=3600, help="exp minimo en segundos desde ahora")
+    parser.add_argument('--exp-max', type=int, default=86400, help="exp maximo en segundos desde ahora")
+    parser.add_argument('--group-claim', action='append', metavar='CLAIM',
+                        help="claim con los grupos, repetible (default: groups y custom:groups)")
+    parser.add_argument('--workers', type=int, default=1, help="procesos para firmar en paralelo")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--secret', default=SECRET)
+    parser.add_argument('--issuer', default=ISSUER)
+    args = parser.parse_args()
+
+    if args.bulk:
+        generate_bulk(args)
+    else:
+        generate_tokens()
+
+if __name__ == "__main__":
+    main()